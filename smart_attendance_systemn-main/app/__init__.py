@@ -18,6 +18,74 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or os.environ.get('SQLALCHEMY_DATABASE_URI') or "sqlite:///../instance/app.db"
     app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER')
+    # Search the whole school for faces that match nobody in the uploaded class
+    app.config['RECOGNITION_FALLBACK_TO_FULL_GALLERY'] = os.environ.get('RECOGNITION_FALLBACK_TO_FULL_GALLERY', 'false').lower() == 'true'
+    # Approximate (IVF) search for school-wide matching; build with `python -m app.ml.ann_index`
+    app.config['RECOGNITION_USE_ANN_INDEX'] = os.environ.get('RECOGNITION_USE_ANN_INDEX', 'false').lower() == 'true'
+    app.config['ANN_INDEX_PATH'] = os.environ.get('ANN_INDEX_PATH')
+    # In-memory gallery precision per worker: float32, float16 (half the memory) or int8 (a quarter)
+    app.config['GALLERY_PRECISION'] = os.environ.get('GALLERY_PRECISION', 'float32').lower()
+    # Face crops per Facenet forward pass
+    app.config['EMBEDDING_BATCH_SIZE'] = int(os.environ.get('EMBEDDING_BATCH_SIZE', 32))
+    # Sample lecture videos by time (frames per second of video) instead of every 5th frame
+    app.config['RECOGNITION_SAMPLE_FPS'] = float(os.environ['RECOGNITION_SAMPLE_FPS']) if os.environ.get('RECOGNITION_SAMPLE_FPS') else None
+    # Opt-in motion-adaptive sampling for recognition and registration: every MOTION_MIN_INTERVAL-th frame while
+    # the scene changes, backing off to every MOTION_MAX_INTERVAL-th while it is static; RECOGNITION_SAMPLE_FPS wins if set
+    app.config['MOTION_SAMPLING'] = os.environ.get('MOTION_SAMPLING', 'false').lower() == 'true'
+    app.config['MOTION_MIN_INTERVAL'] = int(os.environ.get('MOTION_MIN_INTERVAL', 2))
+    app.config['MOTION_MAX_INTERVAL'] = int(os.environ.get('MOTION_MAX_INTERVAL', 30))
+    # Fraction of pixels that must change between sampled frames for the scene to count as moving
+    app.config['MOTION_THRESHOLD'] = float(os.environ.get('MOTION_THRESHOLD', 0.005))
+    # Face detector backend: mtcnn, haar (OpenCV cascade) or yunet (OpenCV DNN, needs DETECTOR_MODEL_PATH)
+    app.config['DETECTOR_BACKEND'] = os.environ.get('DETECTOR_BACKEND', 'mtcnn').lower()
+    app.config['DETECTOR_MODEL_PATH'] = os.environ.get('DETECTOR_MODEL_PATH')
+    # Limit detection to each class's stored ROI polygon (see app.ml.roi); classes without one use the whole frame
+    app.config['RECOGNITION_USE_ROI'] = os.environ.get('RECOGNITION_USE_ROI', 'true').lower() == 'true'
+    # Detect on downscaled frames: a fixed scale, or one derived from the smallest face expected in the room (pixels)
+    app.config['DETECTION_SCALE'] = float(os.environ['DETECTION_SCALE']) if os.environ.get('DETECTION_SCALE') else None
+    app.config['DETECTION_MIN_FACE_SIZE'] = int(os.environ['DETECTION_MIN_FACE_SIZE']) if os.environ.get('DETECTION_MIN_FACE_SIZE') else None
+    # Opt-in: track faces across frames and embed only the best N crops per stretch of a track (0 embeds every detection)
+    app.config['RECOGNITION_CROPS_PER_TRACK'] = int(os.environ.get('RECOGNITION_CROPS_PER_TRACK', 0))
+    # Stop decoding once the whole class is recognised, or after this many seconds without a new student
+    app.config['RECOGNITION_EARLY_EXIT'] = os.environ.get('RECOGNITION_EARLY_EXIT', 'false').lower() == 'true'
+    app.config['RECOGNITION_IDLE_STOP_SECONDS'] = float(os.environ['RECOGNITION_IDLE_STOP_SECONDS']) if os.environ.get('RECOGNITION_IDLE_STOP_SECONDS') else None
+    # Run teacher video recognition as background jobs on a local thread pool
+    app.config['RECOGNITION_ASYNC'] = os.environ.get('RECOGNITION_ASYNC', 'true').lower() == 'true'
+    app.config['RECOGNITION_WORKERS'] = int(os.environ.get('RECOGNITION_WORKERS', 2))
+    # Pick up jobs left queued (or stuck running longer than the timeout) by a previous web process at startup.
+    # Opt-in so scripts that build the app (create_tables.py, the bulk CLIs) never take web users' jobs;
+    # when off, jobs older than the timeout are marked failed instead so their pages stop waiting.
+    app.config['RECOGNITION_RESUME_JOBS'] = os.environ.get('RECOGNITION_RESUME_JOBS', 'false').lower() == 'true'
+    app.config['RECOGNITION_JOB_TIMEOUT_MINUTES'] = float(os.environ.get('RECOGNITION_JOB_TIMEOUT_MINUTES', 60))
+    # Split each video into frame ranges processed by this many worker processes (1 = in-process)
+    app.config['RECOGNITION_SEGMENT_WORKERS'] = int(os.environ.get('RECOGNITION_SEGMENT_WORKERS', 1))
+    app.config['RECOGNITION_SEGMENT_FRAMES'] = int(os.environ.get('RECOGNITION_SEGMENT_FRAMES', 1800))
+    # Overlap decode/detect/embed on threads with bounded queues between them (0 detect threads = plain generator chain)
+    app.config['RECOGNITION_DETECT_THREADS'] = int(os.environ.get('RECOGNITION_DETECT_THREADS', 0))
+    app.config['RECOGNITION_EMBED_THREADS'] = int(os.environ.get('RECOGNITION_EMBED_THREADS', 1))
+    app.config['RECOGNITION_STAGE_QUEUE_SIZE'] = int(os.environ.get('RECOGNITION_STAGE_QUEUE_SIZE', 8))
+    # Opt-in: collapse video embeddings into per-person clusters at this cosine similarity (e.g. 0.75) before matching (0 = off)
+    app.config['RECOGNITION_CLUSTER_SIMILARITY'] = float(os.environ.get('RECOGNITION_CLUSTER_SIMILARITY', 0))
+    # Opt-in: skip low-confidence, tiny, side-on or blurred face crops before embedding (tune the thresholds per camera)
+    app.config['FACE_QUALITY_GATE'] = os.environ.get('FACE_QUALITY_GATE', 'false').lower() == 'true'
+    app.config['FACE_MIN_CONFIDENCE'] = float(os.environ.get('FACE_MIN_CONFIDENCE', 0.9))
+    app.config['FACE_MIN_SIZE'] = int(os.environ.get('FACE_MIN_SIZE', 24))
+    app.config['FACE_MAX_YAW'] = float(os.environ.get('FACE_MAX_YAW', 0.4))
+    app.config['FACE_MIN_SHARPNESS'] = float(os.environ.get('FACE_MIN_SHARPNESS', 15))
+    # Stop reading a registration video once the mean embedding moves less than this (cosine distance) per batch
+    app.config['REGISTRATION_CONVERGENCE_TOLERANCE'] = float(os.environ['REGISTRATION_CONVERGENCE_TOLERANCE']) if os.environ.get('REGISTRATION_CONVERGENCE_TOLERANCE') else 1e-4
+    app.config['REGISTRATION_MIN_FACES'] = int(os.environ.get('REGISTRATION_MIN_FACES', 20))
+    # Reuse recognition results for re-uploaded videos; cache size budget on local disk (0 = off)
+    app.config['RECOGNITION_CACHE_DIR'] = os.environ.get('RECOGNITION_CACHE_DIR')
+    app.config['RECOGNITION_CACHE_MAX_MB'] = float(os.environ.get('RECOGNITION_CACHE_MAX_MB', 1024))
+    # Per-face rows held for the cache and artifacts per video (about 0.6 KB each); longer videos are not stored
+    app.config['RECOGNITION_MAX_STORED_FACES'] = int(os.environ.get('RECOGNITION_MAX_STORED_FACES', 50000))
+    # Keep each processed video's embeddings so matching can be re-run at other thresholds (opt-in); they share
+    # the RECOGNITION_CACHE_MAX_MB budget and are evicted with cache entries, and are not evicted when the cache is off
+    app.config['SAVE_VIDEO_ARTIFACTS'] = os.environ.get('SAVE_VIDEO_ARTIFACTS', 'false').lower() == 'true'
+    app.config['VIDEO_ARTIFACTS_DIR'] = os.environ.get('VIDEO_ARTIFACTS_DIR')
+    # Load and warm MTCNN/Facenet at startup instead of on the first upload
+    app.config['PRELOAD_ML_MODELS'] = os.environ.get('PRELOAD_ML_MODELS', 'false').lower() == 'true'
     
     # ⏳ Session timeout: 5 minutes of inactivity
     app.permanent_session_lifetime = timedelta(minutes=5)
@@ -48,4 +116,16 @@ def create_app():
     app.register_blueprint(teacher_bp)
     app.register_blueprint(student_bp)
 
+    if app.config['RECOGNITION_ASYNC']:
+        from app.ml.jobs import resume_queued_jobs, fail_stale_jobs
+        if app.config['RECOGNITION_RESUME_JOBS']:
+            resume_queued_jobs(app)
+        else:
+            fail_stale_jobs(app)
+
+    if app.config['PRELOAD_ML_MODELS']:
+        from app.ml import recognise, register  # noqa: F401 -- so upload handlers find them loaded
+        from app.ml.model_registry import warm_up
+        warm_up(app.config['DETECTOR_BACKEND'], app.config['DETECTOR_MODEL_PATH'])
+
     return app
@@ -0,0 +1,290 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.ml.matcher import MatchResult, normalize_rows, EMBEDDING_DIM
+
+INDEX_FILENAME = 'embeddings_ivf.npz'
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over normalised Facenet
+    embeddings. Vectors are bucketed by their nearest k-means centroid and a
+    query only scores the members of its nprobe closest buckets. It exposes the
+    same search/match interface as GalleryMatcher.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = normalize_rows(centroids)
+        self.nprobe = nprobe
+        self.student_ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int64)
+        self._lists = None
+
+    @classmethod
+    def train(cls, student_ids, embeddings, n_lists: int | None = None, nprobe: int = 8,
+              n_iter: int = 20, seed: int = 0) -> "IVFIndex":
+        """
+        Runs spherical k-means over the gallery and indexes every row.
+        n_lists defaults to about sqrt(N), the usual IVF trade-off.
+        """
+        vectors = normalize_rows(embeddings) if len(embeddings) else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(vectors))))
+        n_lists = max(1, min(n_lists, len(vectors))) if len(vectors) else 1
+
+        rng = np.random.default_rng(seed)
+        if len(vectors):
+            centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+        else:
+            centroids = normalize_rows(rng.normal(size=(1, EMBEDDING_DIM)))
+
+        for _ in range(n_iter if len(vectors) else 0):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = vectors[assignments == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+
+        index = cls(centroids, nprobe=nprobe)
+        index.add(student_ids, vectors)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def add(self, student_ids, embeddings) -> None:
+        """
+        Inserts or replaces rows for the given student ids.
+        """
+        student_ids = np.asarray(student_ids, dtype=np.int64).reshape(-1)
+        if not len(student_ids):
+            return
+        vectors = normalize_rows(embeddings).reshape(len(student_ids), EMBEDDING_DIM)
+
+        keep = ~np.isin(self.student_ids, student_ids)
+        self.student_ids = np.concatenate([self.student_ids[keep], student_ids])
+        self.vectors = np.vstack([self.vectors[keep], vectors])
+        self.assignments = np.concatenate([self.assignments[keep], self._assign(vectors)])
+        self._lists = None
+
+    def remove(self, student_ids) -> None:
+        keep = ~np.isin(self.student_ids, np.asarray(student_ids, dtype=np.int64).reshape(-1))
+        self.student_ids = self.student_ids[keep]
+        self.vectors = self.vectors[keep]
+        self.assignments = self.assignments[keep]
+        self._lists = None
+
+    def _inverted_lists(self) -> list:
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def search(self, queries, top_k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (ids, scores), each of shape (n_queries, top_k), sorted by descending similarity.
+        """
+        queries = normalize_rows(queries) if len(queries) else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        top_k = max(1, top_k)
+        out_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        if not len(queries) or not len(self):
+            return out_ids, out_scores
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        # Score bucket by bucket so each member block is touched once per batch.
+        for list_id, members in enumerate(self._inverted_lists()):
+            if not len(members):
+                continue
+            rows = np.flatnonzero((probes == list_id).any(axis=1))
+            if not len(rows):
+                continue
+
+            scores = queries[rows] @ self.vectors[members].T
+            merged_scores = np.hstack([out_scores[rows], scores])
+            merged_ids = np.hstack([out_ids[rows], np.broadcast_to(self.student_ids[members], scores.shape)])
+            best = np.argsort(-merged_scores, axis=1, kind='stable')[:, :top_k]
+            out_scores[rows] = np.take_along_axis(merged_scores, best, axis=1)
+            out_ids[rows] = np.take_along_axis(merged_ids, best, axis=1)
+
+        return out_ids, out_scores
+
+    def match(self, queries, top_k: int = 1) -> MatchResult:
+        ids, scores = self.search(queries, top_k=top_k)
+        return MatchResult(top_k_ids=ids, top_k_scores=scores)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index atomically so other workers never read a half-written file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as handle:
+            np.savez(handle, centroids=self.centroids, student_ids=self.student_ids,
+                     vectors=self.vectors, assignments=self.assignments, nprobe=self.nprobe)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(data['centroids'], nprobe=int(data['nprobe']))
+            index.student_ids = data['student_ids']
+            index.vectors = data['vectors']
+            index.assignments = data['assignments']
+        return index
+
+
+def recall_against_exact(index, exact_matcher, queries, top_k: int = 1) -> float:
+    """
+    Fraction of the exact top-k neighbours that the approximate index also returns.
+    """
+    approx_ids, _ = index.search(queries, top_k=top_k)
+    exact_ids, _ = exact_matcher.search(queries, top_k=top_k)
+    hits = total = 0
+    for approx_row, exact_row in zip(approx_ids, exact_ids):
+        expected = set(exact_row[exact_row >= 0].tolist())
+        hits += len(expected & set(approx_row.tolist()))
+        total += len(expected)
+    return hits / total if total else 1.0
+
+
+def data_directory() -> str:
+    """
+    Where derived ML files live: next to the SQLite database, or the instance folder for other databases.
+    """
+    database = db.engine.url.database
+    if db.engine.url.get_backend_name() == 'sqlite' and database and database != ':memory:':
+        return os.path.dirname(os.path.abspath(database))
+    return current_app.instance_path
+
+
+def default_index_path() -> str:
+    """
+    ANN_INDEX_PATH if configured, otherwise a file in data_directory().
+    """
+    return current_app.config.get('ANN_INDEX_PATH') or os.path.join(data_directory(), INDEX_FILENAME)
+
+
+_loaded = {'path': None, 'mtime': None, 'index': None}
+_index_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """
+    Exclusive lock on a sidecar file, held across workers. Without fcntl (Windows)
+    only writers within this process are serialised.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def load_persisted_index(path: str | None = None) -> IVFIndex | None:
+    """
+    Returns the on-disk index, re-reading it only when another worker has rewritten it.
+    The returned object is never modified afterwards; updates publish a new one.
+    """
+    path = path or default_index_path()
+    with _index_lock:
+        if not os.path.exists(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        if _loaded['path'] != path or _loaded['mtime'] != mtime:
+            _loaded.update(path=path, mtime=mtime, index=IVFIndex.load(path))
+        return _loaded['index']
+
+
+def build_persisted_index(n_lists: int | None = None, nprobe: int = 8, path: str | None = None) -> IVFIndex:
+    """
+    Trains an index over the current gallery, saves it, and reports recall@1
+    against exact search using lightly perturbed gallery rows as probe queries.
+    """
+    from app.ml.gallery import get_gallery
+
+    gallery = get_gallery()
+    vectors = gallery.float_matrix()
+    index = IVFIndex.train(gallery.student_ids, vectors, n_lists=n_lists, nprobe=nprobe)
+    path = path or default_index_path()
+    with _file_lock(path):
+        index.save(path)
+
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(gallery), min(len(gallery), 1000), replace=False)] if len(gallery) else vectors
+    probes = normalize_rows(sample) + rng.normal(scale=0.05, size=sample.shape).astype(np.float32)
+    recall = recall_against_exact(index, gallery.matcher(), probes)
+    print(f"[INFO] Built IVF index: {len(index)} vectors, {len(index.centroids)} lists, nprobe={nprobe}, recall@1={recall:.3f}")
+    return index
+
+
+def _apply_to_persisted_index(change) -> None:
+    """
+    Read-modify-write of the on-disk index, if one exists. The index is re-read from disk
+    under an exclusive file lock, so concurrent writers in other workers never drop each
+    other's updates, and change(index) runs on that private copy. The copy is published only
+    once saved, so readers keep searching whichever complete version they already hold.
+    """
+    path = default_index_path()
+    if not os.path.exists(path):
+        return
+    with _index_lock, _file_lock(path):
+        if not os.path.exists(path):
+            return
+        index = IVFIndex.load(path)
+        change(index)
+        index.save(path)
+        _loaded.update(path=path, mtime=os.stat(path).st_mtime_ns, index=index)
+
+
+def add_to_persisted_index(student_ids: list, embeddings: np.ndarray) -> None:
+    """
+    Applies a batch of registrations to the on-disk index, if one exists, with a single load and save.
+    """
+    if not len(student_ids):
+        return
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(student_ids), -1)
+    _apply_to_persisted_index(lambda index: index.add(list(student_ids), vectors))
+
+
+def update_persisted_index(student_id: int, embedding: np.ndarray | None) -> None:
+    """
+    Applies one registration (or deletion, when embedding is None) to the on-disk index, if one exists.
+    """
+    if embedding is None:
+        _apply_to_persisted_index(lambda index: index.remove([student_id]))
+    else:
+        add_to_persisted_index([student_id], np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    with create_app().app_context():
+        build_persisted_index()
@@ -0,0 +1,119 @@
+"""
+Per-video embedding artifacts.
+
+With SAVE_VIDEO_ARTIFACTS on, each processed video leaves an uncompressed .npz
+with its face embeddings, boxes, frame indices and detector scores, named by the
+video's content hash. Matching can then be re-run from the artifact against the
+current gallery with any threshold, without decoding or embedding the video
+again. Artifacts share the recognition cache's size budget and are evicted
+least recently used first.
+
+Usage:
+    python -m app.ml.artifacts <content_hash or path.npz> [--class-id 3] [--thresholds 0.5 0.6 0.7]
+"""
+import argparse
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.ml.matcher import EMBEDDING_DIM
+
+ARTIFACTS_DIRNAME = 'video_artifacts'
+
+
+@dataclass
+class VideoArtifact:
+    embeddings: np.ndarray       # (n, 128) float32
+    frame_indices: np.ndarray    # (n,) int64
+    boxes: np.ndarray            # (n, 4) int64, (x, y, width, height)
+    confidences: np.ndarray      # (n,) float32 detector scores
+    meta: dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the artifact atomically; arrays are stored uncompressed so loading is a plain read.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as handle:
+            np.savez(handle, embeddings=self.embeddings, frame_indices=self.frame_indices, boxes=self.boxes,
+                     confidences=self.confidences, meta=np.array(json.dumps(self.meta)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VideoArtifact":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                embeddings=data['embeddings'],
+                frame_indices=data['frame_indices'],
+                boxes=data['boxes'],
+                confidences=data['confidences'],
+                meta=json.loads(str(data['meta'])),
+            )
+
+    @classmethod
+    def from_faces(cls, embeddings: list, frame_indices: list, boxes: list, confidences: list,
+                   meta: dict | None = None) -> "VideoArtifact":
+        """
+        Builds an artifact from per-batch embedding arrays and per-face lists.
+        """
+        return cls(
+            embeddings=np.vstack(embeddings).astype(np.float32) if embeddings else np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+            frame_indices=np.asarray(frame_indices, dtype=np.int64),
+            boxes=np.asarray(boxes, dtype=np.int64).reshape(-1, 4),
+            confidences=np.asarray(confidences, dtype=np.float32),
+            meta=meta or {},
+        )
+
+
+def artifacts_directory() -> str:
+    """
+    VIDEO_ARTIFACTS_DIR if configured, otherwise a folder in the ML data directory. Needs an app context.
+    """
+    from flask import current_app
+    from app.ml.ann_index import data_directory
+
+    return current_app.config.get('VIDEO_ARTIFACTS_DIR') or os.path.join(data_directory(), ARTIFACTS_DIRNAME)
+
+
+def artifact_path(content_hash: str) -> str:
+    return os.path.join(artifacts_directory(), f"{content_hash}.npz")
+
+
+def load_artifact(content_hash_or_path: str) -> VideoArtifact | None:
+    path = content_hash_or_path if content_hash_or_path.endswith('.npz') else artifact_path(content_hash_or_path)
+    if not os.path.exists(path):
+        return None
+    artifact = VideoArtifact.load(path)
+    os.utime(path)  # keeps recently rematched artifacts out of eviction
+    return artifact
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('artifact', help='content hash of a processed video, or a path to its .npz')
+    parser.add_argument('--class-id', type=int, default=None)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.5, 0.55, 0.6, 0.65, 0.7])
+    parser.add_argument('--cluster-similarity', type=float, default=None)
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.ml.recognise import rematch_artifact
+
+    with create_app().app_context():
+        artifact = load_artifact(args.artifact)
+        if artifact is None:
+            raise SystemExit(f"[ERROR] No artifact found for {args.artifact}")
+        print(f"[INFO] {len(artifact)} faces from {artifact.meta.get('frames_processed', '?')} frames")
+        print(f"{'threshold':>10} {'students':>9}")
+        for threshold in args.thresholds:
+            result = rematch_artifact(artifact, class_id=args.class_id, similarity_threshold=threshold,
+                                      cluster_similarity=args.cluster_similarity)
+            print(f"{threshold:>10.2f} {len(result.recognized):>9}  {sorted(result.recognized)}")
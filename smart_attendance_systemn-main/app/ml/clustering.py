@@ -0,0 +1,80 @@
+"""
+Online greedy leader clustering of face embeddings on cosine similarity.
+
+A lecture video yields thousands of embeddings but only as many people as
+are in the room. Collapsing embeddings into per-person centroids before
+matching makes gallery search scale with the number of people rather than
+the number of detections.
+"""
+import numpy as np
+
+from app.ml.matcher import EMBEDDING_DIM, normalize_rows
+
+
+class LeaderClusters:
+    """
+    Each embedding joins the most similar existing cluster if its cosine similarity
+    to that cluster's centroid reaches similarity_threshold, otherwise it starts a
+    new cluster. Centroids are the normalised sum of their members' unit vectors.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.75, dim: int = EMBEDDING_DIM):
+        self.similarity_threshold = similarity_threshold
+        self._sums = np.zeros((16, dim), dtype=np.float32)
+        self._centroids = np.zeros((16, dim), dtype=np.float32)
+        self._sizes = np.zeros(16, dtype=np.int64)
+        self._count = 0
+        self._changed = set()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def centroids(self) -> np.ndarray:
+        return self._centroids[:self._count]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self._sizes[:self._count]
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._sizes)
+        for name in ('_sums', '_centroids', '_sizes'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, embeddings) -> np.ndarray:
+        """
+        Assigns each row of embeddings to a cluster and returns the cluster index per row.
+        """
+        vectors = normalize_rows(embeddings)
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for row, vector in enumerate(vectors):
+            cluster = -1
+            if self._count:
+                similarities = self.centroids @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    cluster = best
+            if cluster < 0:
+                if self._count == len(self._sizes):
+                    self._grow()
+                cluster = self._count
+                self._count += 1
+
+            self._sums[cluster] += vector
+            self._sizes[cluster] += 1
+            self._centroids[cluster] = normalize_rows(self._sums[cluster])[0]
+            self._changed.add(cluster)
+            assignments[row] = cluster
+        return assignments
+
+    def pop_changed(self) -> np.ndarray:
+        """
+        Indices of clusters created or updated since the last call, in ascending order.
+        """
+        changed = np.fromiter(sorted(self._changed), dtype=np.int64, count=len(self._changed))
+        self._changed.clear()
+        return changed
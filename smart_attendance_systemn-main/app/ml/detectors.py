@@ -0,0 +1,134 @@
+"""
+Face detector backends behind MTCNN's interface.
+
+Every backend exposes detect_faces(frame) returning a list of
+{'box': [x, y, w, h], 'confidence': float, 'keypoints': {...}} dicts, so the
+pipeline, quality gate and tracker work unchanged whichever one is used.
+
+    mtcnn  -- MTCNN (TensorFlow); most accurate, slowest on CPU; one shared model, calls serialised
+    haar   -- OpenCV's frontal-face Haar cascade, shipped inside OpenCV 4 builds (gone in 5); no keypoints or scores
+    yunet  -- OpenCV's YuNet CNN (cv2.FaceDetectorYN); needs the .onnx model file,
+              e.g. face_detection_yunet_2023mar.onnx from the OpenCV model zoo
+"""
+import importlib.util
+import threading
+
+import cv2
+import numpy as np
+
+DETECTOR_BACKENDS = ('mtcnn', 'haar', 'yunet')
+DETECTOR_LABELS = {'mtcnn': 'MTCNN (most accurate)', 'haar': 'OpenCV Haar cascade', 'yunet': 'OpenCV YuNet'}
+
+
+class MTCNNDetector:
+    """
+    MTCNN shared by every thread in the process. Its Keras models are too costly to
+    build per thread and are not safe to call concurrently, so calls take a lock.
+    """
+
+    def __init__(self):
+        from mtcnn import MTCNN
+        self._model = MTCNN()
+        self._lock = threading.Lock()
+
+    def detect_faces(self, frame: np.ndarray) -> list:
+        with self._lock:
+            return self._model.detect_faces(frame)
+
+
+class HaarDetector:
+    """
+    Frontal-face Haar cascade. Cascades give no calibrated score, so every face gets
+    confidence 1.0 and no keypoints. One classifier per thread, as OpenCV's is not thread-safe.
+    """
+
+    def __init__(self, model_path: str | None = None, min_size: int = 20):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise RuntimeError("This OpenCV build has no Haar cascades (removed in OpenCV 5); use yunet instead")
+        self.model_path = model_path or cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        self.min_size = min_size
+        self._local = threading.local()
+
+    def _classifier(self):
+        classifier = getattr(self._local, 'classifier', None)
+        if classifier is None:
+            classifier = cv2.CascadeClassifier(self.model_path)
+            if classifier.empty():
+                raise RuntimeError(f"Could not load Haar cascade from {self.model_path}")
+            self._local.classifier = classifier
+        return classifier
+
+    def detect_faces(self, frame: np.ndarray) -> list:
+        grey = cv2.equalizeHist(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        boxes = self._classifier().detectMultiScale(grey, scaleFactor=1.1, minNeighbors=5,
+                                                    minSize=(self.min_size, self.min_size))
+        return [{'box': [int(x), int(y), int(w), int(h)], 'confidence': 1.0, 'keypoints': {}}
+                for x, y, w, h in boxes]
+
+
+class YuNetDetector:
+    """
+    OpenCV's YuNet face detector. Returns scores and five landmarks, mapped to
+    MTCNN's keypoint names (image-left eye is 'left_eye'). One model per thread.
+    """
+
+    def __init__(self, model_path: str | None, score_threshold: float = 0.6):
+        if not model_path:
+            raise ValueError("The yunet detector needs DETECTOR_MODEL_PATH pointing at the YuNet .onnx file")
+        self.model_path = model_path
+        self.score_threshold = score_threshold
+        self._local = threading.local()
+
+    def _model(self, width: int, height: int):
+        model = getattr(self._local, 'model', None)
+        if model is None:
+            model = cv2.FaceDetectorYN.create(self.model_path, "", (width, height), self.score_threshold)
+            self._local.model = model
+        model.setInputSize((width, height))
+        return model
+
+    def detect_faces(self, frame: np.ndarray) -> list:
+        height, width = frame.shape[:2]
+        _, faces = self._model(width, height).detect(frame)
+        if faces is None:
+            return []
+        results = []
+        for face in faces:
+            x, y, w, h = (int(round(value)) for value in face[:4])
+            points = [(int(round(face[i])), int(round(face[i + 1]))) for i in range(4, 14, 2)]
+            results.append({
+                'box': [x, y, w, h],
+                'confidence': float(face[14]),
+                # YuNet order: subject's right eye, left eye, nose, right and left mouth corners.
+                'keypoints': {
+                    'left_eye': points[0], 'right_eye': points[1], 'nose': points[2],
+                    'mouth_left': points[3], 'mouth_right': points[4],
+                },
+            })
+        return results
+
+
+def build_detector(backend: str = 'mtcnn', model_path: str | None = None):
+    if backend == 'mtcnn':
+        return MTCNNDetector()
+    if backend == 'haar':
+        return HaarDetector(model_path)
+    if backend == 'yunet':
+        return YuNetDetector(model_path)
+    raise ValueError(f"Unknown detector backend {backend!r}; expected one of {DETECTOR_BACKENDS}")
+
+
+def available_backends(config) -> list:
+    """
+    Backends that can run here: mtcnn when the package is installed, haar when this
+    OpenCV build still has cascades, and yunet only when it is the configured backend,
+    since DETECTOR_MODEL_PATH is the only way to give it its model file.
+    """
+    backends = []
+    if importlib.util.find_spec('mtcnn') is not None:
+        backends.append('mtcnn')
+    if hasattr(cv2, 'CascadeClassifier'):
+        backends.append('haar')
+    if config['DETECTOR_BACKEND'] == 'yunet' and config['DETECTOR_MODEL_PATH'] and hasattr(cv2, 'FaceDetectorYN'):
+        backends.append('yunet')
+    return backends
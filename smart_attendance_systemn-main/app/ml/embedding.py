@@ -0,0 +1,81 @@
+import threading
+
+import cv2
+import numpy as np
+
+from app.ml.model_registry import get_embedder
+
+FACENET_INPUT_SIZE = (160, 160)
+DEFAULT_BATCH_SIZE = 32
+# Bumped whenever preprocessing or the model changes what a face embeds to; embeddings
+# from different versions do not compare reliably. Version 1 was DeepFace.represent on
+# RGB crops (its own detection pass on each crop, channels swapped twice), which
+# registrations used before preprocess_face. Rows with no recorded version are
+# version 1 and should be re-enrolled with `python bulk_enroll.py <folder> --outdated-only`.
+EMBEDDING_VERSION = 2
+
+# The Facenet model is shared by every thread in the process and Keras predict is not thread-safe.
+_predict_lock = threading.Lock()
+
+
+def preprocess_face(face_image: np.ndarray, target_size: tuple = FACENET_INPUT_SIZE) -> np.ndarray | None:
+    """
+    Resizes a BGR face crop to the Facenet input the way DeepFace does
+    (aspect-preserving resize, zero padding, RGB, scaled to [0, 1]).
+    Returns None for empty crops.
+    """
+    if face_image is None or face_image.size == 0 or min(face_image.shape[:2]) == 0:
+        return None
+
+    img = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+    factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+    dsize = (max(1, int(img.shape[1] * factor)), max(1, int(img.shape[0] * factor)))
+    img = cv2.resize(img, dsize)
+
+    diff_0 = target_size[0] - img.shape[0]
+    diff_1 = target_size[1] - img.shape[1]
+    img = np.pad(
+        img,
+        ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+        "constant",
+    )
+    if img.shape[:2] != target_size:
+        img = cv2.resize(img, (target_size[1], target_size[0]))
+
+    return img.astype(np.float32) / 255.0
+
+
+def generate_face_embeddings(face_images: list, batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Embeds face crops with Facenet, batch_size crops per forward pass.
+    Returns one entry per input crop: a 128-d array, or None if the crop could not be embedded.
+    """
+    embeddings = [None] * len(face_images)
+    if not face_images:
+        return embeddings
+
+    model = get_embedder()
+    batch_size = max(1, batch_size)
+
+    for start in range(0, len(face_images), batch_size):
+        positions, tensors = [], []
+        for offset, face_image in enumerate(face_images[start:start + batch_size]):
+            tensor = preprocess_face(face_image)
+            if tensor is not None:
+                positions.append(start + offset)
+                tensors.append(tensor)
+
+        if not tensors:
+            continue
+
+        try:
+            with _predict_lock:
+                batch_output = np.asarray(model.predict_on_batch(np.stack(tensors)))
+        except Exception as error:
+            print(f"[ERROR] Failed to embed batch of {len(tensors)} faces: {error}")
+            continue
+
+        for position, embedding in zip(positions, batch_output):
+            embeddings[position] = embedding.astype(np.float32)
+
+    return embeddings
@@ -0,0 +1,206 @@
+import threading
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models import Student, StudentEmbedding, EmbeddingChange, StudentEmbeddingVersion
+from app.ml.embedding import EMBEDDING_VERSION
+from app.ml.matcher import GalleryMatcher, CompactGalleryMatcher, EMBEDDING_DIM, encode_rows, decode_rows
+
+
+def record_embedding_change(student_id: int) -> None:
+    """
+    Appends a change-log entry for a student's embedding. The caller commits it
+    together with the embedding write or delete, which bumps the gallery generation.
+    """
+    db.session.add(EmbeddingChange(student_id=student_id))
+
+
+def record_embedding_version(student_id: int, version: int = EMBEDDING_VERSION) -> None:
+    """
+    Notes which embedding pipeline produced a student's stored embedding. The caller commits.
+    """
+    db.session.merge(StudentEmbeddingVersion(student_id=student_id, version=version))
+
+
+def outdated_student_ids() -> list:
+    """
+    Students whose stored embedding predates EMBEDDING_VERSION (or has no recorded version),
+    so it does not compare reliably with embeddings of new video faces.
+    """
+    return [
+        student_id for (student_id,) in
+        db.session.query(StudentEmbedding.student_id)
+        .outerjoin(StudentEmbeddingVersion, StudentEmbeddingVersion.student_id == StudentEmbedding.student_id)
+        .filter(func.coalesce(StudentEmbeddingVersion.version, 1) < EMBEDDING_VERSION)
+        .order_by(StudentEmbedding.student_id)
+    ]
+
+
+def current_generation() -> int:
+    """
+    Returns the latest change id, used as the gallery version across workers.
+    """
+    return db.session.query(func.max(EmbeddingChange.change_id)).scalar() or 0
+
+
+def load_gallery_rows(student_ids: list | None = None) -> tuple[list, list, list]:
+    """
+    Reads stored embeddings straight from the database, bypassing the cached gallery:
+    (student_ids, class_ids, float32 rows), for every student or only those in student_ids.
+    Rows with the wrong shape are skipped with a warning.
+    """
+    query = (
+        db.session.query(StudentEmbedding.student_id, StudentEmbedding.embedding, Student.class_id)
+        .join(Student, Student.student_id == StudentEmbedding.student_id)
+    )
+    if student_ids is not None:
+        query = query.filter(StudentEmbedding.student_id.in_(student_ids))
+
+    ids, class_ids, rows = [], [], []
+    for record in query.all():
+        embedding_array = np.frombuffer(record.embedding, dtype=np.float32)
+
+        if embedding_array.shape != (EMBEDDING_DIM,):
+            print(f"[WARNING] Embedding for student ID {record.student_id} has invalid shape: {embedding_array.shape}")
+            continue
+
+        ids.append(record.student_id)
+        class_ids.append(record.class_id)
+        rows.append(embedding_array)
+    return ids, class_ids, rows
+
+
+class EmbeddingGallery:
+    """
+    Process-wide in-memory copy of the student_embeddings table. The first
+    refresh loads every row; later refreshes read only the rows named in
+    embedding_changes since the cached generation. Rows carry the student's
+    class_id so matching can be restricted to one class shard. With a float16
+    or int8 precision, rows are held normalised in that compact form (see
+    matcher.encode_rows) and matched without widening the whole gallery.
+    """
+
+    def __init__(self):
+        self.student_ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.precision = 'float32'
+        self.generation = None
+        self._matcher = None
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def refresh(self, precision: str = 'float32') -> None:
+        """
+        Brings the cache up to date with the database generation. Changing the
+        precision forces a full reload.
+        """
+        with self._lock:
+            latest = current_generation()
+            if self.generation == latest and self.precision == precision:
+                return
+
+            if self.generation is None or self.precision != precision:
+                self.precision = precision
+                self._full_load()
+            else:
+                self._apply_changes(self.generation)
+
+            self.generation = latest
+            self._matcher = None
+            self._shards = {}
+
+    def _full_load(self) -> None:
+        student_ids, class_ids, rows = load_gallery_rows()
+        data, scales = self._encode(rows)
+        self._replace(np.asarray(student_ids, dtype=np.int64), np.asarray(class_ids, dtype=np.int64), data, scales)
+        print(f"[INFO] Loaded {len(self)} student embeddings ({self.precision}, {self.matrix.nbytes // 1024} KiB).")
+        outdated = outdated_student_ids()
+        if outdated:
+            print(f"[WARNING] {len(outdated)} student embeddings predate embedding version {EMBEDDING_VERSION} and may "
+                  f"not be recognised; re-enroll them with bulk_enroll.py --outdated-only")
+
+    def _apply_changes(self, since: int) -> None:
+        changed_ids = [
+            row.student_id for row in
+            db.session.query(EmbeddingChange.student_id)
+            .filter(EmbeddingChange.change_id > since)
+            .distinct()
+        ]
+        student_ids, class_ids, rows = load_gallery_rows(changed_ids)
+
+        keep = ~np.isin(self.student_ids, changed_ids)
+        data, scales = self._encode(rows)
+        self._replace(
+            np.concatenate([self.student_ids[keep], np.asarray(student_ids, dtype=np.int64)]),
+            np.concatenate([self.class_ids[keep], np.asarray(class_ids, dtype=np.int64)]),
+            np.concatenate([self.matrix[keep], data]),
+            np.concatenate([self.scales[keep], scales]),
+        )
+        print(f"[INFO] Reloaded {len(changed_ids)} changed embeddings ({len(self)} total).")
+
+    def _encode(self, rows: list) -> tuple[np.ndarray, np.ndarray]:
+        matrix = np.vstack(rows) if rows else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return encode_rows(matrix, self.precision)
+
+    def _replace(self, student_ids: np.ndarray, class_ids: np.ndarray, data: np.ndarray, scales: np.ndarray) -> None:
+        self.student_ids = student_ids
+        self.class_ids = class_ids
+        self.matrix = data
+        self.scales = scales
+
+    def _build_matcher(self, rows) -> GalleryMatcher:
+        if self.precision == 'float32':
+            return GalleryMatcher(self.student_ids[rows], self.matrix[rows])
+        return CompactGalleryMatcher(self.student_ids[rows], self.matrix[rows], self.scales[rows])
+
+    def float_matrix(self) -> np.ndarray:
+        """
+        The cached rows as float32 (normalised unless the precision is float32).
+        """
+        with self._lock:
+            return self._float_matrix()
+
+    def _float_matrix(self) -> np.ndarray:
+        return self.matrix if self.precision == 'float32' else decode_rows(self.matrix, self.scales)
+
+    def matcher(self, class_id: int | None = None) -> GalleryMatcher:
+        """
+        Returns a GalleryMatcher over the cached rows, or over one class shard when
+        class_id is given. Matchers are rebuilt only when the generation changes.
+        Built under the same lock as refresh(), so a matcher never mixes ids and rows
+        from two generations and no shard from an old generation outlives a refresh.
+        """
+        with self._lock:
+            if class_id is None:
+                if self._matcher is None:
+                    self._matcher = self._build_matcher(slice(None))
+                return self._matcher
+
+            shard = self._shards.get(class_id)
+            if shard is None:
+                shard = self._build_matcher(self.class_ids == class_id)
+                self._shards[class_id] = shard
+            return shard
+
+    def as_dict(self) -> dict[int, np.ndarray]:
+        with self._lock:
+            return {int(student_id): row for student_id, row in zip(self.student_ids, self._float_matrix())}
+
+
+_gallery = EmbeddingGallery()
+
+
+def get_gallery() -> EmbeddingGallery:
+    """
+    Returns this worker's gallery cache, refreshed against the current generation.
+    """
+    _gallery.refresh(current_app.config.get('GALLERY_PRECISION', 'float32'))
+    return _gallery
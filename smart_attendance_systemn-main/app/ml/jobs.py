@@ -0,0 +1,206 @@
+"""
+Background recognition jobs for teacher video uploads.
+
+Job state lives in the recognition_jobs table, so any web worker can report
+on any job; the work itself runs on a local thread pool in the process that
+accepted the upload. No external broker is involved.
+"""
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect
+
+from app import db
+from app.models import RecognitionJob
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recognition')
+        return _executor
+
+
+def _claim(job_id: str) -> RecognitionJob | None:
+    """
+    Moves a job from queued to running; returns None if another worker got there first.
+    """
+    claimed = (
+        RecognitionJob.query
+        .filter_by(job_id=job_id, status='queued')
+        .update({'status': 'running', 'started_at': datetime.utcnow()})
+    )
+    db.session.commit()
+    return RecognitionJob.query.get(job_id) if claimed else None
+
+
+def _set_progress(job: RecognitionJob, step: str, percent: int, notify=None) -> None:
+    job.progress = percent
+    job.message = step[:255]
+    db.session.commit()
+    if notify:
+        notify(job.teacher_id, step, percent)
+
+
+def run_job(app, job_id: str, notify=None, content_hash: str | None = None) -> None:
+    """
+    Runs one recognition job inside an app context. notify, if given, receives
+    (teacher_id, step, percent) for each progress update. content_hash keys the
+    result cache; resumed jobs hash the stored file instead.
+    """
+    from app.ml.recognise import run_recognition, recognition_options
+    from app.ml.result_cache import file_sha256
+    from app.ml.artifacts import artifact_path
+
+    with app.app_context():
+        job = _claim(job_id)
+        if job is None:
+            return
+
+        try:
+            options = recognition_options(app.config)
+            if job.detector_backend:
+                # DETECTOR_MODEL_PATH belongs to the configured backend, not to an override
+                options.update(detector_backend=job.detector_backend, detector_model_path=None)
+            save_artifact = app.config['SAVE_VIDEO_ARTIFACTS']
+            if (options['cache'] is not None or save_artifact) and content_hash is None:
+                content_hash = file_sha256(job.video_path)
+            result = run_recognition(
+                job.video_path,
+                class_id=job.class_id,
+                progress=lambda step, percent: _set_progress(job, step, percent, notify),
+                content_hash=content_hash,
+                artifact_path=artifact_path(content_hash) if save_artifact else None,
+                **options
+            )
+            job.result = json.dumps({
+                'recognized': sorted(result.recognized),
+                'faces_embedded': result.faces_embedded,
+                'faces_dropped': result.faces_dropped,
+                'cluster_sizes': {str(student_id): size for student_id, size in result.cluster_sizes.items()},
+                'fraction_processed': result.fraction_processed,
+                'stop_reason': result.stop_reason,
+                'cached': result.cached,
+                'content_hash': content_hash,
+            })
+            job.status = 'done'
+            if result.faces_embedded:
+                step = f"🎉 Done! ({result.fraction_processed:.0%} of the video processed)"
+            else:
+                step = "❌ No valid embeddings found"
+        except Exception as e:
+            db.session.rollback()
+            job = RecognitionJob.query.get(job_id)
+            job.status = 'failed'
+            step = f"❌ Error: {str(e)}"
+            print(f"[ERROR] Recognition job {job_id} failed: {e}")
+        finally:
+            if os.path.exists(job.video_path):
+                os.remove(job.video_path)
+
+        job.finished_at = datetime.utcnow()
+        _set_progress(job, step, 100, notify)
+
+
+def submit_recognition_job(app, teacher_id: int, video_path: str, class_id=None, subject_id=None,
+                           periods: str = '', date: str | None = None, notify=None,
+                           content_hash: str | None = None, detector_backend: str | None = None) -> str:
+    """
+    Persists a queued job, hands it to the worker pool and returns its id immediately.
+    """
+    job = RecognitionJob(
+        job_id=uuid.uuid4().hex,
+        teacher_id=teacher_id,
+        class_id=int(class_id) if class_id else None,
+        subject_id=int(subject_id) if subject_id else None,
+        periods=periods,
+        date=date,
+        video_path=video_path,
+        detector_backend=detector_backend,
+        status='queued',
+        message="📥 Video uploaded successfully",
+        progress=5,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _get_executor(app.config['RECOGNITION_WORKERS']).submit(run_job, app, job.job_id, notify, content_hash)
+    return job.job_id
+
+
+def resume_queued_jobs(app) -> int:
+    """
+    Re-submits jobs left queued by a previous process, first re-queueing jobs whose
+    worker died mid-run (running for longer than RECOGNITION_JOB_TIMEOUT_MINUTES).
+    Claiming is atomic, so several workers resuming at once still run each job only once.
+    """
+    with app.app_context():
+        if not inspect(db.engine).has_table(RecognitionJob.__tablename__):
+            return 0
+        stale_before = datetime.utcnow() - timedelta(minutes=app.config['RECOGNITION_JOB_TIMEOUT_MINUTES'])
+        requeued = (
+            RecognitionJob.query
+            .filter(RecognitionJob.status == 'running', RecognitionJob.started_at < stale_before)
+            .update({'status': 'queued', 'started_at': None}, synchronize_session=False)
+        )
+        db.session.commit()
+        if requeued:
+            print(f"[INFO] Re-queued {requeued} recognition jobs left running by a stopped worker")
+        queued = [job.job_id for job in RecognitionJob.query.filter_by(status='queued').all()]
+
+    executor = _get_executor(app.config['RECOGNITION_WORKERS'])
+    for job_id in queued:
+        executor.submit(run_job, app, job_id)
+    return len(queued)
+
+
+def fail_stale_jobs(app, job_id: str | None = None) -> int:
+    """
+    For deployments that do not resume jobs: marks jobs failed that have been queued,
+    or running, for longer than RECOGNITION_JOB_TIMEOUT_MINUTES, since no worker will
+    finish them, and deletes their uploaded videos. job_id limits the sweep to one job.
+    """
+    with app.app_context():
+        if not inspect(db.engine).has_table(RecognitionJob.__tablename__):
+            return 0
+        stale_before = datetime.utcnow() - timedelta(minutes=app.config['RECOGNITION_JOB_TIMEOUT_MINUTES'])
+        query = RecognitionJob.query.filter(db.or_(
+            db.and_(RecognitionJob.status == 'queued', RecognitionJob.created_at < stale_before),
+            db.and_(RecognitionJob.status == 'running', RecognitionJob.started_at < stale_before),
+        ))
+        if job_id is not None:
+            query = query.filter(RecognitionJob.job_id == job_id)
+
+        stale = query.all()
+        for job in stale:
+            job.status = 'failed'
+            job.progress = 100
+            job.message = "❌ Processing was interrupted. Please upload the video again."
+            job.finished_at = datetime.utcnow()
+            if os.path.exists(job.video_path):
+                os.remove(job.video_path)
+        db.session.commit()
+    if stale and job_id is None:
+        print(f"[INFO] Marked {len(stale)} interrupted recognition jobs as failed")
+    return len(stale)
+
+
+def job_recognized_ids(job: RecognitionJob) -> set:
+    return set(json.loads(job.result)['recognized']) if job.result else set()
+
+
+def job_cluster_sizes(job: RecognitionJob) -> dict:
+    sizes = json.loads(job.result).get('cluster_sizes', {}) if job.result else {}
+    return {int(student_id): size for student_id, size in sizes.items()}
+
+
+def job_content_hash(job: RecognitionJob) -> str | None:
+    return json.loads(job.result).get('content_hash') if job.result else None
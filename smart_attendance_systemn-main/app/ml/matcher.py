@@ -0,0 +1,184 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+EMBEDDING_DIM = 128
+
+
+@dataclass
+class MatchResult:
+    """
+    Per-face match output. Row i describes the i-th query embedding; column 0
+    of the top-k arrays is the best match. Ids are -1 where the gallery is empty.
+    """
+    top_k_ids: np.ndarray
+    top_k_scores: np.ndarray
+
+    @property
+    def best_ids(self) -> np.ndarray:
+        return self.top_k_ids[:, 0]
+
+    @property
+    def best_scores(self) -> np.ndarray:
+        return self.top_k_scores[:, 0]
+
+    def recognized(self, similarity_threshold: float = 0.6) -> set:
+        """
+        Returns the set of student ids whose best score reaches the threshold.
+        """
+        hits = (self.best_scores >= similarity_threshold) & (self.best_ids >= 0)
+        return {int(student_id) for student_id in np.unique(self.best_ids[hits])}
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalises each row as float32. Zero rows stay zero so they score 0 against everything.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+
+def encode_rows(matrix: np.ndarray, precision: str = 'float32') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Stores rows compactly for matching. Returns (data, scales) where row i decodes to
+    data[i] * scales[i]. float32 keeps rows as given; float16 and int8 normalise first,
+    int8 with a per-row scale so the largest component maps to +/-127.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown gallery precision {precision!r}; expected one of {PRECISIONS}")
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    scales = np.ones(len(matrix), dtype=np.float32)
+    if precision == 'float32':
+        return matrix, scales
+    unit = normalize_rows(matrix).reshape(-1, EMBEDDING_DIM)
+    if precision == 'float16':
+        return unit.astype(np.float16), scales
+    peaks = np.abs(unit).max(axis=1)
+    scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+    return np.round(unit / scales[:, None]).astype(np.int8), scales
+
+
+def decode_rows(data: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return data.astype(np.float32) * scales[:, None]
+
+
+class GalleryMatcher:
+    """
+    Exact cosine-similarity matcher. The gallery is held as one pre-normalised
+    float32 matrix and queries are scored with a matrix multiply, chunk_size
+    queries at a time so the score matrix stays bounded.
+    """
+
+    def __init__(self, student_ids, embeddings, chunk_size: int = 1024):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64).reshape(-1)
+        self.matrix = normalize_rows(embeddings).reshape(len(self.student_ids), EMBEDDING_DIM)
+        self.chunk_size = max(1, chunk_size)
+
+    @classmethod
+    def from_dict(cls, registered_embeddings: dict, chunk_size: int = 1024) -> "GalleryMatcher":
+        """
+        Builds a matcher from the {student_id: embedding} dict returned by load_registered_students,
+        skipping entries that are not 128-d.
+        """
+        student_ids, rows = [], []
+        for student_id, student_embedding in registered_embeddings.items():
+            student_embedding = np.asarray(student_embedding)
+            if student_embedding.shape != (EMBEDDING_DIM,):
+                print(f"[WARNING] Skipping {student_id}: Invalid embedding shape {student_embedding.shape}")
+                continue
+            student_ids.append(student_id)
+            rows.append(student_embedding)
+
+        embeddings = np.vstack(rows) if rows else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        return cls(student_ids, embeddings, chunk_size=chunk_size)
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def search(self, queries, top_k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (ids, scores), each of shape (n_queries, top_k), sorted by descending similarity.
+        """
+        queries = normalize_rows(queries) if len(queries) else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        n_queries = len(queries)
+        top_k = max(1, top_k)
+
+        out_ids = np.full((n_queries, top_k), -1, dtype=np.int64)
+        out_scores = np.full((n_queries, top_k), -np.inf, dtype=np.float32)
+        if n_queries == 0 or len(self) == 0:
+            return out_ids, out_scores
+
+        k = min(top_k, len(self))
+        for start in range(0, n_queries, self.chunk_size):
+            scores = self._scores(queries[start:start + self.chunk_size])
+            if k == 1:
+                best = np.argmax(scores, axis=1)[:, None]
+            else:
+                candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+                # Stable sort keeps the lowest gallery index first on ties, like argmax.
+                order = np.lexsort((candidates, -candidate_scores), axis=1)
+                best = np.take_along_axis(candidates, order, axis=1)
+
+            stop = start + len(scores)
+            out_ids[start:stop, :k] = self.student_ids[best]
+            out_scores[start:stop, :k] = np.take_along_axis(scores, best, axis=1)
+
+        return out_ids, out_scores
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        return queries @ self.matrix.T
+
+    def match(self, queries, top_k: int = 1) -> MatchResult:
+        """
+        Scores every query embedding against the gallery.
+        """
+        ids, scores = self.search(queries, top_k=top_k)
+        return MatchResult(top_k_ids=ids, top_k_scores=scores)
+
+
+class CompactGalleryMatcher(GalleryMatcher):
+    """
+    GalleryMatcher over float16 or int8 rows from encode_rows. Rows stay compact in
+    memory; each block of block_size rows is widened to float32 only while it is scored,
+    and int8 scores are rescaled per row.
+    """
+
+    def __init__(self, student_ids, data: np.ndarray, scales: np.ndarray, chunk_size: int = 1024,
+                 block_size: int = 8192):
+        self.student_ids = np.asarray(student_ids, dtype=np.int64).reshape(-1)
+        self.matrix = np.asarray(data).reshape(len(self.student_ids), EMBEDDING_DIM)
+        self.scales = np.asarray(scales, dtype=np.float32).reshape(-1)
+        self.rescale = self.matrix.dtype == np.int8
+        self.chunk_size = max(1, chunk_size)
+        self.block_size = max(1, block_size)
+
+    @classmethod
+    def from_embeddings(cls, student_ids, embeddings, precision: str, chunk_size: int = 1024) -> "CompactGalleryMatcher":
+        data, scales = encode_rows(embeddings, precision)
+        return cls(student_ids, data, scales, chunk_size=chunk_size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + (self.scales.nbytes if self.rescale else 0)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            stop = start + self.block_size
+            block_scores = queries @ self.matrix[start:stop].astype(np.float32).T
+            if self.rescale:
+                block_scores *= self.scales[start:stop]
+            scores[:, start:stop] = block_scores
+        return scores
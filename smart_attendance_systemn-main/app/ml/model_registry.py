@@ -0,0 +1,70 @@
+import threading
+import time
+
+import numpy as np
+
+_models = {}
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _load(name: str, loader):
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        if name not in _models:
+            started = time.perf_counter()
+            _models[name] = loader()
+            _metrics.setdefault(name, {})['load_seconds'] = round(time.perf_counter() - started, 3)
+            print(f"[INFO] Loaded {name} in {_metrics[name]['load_seconds']}s")
+    return _models[name]
+
+
+def _build_embedder():
+    from deepface import DeepFace
+    model = DeepFace.build_model("Facenet")
+    # Newer DeepFace wraps the Keras model in a client object.
+    return getattr(model, "model", model)
+
+
+def get_detector(backend: str = 'mtcnn', model_path: str | None = None):
+    """
+    Returns this process's detector for backend (see app.ml.detectors), building it on first use.
+    """
+    from app.ml.detectors import build_detector
+    return _load(f'detector:{backend}', lambda: build_detector(backend, model_path))
+
+
+def get_embedder():
+    """
+    Returns this process's Keras Facenet model, building it on first use.
+    """
+    return _load('embedder', _build_embedder)
+
+
+def warm_up(detector_backend: str = 'mtcnn', detector_model_path: str | None = None) -> dict:
+    """
+    Loads both models and runs one dummy inference through each so graph
+    tracing and kernel selection happen now instead of in the first upload.
+    """
+    detector = get_detector(detector_backend, detector_model_path)
+    started = time.perf_counter()
+    detector.detect_faces(np.zeros((240, 320, 3), dtype=np.uint8))
+    _metrics[f'detector:{detector_backend}']['warmup_seconds'] = round(time.perf_counter() - started, 3)
+
+    embedder = get_embedder()
+    started = time.perf_counter()
+    embedder.predict_on_batch(np.zeros((1, 160, 160, 3), dtype=np.float32))
+    _metrics['embedder']['warmup_seconds'] = round(time.perf_counter() - started, 3)
+
+    print(f"[INFO] ML models warm: {_metrics}")
+    return model_metrics()
+
+
+def model_metrics() -> dict:
+    """
+    Load and warm-up timings per model, in seconds.
+    """
+    return {name: dict(values) for name, values in _metrics.items()}
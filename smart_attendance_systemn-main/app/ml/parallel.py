@@ -0,0 +1,88 @@
+"""
+Segment-parallel processing of a single video.
+
+The frame range is cut into fixed-size segments and each segment is decoded,
+detected and embedded in a separate process. Results come back in segment
+order, so merging is deterministic regardless of which worker finishes first.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Iterator
+
+import numpy as np
+
+from app.ml.pipeline import ExtractionStats, iter_video_embeddings, video_frame_count
+
+DEFAULT_SEGMENT_FRAMES = 1800
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    One long-lived pool per process so each worker loads MTCNN and Facenet once.
+    Workers are spawned, not forked, because TensorFlow state does not survive fork.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def segment_ranges(frame_count: int, segment_frames: int) -> list[tuple[int, int]]:
+    segment_frames = max(1, segment_frames)
+    return [(start, min(start + segment_frames, frame_count)) for start in range(0, frame_count, segment_frames)]
+
+
+def process_segment(video_path: str, start_frame: int, end_frame: int, options: dict) -> tuple[list, np.ndarray, ExtractionStats]:
+    """
+    Worker entry point: embeds the faces of [start_frame, end_frame). Crop pixels are
+    dropped before returning so only boxes, scores and embeddings cross the process boundary.
+    """
+    stats = ExtractionStats()
+    crops, embeddings = [], []
+    for batch_crops, batch_embeddings in iter_video_embeddings(video_path, stats, start_frame=start_frame,
+                                                               end_frame=end_frame, **options):
+        crops.extend(replace(crop, image=None) for crop in batch_crops)
+        embeddings.append(batch_embeddings)
+
+    merged = np.vstack(embeddings) if embeddings else np.empty((0, 128), dtype=np.float32)
+    return crops, merged, stats
+
+
+def iter_parallel_embeddings(video_path: str, stats: ExtractionStats | None = None, workers: int = 2,
+                             segment_frames: int = DEFAULT_SEGMENT_FRAMES, **options) -> Iterator[tuple[list, np.ndarray]]:
+    """
+    Same contract as pipeline.iter_video_embeddings, but segments are processed
+    concurrently; yields one (crops, embeddings) batch per segment, in frame order.
+    Closing the generator early cancels segments that have not started.
+    """
+    stats = stats if stats is not None else ExtractionStats()
+    frame_count = video_frame_count(video_path)
+    if frame_count <= 0 or workers <= 1:
+        # Unknown length (some streams) or nothing to parallelise: run in-process.
+        yield from iter_video_embeddings(video_path, stats, **options)
+        return
+
+    pool = _get_pool(workers)
+    futures = [
+        pool.submit(process_segment, video_path, start, end, options)
+        for start, end in segment_ranges(frame_count, segment_frames)
+    ]
+    try:
+        for future in futures:
+            crops, embeddings, segment_stats = future.result()
+            stats.merge(segment_stats)
+            if len(embeddings):
+                yield crops, embeddings
+    finally:
+        for future in futures:
+            future.cancel()
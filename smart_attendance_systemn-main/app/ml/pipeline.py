@@ -0,0 +1,267 @@
+"""
+Generator stages for video face processing: frames -> face crops -> embeddings.
+
+Each stage pulls from the previous one, so at most one decoded frame and one
+embedding batch of crops are alive at a time regardless of video length.
+"""
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import cv2
+import numpy as np
+
+from app.ml.embedding import generate_face_embeddings, DEFAULT_BATCH_SIZE
+from app.ml.model_registry import get_detector
+from app.ml.quality import QualityThresholds, filter_crops
+from app.ml.roi import RegionOfInterest
+from app.ml.sampling import MotionSampling, iter_sampled_frames
+from app.ml.tracking import IoUTracker, iter_tracked_crops
+
+# MTCNN's default minimum face size in pixels.
+DETECTOR_MIN_FACE = 20
+# Expected face size in a classroom frame, as a fraction of its shorter side; the ROI
+# detection rectangle is padded by this much so faces on the polygon's edge stay whole.
+ROI_FACE_FRACTION = 0.1
+
+
+@dataclass
+class FaceCrop:
+    frame_index: int
+    box: tuple  # (x, y, width, height) in frame pixels
+    confidence: float
+    image: np.ndarray
+    keypoints: dict = field(default_factory=dict)
+    track_id: int | None = None
+
+
+def video_frame_count(video_path: str) -> int:
+    return video_properties(video_path)[0]
+
+
+def video_properties(video_path: str) -> tuple[int, float]:
+    """
+    Returns (frame_count, fps), with fps defaulting to 30 when the container does not report it.
+    """
+    video_capture = cv2.VideoCapture(video_path)
+    count = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    fps = float(video_capture.get(cv2.CAP_PROP_FPS) or 0.0)
+    video_capture.release()
+    return count, fps if fps > 0 else 30.0
+
+
+def iter_video_frames(video_path: str, frame_interval: int = 5, frames_per_second: float | None = None,
+                      num_keyframes: int | None = None, start_frame: int = 0,
+                      end_frame: int | None = None,
+                      motion: MotionSampling | None = None) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Yields (frame_index, frame) for the sampled frames of the video; skipped
+    frames are never decoded. See sampling.iter_sampled_frames for the modes.
+    """
+    yield from iter_sampled_frames(video_path, frame_interval, frames_per_second, num_keyframes,
+                                   start_frame, end_frame, motion)
+
+
+def detection_scale_for(min_face_size: int | None, detector_min_face: int = DETECTOR_MIN_FACE) -> float:
+    """
+    Largest downscale that still leaves the smallest expected face (in full-resolution
+    pixels) at least detector_min_face pixels tall after resizing. Never upscales.
+    """
+    if not min_face_size:
+        return 1.0
+    return min(1.0, detector_min_face / float(min_face_size))
+
+
+def _scale_face_data(face_data: dict, scale: float, offset: tuple[int, int] = (0, 0)) -> dict:
+    """
+    Maps a detection on a frame resized by scale, and cut at offset, back to frame pixels.
+    """
+    if scale == 1.0 and offset == (0, 0):
+        return face_data
+    x, y, width, height = face_data['box']
+    dx, dy = offset
+    scaled = dict(face_data)
+    scaled['box'] = [int(round(x / scale)) + dx, int(round(y / scale)) + dy,
+                     int(round(width / scale)), int(round(height / scale))]
+    scaled['keypoints'] = {
+        name: (int(round(px / scale)) + dx, int(round(py / scale)) + dy)
+        for name, (px, py) in face_data.get('keypoints', {}).items()
+    }
+    return scaled
+
+
+def detect_faces_scaled(detector, frame: np.ndarray, scale: float = 1.0) -> list:
+    """
+    Runs the detector on a copy of the frame resized by scale and maps boxes and
+    keypoints back to full-resolution coordinates.
+    """
+    if scale >= 1.0:
+        return detector.detect_faces(frame)
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return [_scale_face_data(face_data, scale) for face_data in detector.detect_faces(small)]
+
+
+def detect_faces_in_roi(detector, frame: np.ndarray, roi: RegionOfInterest, scale: float = 1.0) -> list:
+    """
+    Runs the detector on the ROI's bounding rectangle, padded by about one face so
+    faces straddling the polygon's edge are seen whole, and keeps faces whose centre
+    lies inside the polygon. Boxes and keypoints are in frame pixels.
+    """
+    frame_height, frame_width = frame.shape[:2]
+    margin = int(max(DETECTOR_MIN_FACE / scale, ROI_FACE_FRACTION * min(frame_width, frame_height)))
+    x0, y0, x1, y1 = roi.bounds(frame_width, frame_height, margin)
+    if x1 <= x0 or y1 <= y0:
+        return []
+    region = np.ascontiguousarray(frame[y0:y1, x0:x1])
+    faces = []
+    for face_data in detect_faces_scaled(detector, region, scale):
+        face_data = _scale_face_data(face_data, 1.0, (x0, y0))
+        x, y, width, height = face_data['box']
+        if roi.contains(x + width / 2, y + height / 2, frame_width, frame_height):
+            faces.append(face_data)
+    return faces
+
+
+def detect_frame_crops(detector, frame_index: int, frame: np.ndarray, scale: float = 1.0,
+                       roi: RegionOfInterest | None = None) -> list:
+    """
+    Detects faces in one frame (only inside roi, when given) and returns them as
+    FaceCrops cut from the full-resolution frame.
+    """
+    frame_height, frame_width = frame.shape[:2]
+    crops = []
+    faces = detect_faces_in_roi(detector, frame, roi, scale) if roi else detect_faces_scaled(detector, frame, scale)
+    for face_data in faces:
+        x, y, width, height = face_data['box']
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(frame_width, x + width), min(frame_height, y + height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        crops.append(FaceCrop(
+            frame_index=frame_index,
+            box=(x0, y0, x1 - x0, y1 - y0),
+            confidence=float(face_data.get('confidence', 1.0)),
+            image=frame[y0:y1, x0:x1].copy(),
+            keypoints=face_data.get('keypoints', {}),
+        ))
+    return crops
+
+
+def iter_frame_detections(frames: Iterable[tuple[int, np.ndarray]], detector=None, detection_scale: float | None = None,
+                          min_face_size: int | None = None, detector_backend: str = 'mtcnn',
+                          detector_model_path: str | None = None,
+                          roi: RegionOfInterest | None = None) -> Iterator[tuple[int, list]]:
+    """
+    Runs the face detector on each frame and yields (frame_index, crops), including
+    frames with no faces. Boxes are clipped to the frame and crops are copied so
+    the frame can be freed.
+    Detection runs on a frame downscaled by detection_scale, or by a scale derived from
+    the smallest expected face (min_face_size, in full-resolution pixels); crops are
+    always cut from the full-resolution frame.
+    Without an explicit detector, detector_backend picks one (see app.ml.detectors).
+    With roi, only faces inside the classroom's region of interest are returned (see app.ml.roi).
+    """
+    detector = detector or get_detector(detector_backend, detector_model_path)
+    scale = detection_scale or detection_scale_for(min_face_size)
+    for frame_index, frame in frames:
+        yield frame_index, detect_frame_crops(detector, frame_index, frame, scale, roi)
+
+
+def iter_face_crops(frames: Iterable[tuple[int, np.ndarray]], detector=None) -> Iterator[FaceCrop]:
+    """
+    Runs the face detector on each frame and yields one FaceCrop per detection.
+    """
+    for _, crops in iter_frame_detections(frames, detector):
+        yield from crops
+
+
+def iter_embedding_batches(crops: Iterable[FaceCrop], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[tuple[list, np.ndarray]]:
+    """
+    Groups crops into batches of batch_size, embeds each batch in one forward pass and
+    yields (crops, embeddings) with failed crops left out. embeddings has shape (n, 128).
+    """
+    pending = []
+
+    def flush():
+        embeddings = generate_face_embeddings([crop.image for crop in pending], batch_size=batch_size)
+        kept = [(crop, emb) for crop, emb in zip(pending, embeddings) if emb is not None]
+        pending.clear()
+        if kept:
+            return [crop for crop, _ in kept], np.vstack([emb for _, emb in kept])
+        return None
+
+    for crop in crops:
+        pending.append(crop)
+        if len(pending) >= batch_size:
+            batch = flush()
+            if batch:
+                yield batch
+
+    if pending:
+        batch = flush()
+        if batch:
+            yield batch
+
+
+@dataclass
+class ExtractionStats:
+    frames_processed: int = 0
+    faces_detected: int = 0
+    tracks: int = 0
+    last_frame_index: int = -1
+    dropped_by_reason: dict = field(default_factory=dict)  # quality-gate rejections
+
+    @property
+    def faces_dropped(self) -> int:
+        return sum(self.dropped_by_reason.values())
+
+    def merge(self, other: "ExtractionStats") -> None:
+        self.frames_processed += other.frames_processed
+        self.faces_detected += other.faces_detected
+        for reason, count in other.dropped_by_reason.items():
+            self.dropped_by_reason[reason] = self.dropped_by_reason.get(reason, 0) + count
+        self.tracks += other.tracks
+        self.last_frame_index = max(self.last_frame_index, other.last_frame_index)
+
+
+def iter_video_embeddings(video_path: str, stats: ExtractionStats | None = None, frame_interval: int = 5,
+                          frames_per_second: float | None = None, num_keyframes: int | None = None,
+                          start_frame: int = 0, end_frame: int | None = None, motion: MotionSampling | None = None,
+                          detection_scale: float | None = None, min_face_size: int | None = None,
+                          crops_per_track: int | None = None, quality: QualityThresholds | None = None,
+                          detector_backend: str = 'mtcnn', detector_model_path: str | None = None,
+                          roi: RegionOfInterest | None = None,
+                          batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[tuple[list, np.ndarray]]:
+    """
+    The full frames -> detections -> (quality gate) -> (tracks) -> embeddings chain for
+    one video or frame range, yielding (crops, embeddings) batches. stats, if given, is
+    updated in place. With quality, crops failing the gate are dropped before tracking.
+    With roi, detection is limited to the classroom's region of interest.
+    """
+    stats = stats if stats is not None else ExtractionStats()
+
+    def counted_frames():
+        for frame_index, frame in iter_video_frames(video_path, frame_interval, frames_per_second, num_keyframes,
+                                                    start_frame, end_frame, motion):
+            stats.frames_processed += 1
+            stats.last_frame_index = frame_index
+            yield frame_index, frame
+
+    def counted_detections():
+        for frame_index, crops in iter_frame_detections(counted_frames(), detection_scale=detection_scale,
+                                                        min_face_size=min_face_size, detector_backend=detector_backend,
+                                                        detector_model_path=detector_model_path, roi=roi):
+            stats.faces_detected += len(crops)
+            yield frame_index, filter_crops(crops, quality, stats.dropped_by_reason)
+
+    tracker = None
+    if crops_per_track:
+        tracker = IoUTracker(crops_per_track=crops_per_track)
+        crop_stream = iter_tracked_crops(counted_detections(), tracker)
+    else:
+        crop_stream = (crop for _, crops in counted_detections() for crop in crops)
+
+    try:
+        yield from iter_embedding_batches(crop_stream, batch_size=batch_size)
+    finally:
+        if tracker:
+            stats.tracks = tracker.tracks_started
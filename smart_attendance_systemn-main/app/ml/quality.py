@@ -0,0 +1,96 @@
+"""
+Cheap face-quality gate applied to crops before they reach the embedder.
+
+Uses only what MTCNN already returned (confidence, box, keypoints) plus the
+variance of the Laplacian on a grey copy of the crop, so checking a crop
+costs a fraction of a Facenet forward pass.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# Crops larger than the Facenet input are shrunk to it before measuring sharpness, since that is
+# the detail the embedder gets; smaller crops are measured as they are, because upscaling them
+# interpolates away the edges being measured and would fail sharp small faces.
+SHARPNESS_MAX_SIDE = 160
+
+
+@dataclass
+class QualityThresholds:
+    min_confidence: float = 0.9
+    min_size: int = 24           # shorter box side, full-resolution pixels
+    max_yaw: float = 0.4         # nose offset from the eye midpoint, as a fraction of eye distance
+    min_sharpness: float = 15.0  # variance of the Laplacian on the grey crop (see sharpness)
+
+
+def thresholds_from_config(config) -> QualityThresholds | None:
+    """
+    The gate configured for the app, or None when FACE_QUALITY_GATE is off.
+    """
+    if not config['FACE_QUALITY_GATE']:
+        return None
+    return QualityThresholds(
+        min_confidence=config['FACE_MIN_CONFIDENCE'],
+        min_size=config['FACE_MIN_SIZE'],
+        max_yaw=config['FACE_MAX_YAW'],
+        min_sharpness=config['FACE_MIN_SHARPNESS'],
+    )
+
+
+def sharpness(image: np.ndarray) -> float:
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    factor = SHARPNESS_MAX_SIDE / max(grey.shape[:2])
+    if factor < 1:
+        size = (max(1, round(grey.shape[1] * factor)), max(1, round(grey.shape[0] * factor)))
+        grey = cv2.resize(grey, size, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(grey, cv2.CV_64F).var())
+
+
+def yaw_ratio(keypoints: dict) -> float | None:
+    """
+    How far the nose sits from the midpoint of the eyes, relative to the eye distance.
+    Near 0 for a frontal face, growing as the head turns; None without keypoints.
+    """
+    try:
+        (lx, ly), (rx, ry), (nx, _) = keypoints['left_eye'], keypoints['right_eye'], keypoints['nose']
+    except (KeyError, TypeError, ValueError):
+        return None
+    eye_distance = float(np.hypot(rx - lx, ry - ly))
+    if eye_distance < 1:
+        return float('inf')
+    return abs(nx - (lx + rx) / 2.0) / eye_distance
+
+
+def rejection_reason(crop, thresholds: QualityThresholds) -> str | None:
+    """
+    Returns why the crop fails the gate ('confidence', 'size', 'pose' or 'blur'),
+    or None if it passes. Checks run cheapest first.
+    """
+    if crop.confidence < thresholds.min_confidence:
+        return 'confidence'
+    if min(crop.box[2], crop.box[3]) < thresholds.min_size:
+        return 'size'
+    yaw = yaw_ratio(crop.keypoints)
+    if yaw is not None and yaw > thresholds.max_yaw:
+        return 'pose'
+    if crop.image is None or not crop.image.size or sharpness(crop.image) < thresholds.min_sharpness:
+        return 'blur'
+    return None
+
+
+def filter_crops(crops: list, thresholds: QualityThresholds | None, dropped: dict) -> list:
+    """
+    Keeps the crops that pass the gate and counts the rest into dropped by reason.
+    thresholds=None disables the gate.
+    """
+    if thresholds is None:
+        return crops
+    kept = []
+    for crop in crops:
+        reason = rejection_reason(crop, thresholds)
+        if reason is None:
+            kept.append(crop)
+        else:
+            dropped[reason] = dropped.get(reason, 0) + 1
+    return kept
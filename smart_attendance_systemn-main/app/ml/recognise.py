@@ -1,122 +1,421 @@
-import cv2
-from deepface import DeepFace
+import os
+from dataclasses import dataclass, field, fields, asdict
+
 import numpy as np
-from scipy.spatial.distance import cosine
-from mtcnn import MTCNN
-from app.models import StudentEmbedding
+from flask import current_app
+from app.ml.matcher import GalleryMatcher
+from app.ml.gallery import get_gallery, current_generation
+from app.ml.ann_index import load_persisted_index
+from app.ml.embedding import DEFAULT_BATCH_SIZE
+from app.ml.model_registry import get_detector
+from app.ml.pipeline import (
+    ExtractionStats, iter_video_frames, iter_face_crops, iter_video_embeddings, video_properties
+)
+from app.ml.parallel import iter_parallel_embeddings, DEFAULT_SEGMENT_FRAMES
+from app.ml.staged import iter_staged_embeddings
+from app.ml.quality import QualityThresholds, thresholds_from_config
+from app.ml.clustering import LeaderClusters
+from app.ml.result_cache import RecognitionCache, cache_key, cache_from_config
+from app.ml.artifacts import VideoArtifact
+from app.ml.roi import load_class_roi
+from app.ml.sampling import MotionSampling, motion_sampling_from_config
 
-def extract_faces(video_path: str, frame_interval: int = 5) -> list:
+def extract_faces(video_path: str, frame_interval: int = 5, detector_backend: str = 'mtcnn') -> list:
     """
-    Extract faces from the given video using MTCNN at specified frame intervals.
+    Extract faces from the given video at specified frame intervals (MTCNN unless another backend is given).
+    Thin list wrapper over the streaming pipeline; prefer run_recognition for long videos.
     """
-    face_detector = MTCNN()
-    video_capture = cv2.VideoCapture(video_path)
-    extracted_faces = []
-    frame_index = 0
+    frames = iter_video_frames(video_path, frame_interval)
+    return [crop.image for crop in iter_face_crops(frames, get_detector(detector_backend))]
 
-    while True:
-        success, frame = video_capture.read()
-        if not success:
-            break
+def load_registered_students() -> dict[int, np.ndarray]:
+    """
+    Loads all registered student embeddings from the process-wide gallery cache.
+    Returns a dictionary mapping student_id to their corresponding embedding array.
+    """
+    student_embeddings = get_gallery().as_dict()
+    print(f"[INFO] Loaded {len(student_embeddings)} student embeddings.")
+    return student_embeddings
 
-        if frame_index % frame_interval == 0:
-            detected_faces = face_detector.detect_faces(frame)
-            for face_data in detected_faces:
-                x, y, width, height = face_data['box']
-                face_image = frame[y:y+height, x:x+width]
-                extracted_faces.append(face_image)
 
-        frame_index += 1
+def match_faces_to_students(video_face_embeddings: list, registered_embeddings, similarity_threshold: float = 0.6) -> set:
+    """
+    Match extracted face embeddings to registered students using cosine similarity.
+    Modified: Assign detected faces to best matching student if above threshold.
+    Accepts the dict from load_registered_students or any matcher exposing match(),
+    such as GalleryMatcher or IVFIndex.
+    """
+    if isinstance(registered_embeddings, dict):
+        matcher = GalleryMatcher.from_dict(registered_embeddings)
+    else:
+        matcher = registered_embeddings
+
+    result = matcher.match(video_face_embeddings)
+    identified_students = result.recognized(similarity_threshold)
 
-    video_capture.release()
-    return extracted_faces
+    print(f"[DEBUG] Scored {len(result.best_ids)} faces against {len(matcher)} students.")
+    for student_id in sorted(identified_students):
+        print(f"[INFO] Recognized: {student_id}")
 
-def generate_face_embedding(face_image: np.ndarray) -> np.ndarray | None:
+    return identified_students
+
+
+def school_wide_matcher(gallery=None):
     """
-    Generate face embedding using DeepFace with the Facenet model.
+    Matcher over every registered student: the persisted ANN index when
+    RECOGNITION_USE_ANN_INDEX is set and an index exists, otherwise exact search.
     """
-    try:
-        result = DeepFace.represent(face_image, model_name="Facenet", enforce_detection=False)
-        return result[0]['embedding']
-    except Exception as e:
-        print(f"[ERROR] Failed to generate embedding: {e}")
-        return None
+    if current_app.config.get('RECOGNITION_USE_ANN_INDEX'):
+        index = load_persisted_index()
+        if index is not None:
+            return index
+    return (gallery or get_gallery()).matcher()
 
-def load_registered_students() -> dict[int, np.ndarray]:
+
+class _RunMatchers:
     """
-    Loads all registered student embeddings from the database.
-    Returns a dictionary mapping student_id to their corresponding embedding array.
+    The matchers one recognition run scores against. The gallery is checked against
+    the database generation once, when the run starts, rather than on every batch;
+    the school-wide matcher is only built if something falls back to it.
     """
-    student_embeddings = {}
 
-    all_records = StudentEmbedding.query.all()
+    def __init__(self, class_id: int | None):
+        self._gallery = get_gallery()
+        self.in_class = self._gallery.matcher(class_id) if class_id is not None else None
+        self._full = None
 
-    for record in all_records:
-        embedding_array = np.frombuffer(record.embedding, dtype=np.float32)
+    def full(self):
+        if self._full is None:
+            self._full = school_wide_matcher(self._gallery)
+        return self._full
 
-        if embedding_array.shape != (128,):
-            print(f"[WARNING] Embedding for student ID {record.student_id} has invalid shape: {embedding_array.shape}")
-            continue
 
-        student_embeddings[record.student_id] = embedding_array
-
-    print(f"[INFO] Loaded {len(student_embeddings)} student embeddings.")
-    return student_embeddings
+def _accepted_ids(result, similarity_threshold: float) -> np.ndarray:
+    hits = (result.best_scores >= similarity_threshold) & (result.best_ids >= 0)
+    return np.where(hits, result.best_ids, -1)
 
 
-def match_faces_to_students(video_face_embeddings: list, registered_embeddings: dict, similarity_threshold: float = 0.6) -> set:
+def _identify_in_class(video_face_embeddings, matchers: _RunMatchers, similarity_threshold: float,
+                       fallback_to_full: bool) -> np.ndarray:
     """
-    Match extracted face embeddings to registered students using cosine similarity.
-    Modified: Assign detected faces to best matching student if above threshold.
+    Student id per embedding row, or -1 where nobody reaches the threshold.
     """
-    identified_students = set() 
+    if matchers.in_class is None:
+        return _accepted_ids(matchers.full().match(video_face_embeddings), similarity_threshold)
 
-    for embedding in video_face_embeddings:
-        best_match_id = None
-        best_similarity = -1
+    identities = _accepted_ids(matchers.in_class.match(video_face_embeddings), similarity_threshold)
 
-        for student_id, student_embedding in registered_embeddings.items():
-            if student_embedding.shape != (128,):
-                print(f"[WARNING] Skipping {student_id}: Invalid embedding shape {student_embedding.shape}")
-                continue
+    if fallback_to_full:
+        unmatched = np.flatnonzero(identities < 0)
+        if len(unmatched):
+            leftovers = np.asarray(video_face_embeddings, dtype=np.float32)[unmatched]
+            identities[unmatched] = _accepted_ids(matchers.full().match(leftovers), similarity_threshold)
 
-            similarity = 1 - cosine(student_embedding, embedding)
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match_id = student_id
+    return identities
 
-        print(f"[DEBUG] Best Match: {best_match_id} with similarity {best_similarity:.3f}")
 
-        if best_similarity >= similarity_threshold:
-            identified_students.add(best_match_id)
-            print(f"[INFO] Recognized: {best_match_id}")
+# Bump when RecognitionResult or the cached arrays change shape, so old cache entries are ignored.
+RESULT_SCHEMA_VERSION = 1
 
-    return identified_students
 
+@dataclass
+class RecognitionResult:
+    recognized: set = field(default_factory=set)
+    frames_processed: int = 0
+    faces_detected: int = 0
+    faces_embedded: int = 0
+    faces_dropped: int = 0
+    tracks: int = 0
+    total_frames: int = 0
+    last_frame_index: int = -1
+    stop_reason: str = 'end_of_video'
+    clusters: int = 0
+    # Faces attributed to each recognised student: the size of their clusters when
+    # clustering is on, otherwise the number of matching embeddings.
+    cluster_sizes: dict = field(default_factory=dict)
+    cached: bool = False
 
-def recognize_students_in_video(video_path: str) -> set:
+    @property
+    def fraction_processed(self) -> float:
+        if self.stop_reason == 'end_of_video' or not self.total_frames:
+            return 1.0
+        return min(1.0, (self.last_frame_index + 1) / self.total_frames)
+
+
+def recognition_options(config) -> dict:
     """
-    Full pipeline to recognize students in a given video.
+    run_recognition keyword arguments taken from the Flask app config.
     """
-    print("[STEP 1] Extracting faces from video...")
-    detected_faces = extract_faces(video_path)
-    print(f"[INFO] Extracted {len(detected_faces)} faces.")
+    return {
+        'fallback_to_full': config['RECOGNITION_FALLBACK_TO_FULL_GALLERY'],
+        'frames_per_second': config['RECOGNITION_SAMPLE_FPS'],
+        'motion': motion_sampling_from_config(config),
+        'detection_scale': config['DETECTION_SCALE'],
+        'min_face_size': config['DETECTION_MIN_FACE_SIZE'],
+        'crops_per_track': config['RECOGNITION_CROPS_PER_TRACK'],
+        'quality': thresholds_from_config(config),
+        'detector_backend': config['DETECTOR_BACKEND'],
+        'detector_model_path': config['DETECTOR_MODEL_PATH'],
+        'use_roi': config['RECOGNITION_USE_ROI'],
+        'cluster_similarity': config['RECOGNITION_CLUSTER_SIMILARITY'],
+        'batch_size': config['EMBEDDING_BATCH_SIZE'],
+        'stop_when_roster_complete': config['RECOGNITION_EARLY_EXIT'],
+        'idle_stop_seconds': config['RECOGNITION_IDLE_STOP_SECONDS'],
+        'workers': config['RECOGNITION_SEGMENT_WORKERS'],
+        'segment_frames': config['RECOGNITION_SEGMENT_FRAMES'],
+        'detect_threads': config['RECOGNITION_DETECT_THREADS'],
+        'embed_threads': config['RECOGNITION_EMBED_THREADS'],
+        'stage_queue_size': config['RECOGNITION_STAGE_QUEUE_SIZE'],
+        'cache': cache_from_config(config),
+        'max_stored_faces': config['RECOGNITION_MAX_STORED_FACES'],
+    }
+
+
+def run_recognition(video_path: str, class_id: int | None = None, fallback_to_full: bool = False,
+                    similarity_threshold: float = 0.6, frame_interval: int = 5,
+                    frames_per_second: float | None = None, num_keyframes: int | None = None,
+                    motion: MotionSampling | None = None,
+                    detection_scale: float | None = None, min_face_size: int | None = None,
+                    crops_per_track: int | None = None, quality: QualityThresholds | None = None,
+                    cluster_similarity: float | None = None, detector_backend: str = 'mtcnn',
+                    detector_model_path: str | None = None, use_roi: bool = False,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    stop_when_roster_complete: bool = False, idle_stop_seconds: float | None = None,
+                    workers: int = 1, segment_frames: int = DEFAULT_SEGMENT_FRAMES,
+                    detect_threads: int = 0, embed_threads: int = 1, stage_queue_size: int = 8,
+                    content_hash: str | None = None, cache: RecognitionCache | None = None,
+                    artifact_path: str | None = None, max_stored_faces: int | None = 50000,
+                    progress=None) -> RecognitionResult:
+    """
+    Streams the video through detection and embedding and matches each embedding
+    batch as soon as it is ready, so memory stays bounded by one batch of crops
+    (plus up to max_stored_faces per-face rows when a cache or artifact is wanted).
+    With motion, frames are sampled densely while the scene changes and sparsely while
+    it is static (see app.ml.sampling) instead of every frame_interval-th frame;
+    frames_per_second, when set, still takes precedence.
+    With crops_per_track, detections are chained into IoU tracks and only that many
+    of the best crops of each stretch of a track are embedded (see app.ml.tracking).
+    quality drops small, blurred, side-on or low-confidence crops before tracking
+    and embedding (see app.ml.quality).
+    With cluster_similarity, embeddings are grouped into per-person leader clusters and
+    only the centroids of clusters that changed in a batch are matched against the gallery.
+    detection_scale / min_face_size run detection on a downscaled copy of each frame;
+    detector_backend chooses the face detector (see app.ml.detectors).
+    With use_roi, detection is limited to class_id's stored region of interest, if it has one.
+    Decoding stops early when stop_when_roster_complete is set and every student of
+    class_id has been recognised, or when no new student has been recognised for
+    idle_stop_seconds of video; result.fraction_processed reports how far it got.
+    With workers > 1 the video is split into segment_frames-long ranges that are
+    processed in a process pool and matched in frame order. Otherwise, with
+    detect_threads > 0, decoding, detection and embedding run concurrently as a
+    staged thread pipeline (see app.ml.staged).
+    With content_hash and cache, a previous run over the same video bytes, gallery
+    generation and options is returned from disk instead of re-running the pipeline.
+    With artifact_path, the per-face embeddings, boxes, frame indices and detector scores
+    are saved there as a VideoArtifact for rematch_artifact.
+    Videos with more than max_stored_faces embedded faces are neither cached nor
+    saved as artifacts; their per-face rows are dropped once the limit is passed.
+    progress, if given, is called as progress(step_message, percent) with percent in [25, 90].
+    """
+    roi = load_class_roi(class_id) if use_roi else None
+    key = None
+    if cache is not None and content_hash:
+        key = cache_key(
+            content_hash, schema=RESULT_SCHEMA_VERSION, generation=current_generation(), class_id=class_id, fallback_to_full=fallback_to_full,
+            similarity_threshold=similarity_threshold, frame_interval=frame_interval,
+            frames_per_second=frames_per_second, num_keyframes=num_keyframes, detection_scale=detection_scale,
+            motion=asdict(motion) if motion else None,
+            min_face_size=min_face_size, crops_per_track=crops_per_track, detector_backend=detector_backend,
+            detector_model_path=detector_model_path, roi=roi.polygon if roi else None,
+            quality=asdict(quality) if quality else None, cluster_similarity=cluster_similarity,
+            batch_size=batch_size, stop_when_roster_complete=stop_when_roster_complete,
+            idle_stop_seconds=idle_stop_seconds,
+            # Segments restart tracks and extra embed threads reorder batches, so both can change the result.
+            workers=workers, segment_frames=segment_frames, detect_threads=detect_threads, embed_threads=embed_threads,
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            arrays, summary = entry
+            result = _result_from_summary(summary)
+            if artifact_path and not os.path.exists(artifact_path):
+                VideoArtifact(arrays['embeddings'], arrays['frame_indices'], arrays['boxes'], arrays['confidences'],
+                              _artifact_meta(result, content_hash)).save(artifact_path)
+                cache.evict()
+            print(f"[INFO] Reused cached recognition for video {content_hash[:12]}: {sorted(result.recognized)}")
+            return result
+
+    total_frames, fps = video_properties(video_path)
+    result = RecognitionResult(total_frames=total_frames)
+    faces = {'embeddings': [], 'frame_indices': [], 'boxes': [], 'confidences': [], 'identities': []}
+    keep_faces = bool(key or artifact_path)
+
+    matchers = _RunMatchers(class_id)
+    roster = set()
+    if stop_when_roster_complete and matchers.in_class is not None:
+        roster = {int(student_id) for student_id in matchers.in_class.student_ids}
+    last_new_identity_frame = 0
+
+    stats = ExtractionStats()
+    options = dict(
+        frame_interval=frame_interval, frames_per_second=frames_per_second, num_keyframes=num_keyframes,
+        motion=motion, detection_scale=detection_scale, min_face_size=min_face_size, crops_per_track=crops_per_track,
+        quality=quality, detector_backend=detector_backend, detector_model_path=detector_model_path,
+        roi=roi, batch_size=batch_size,
+    )
+    if workers > 1:
+        batches = iter_parallel_embeddings(video_path, stats, workers=workers, segment_frames=segment_frames, **options)
+    elif detect_threads > 0:
+        batches = iter_staged_embeddings(video_path, stats, detect_threads=detect_threads,
+                                         embed_threads=embed_threads, queue_size=stage_queue_size, **options)
+    else:
+        batches = iter_video_embeddings(video_path, stats, **options)
+
+    clusters = LeaderClusters(cluster_similarity) if cluster_similarity else None
+    cluster_identities = {}
+    face_counts = {}
+
+    try:
+        for crops, embeddings in batches:
+            result.last_frame_index = stats.last_frame_index
+            result.faces_embedded += len(embeddings)
+            if clusters is not None:
+                assignments = clusters.add(embeddings)
+                changed = clusters.pop_changed()
+                identities = _identify_in_class(clusters.centroids[changed], matchers, similarity_threshold,
+                                                fallback_to_full)
+                cluster_identities.update(zip(changed.tolist(), identities.tolist()))
+                # A student stays recognised even if their cluster's centroid later drifts to someone else.
+                recognized = result.recognized | {student_id for student_id in identities.tolist() if student_id >= 0}
+            else:
+                identities = _identify_in_class(embeddings, matchers, similarity_threshold, fallback_to_full)
+                for student_id in identities[identities >= 0].tolist():
+                    face_counts[student_id] = face_counts.get(student_id, 0) + 1
+                recognized = result.recognized | set(face_counts)
+
+            if keep_faces and max_stored_faces is not None and result.faces_embedded > max_stored_faces:
+                print(f"[WARNING] More than {max_stored_faces} faces embedded; not caching or saving an artifact for this video.")
+                keep_faces = False
+                faces = None
+            if keep_faces:
+                faces['embeddings'].append(np.asarray(embeddings, dtype=np.float32))
+                faces['frame_indices'].extend(crop.frame_index for crop in crops)
+                faces['boxes'].extend(crop.box for crop in crops)
+                faces['confidences'].extend(crop.confidence for crop in crops)
+                # Cluster members are labelled after the loop, once their centroid has settled.
+                faces['identities'].append(assignments if clusters is not None else identities)
 
-    print("[STEP 2] Generating embeddings...")
-    embeddings = [generate_face_embedding(face) for face in detected_faces]
-    valid_embeddings = [emb for emb in embeddings if emb is not None]
-    print(f"[INFO] Generated {len(valid_embeddings)} valid embeddings.")
+            newly_recognized = recognized - result.recognized
+            result.recognized = recognized
+            if newly_recognized:
+                last_new_identity_frame = result.last_frame_index
 
-    if not valid_embeddings:
-        print("[ERROR] No valid embeddings were found. Exiting.")
-        return set()
+            if progress and total_frames:
+                done = min(1.0, (result.last_frame_index + 1) / total_frames)
+                progress(f"🧠 Recognising faces ({len(result.recognized)} students so far)...", 25 + int(65 * done))
 
-    print("[STEP 3] Loading registered students...")
-    student_data = load_registered_students()
+            if roster and roster <= result.recognized:
+                result.stop_reason = 'roster_complete'
+                break
+            if idle_stop_seconds and (result.last_frame_index - last_new_identity_frame) / fps >= idle_stop_seconds:
+                result.stop_reason = 'no_new_identities'
+                break
+    finally:
+        batches.close()
 
-    print("[STEP 4] Matching faces to students...")
-    recognized = match_faces_to_students(valid_embeddings, student_data)
+    if clusters is not None:
+        result.clusters = len(clusters)
+        for cluster, student_id in cluster_identities.items():
+            if student_id >= 0:
+                face_counts[student_id] = face_counts.get(student_id, 0) + int(clusters.sizes[cluster])
+    result.cluster_sizes = face_counts
+
+    result.frames_processed = stats.frames_processed
+    result.faces_detected = stats.faces_detected
+    result.faces_dropped = stats.faces_dropped
+    result.tracks = stats.tracks
+    result.last_frame_index = stats.last_frame_index
+    print(f"[INFO] Processed {result.frames_processed} frames, {result.faces_detected} faces, "
+          f"{result.tracks} tracks, {result.faces_embedded} embeddings.")
+    if clusters is not None:
+        print(f"[INFO] Grouped embeddings into {result.clusters} clusters for {len(result.recognized)} students.")
+    if stats.dropped_by_reason:
+        print(f"[INFO] Quality gate dropped {result.faces_dropped} crops: {stats.dropped_by_reason}")
+    print(f"[INFO] Stopped at {result.fraction_processed:.0%} of the video ({result.stop_reason}).")
+
+    if keep_faces:
+        artifact = VideoArtifact.from_faces(faces['embeddings'], faces['frame_indices'], faces['boxes'],
+                                            faces['confidences'], _artifact_meta(result, content_hash))
+        if artifact_path:
+            artifact.save(artifact_path)
+            if cache is not None and not key:
+                cache.evict()
+        if key:
+            identities = np.concatenate(faces['identities']) if faces['identities'] else np.empty(0, dtype=np.int64)
+            if clusters is not None and len(identities):
+                identities = np.array([cluster_identities.get(int(cluster), -1) for cluster in identities])
+            cache.put(key, {
+                'embeddings': artifact.embeddings,
+                'frame_indices': artifact.frame_indices,
+                'boxes': artifact.boxes,
+                'confidences': artifact.confidences,
+                'identities': identities.astype(np.int64),
+            }, _result_summary(result))
+    return result
+
+
+def _artifact_meta(result: RecognitionResult, content_hash: str | None) -> dict:
+    return {
+        'content_hash': content_hash,
+        'frames_processed': result.frames_processed,
+        'total_frames': result.total_frames,
+        'last_frame_index': result.last_frame_index,
+        'stop_reason': result.stop_reason,
+    }
+
+
+def _result_summary(result: RecognitionResult) -> dict:
+    summary = asdict(result)
+    summary['recognized'] = sorted(result.recognized)
+    summary['cluster_sizes'] = {str(student_id): size for student_id, size in result.cluster_sizes.items()}
+    return summary
+
+
+def _result_from_summary(summary: dict) -> RecognitionResult:
+    names = {result_field.name for result_field in fields(RecognitionResult)}
+    summary = {name: value for name, value in summary.items() if name in names}
+    summary['recognized'] = set(summary['recognized'])
+    summary['cluster_sizes'] = {int(student_id): size for student_id, size in summary['cluster_sizes'].items()}
+    summary['cached'] = True
+    return RecognitionResult(**summary)
+
+
+def rematch_artifact(artifact: VideoArtifact, class_id: int | None = None, similarity_threshold: float = 0.6,
+                     fallback_to_full: bool = False, cluster_similarity: float | None = None) -> RecognitionResult:
+    """
+    Re-scores a processed video's stored embeddings against the current gallery with
+    any threshold. Only matching (and optional clustering) runs, so this takes milliseconds.
+    """
+    embeddings = artifact.embeddings
+    result = RecognitionResult(
+        faces_embedded=len(embeddings),
+        frames_processed=artifact.meta.get('frames_processed', 0),
+        total_frames=artifact.meta.get('total_frames', 0),
+        last_frame_index=artifact.meta.get('last_frame_index', -1),
+        stop_reason=artifact.meta.get('stop_reason', 'end_of_video'),
+    )
+    if not len(embeddings):
+        return result
 
-    print(f"[RESULT] Recognized Students: {recognized}")
-    return recognized
+    matchers = _RunMatchers(class_id)
+    if cluster_similarity:
+        clusters = LeaderClusters(cluster_similarity)
+        assignments = clusters.add(embeddings)
+        identities = _identify_in_class(clusters.centroids, matchers, similarity_threshold, fallback_to_full)[assignments]
+        result.clusters = len(clusters)
+    else:
+        identities = _identify_in_class(embeddings, matchers, similarity_threshold, fallback_to_full)
 
+    student_ids, counts = np.unique(identities[identities >= 0], return_counts=True)
+    result.recognized = {int(student_id) for student_id in student_ids}
+    result.cluster_sizes = {int(student_id): int(count) for student_id, count in zip(student_ids, counts)}
+    return result
@@ -1,45 +1,35 @@
+from dataclasses import dataclass
+from datetime import datetime
+
 import cv2
 import numpy as np
-from mtcnn import MTCNN
 from deepface import DeepFace
 
 from app import db
 from app.models import Student, StudentEmbedding
+from app.ml.gallery import record_embedding_change, record_embedding_version
+from app.ml.ann_index import update_persisted_index, add_to_persisted_index
+from app.ml.embedding import DEFAULT_BATCH_SIZE
+from app.ml.quality import QualityThresholds, filter_crops
+from app.ml.sampling import MotionSampling
+from app.ml.model_registry import get_detector
+from app.ml.pipeline import (
+    ExtractionStats, iter_video_frames, iter_face_crops, iter_video_embeddings, video_frame_count,
+    detect_frame_crops, iter_embedding_batches
+)
 
 def extract_video_frames(video_path: str, frame_interval: int = 5) -> list:
     """
     Extracts frames from a video at specified intervals.
+    Thin list wrapper over pipeline.iter_video_frames; it holds every sampled frame in memory.
     """
-    video_capture = cv2.VideoCapture(video_path)
-    frames = []
-    frame_index = 0
-
-    while video_capture.isOpened():
-        success, frame = video_capture.read()
-        if not success:
-            break
-        if frame_index % frame_interval == 0:
-            frames.append(frame)
-        frame_index += 1
-
-    video_capture.release()
-    return frames
+    return [frame for _, frame in iter_video_frames(video_path, frame_interval)]
 
-def detect_faces_from_frames(frames: list) -> list:
+def detect_faces_from_frames(frames: list, detector_backend: str = 'mtcnn') -> list:
     """
-    Detects faces in each frame using MTCNN and returns cropped face images.
+    Detects faces in each frame (MTCNN unless another backend is given) and returns cropped face images.
     """
-    face_detector = MTCNN()
-    cropped_faces = []
-
-    for frame in frames:
-        detections = face_detector.detect_faces(frame)
-        for detection in detections:
-            x, y, width, height = detection['box']
-            face = frame[y:y+height, x:x+width]
-            cropped_faces.append(face)
-
-    return cropped_faces
+    return [crop.image for crop in iter_face_crops(enumerate(frames), get_detector(detector_backend))]
 
 def generate_face_embedding(face_image: np.ndarray) -> np.ndarray | None:
     """
@@ -80,7 +70,54 @@ def save_student_embedding(student_id: int, embedding: np.ndarray) -> None:
         db.session.add(new_record)
         print(f"[INFO] Stored new embedding for student ID {student_id}")
 
+    record_embedding_change(student_id)
+    record_embedding_version(student_id)
     db.session.commit()
+    update_persisted_index(student_id, embedding)
+
+def save_student_embeddings(embeddings: dict, uploaded_at: datetime | None = None) -> dict:
+    """
+    Upserts many students' embeddings in one transaction and one on-disk index update.
+    uploaded_at, if given, is stamped as each saved student's last_video_uploaded_at.
+    Returns {student_id: error} for the entries that were not saved. If the commit fails,
+    the session is rolled back and the error re-raised; nothing in the batch is saved.
+    """
+    errors = {}
+    valid = {}
+    for student_id, embedding in embeddings.items():
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.shape != (128,):
+            errors[student_id] = f"invalid embedding shape {embedding.shape}, expected (128,)"
+        else:
+            valid[student_id] = embedding
+
+    ids = list(valid)
+    students = {student.student_id: student for student in Student.query.filter(Student.student_id.in_(ids))}
+    existing = {row.student_id: row for row in StudentEmbedding.query.filter(StudentEmbedding.student_id.in_(ids))}
+    saved = []
+    for student_id, embedding in valid.items():
+        if student_id not in students:
+            errors[student_id] = "no such student"
+            continue
+        if student_id in existing:
+            existing[student_id].embedding = embedding.tobytes()
+        else:
+            db.session.add(StudentEmbedding(student_id=student_id, embedding=embedding.tobytes()))
+        if uploaded_at is not None:
+            students[student_id].last_video_uploaded_at = uploaded_at
+        record_embedding_change(student_id)
+        record_embedding_version(student_id)
+        saved.append(student_id)
+
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if saved:
+        add_to_persisted_index(saved, np.vstack([valid[student_id] for student_id in saved]))
+    print(f"[INFO] Saved embeddings for {len(saved)} students ({len(errors)} rejected)")
+    return errors
 
 def list_registered_students() -> list:
     """
@@ -88,27 +125,153 @@ def list_registered_students() -> list:
     """
     return [entry.student.name for entry in StudentEmbedding.query.all()]
 
-def register_student_from_video(student_id: int, video_path: str) -> None:
+class RunningMeanEmbedding:
+    """
+    Mean of the embeddings seen so far, updated batch by batch in constant memory.
+    """
+
+    def __init__(self, dim: int = 128):
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+
+    def update(self, embeddings: np.ndarray) -> float:
+        """
+        Folds a (n, dim) batch into the mean and returns how far the mean's direction
+        moved, as cosine distance (1.0 for the first batch).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float64).reshape(-1, self.mean.shape[0])
+        if not len(embeddings):
+            return 0.0
+        previous = self.mean.copy()
+        self.count += len(embeddings)
+        self.mean += (embeddings.sum(axis=0) - len(embeddings) * previous) / self.count
+        previous_norm, norm = np.linalg.norm(previous), np.linalg.norm(self.mean)
+        if previous_norm == 0 or norm == 0:
+            return 1.0
+        return float(1.0 - previous @ self.mean / (previous_norm * norm))
+
+
+@dataclass
+class RegistrationResult:
+    embedding: np.ndarray | None = None
+    faces_embedded: int = 0
+    faces_dropped: int = 0
+    frames_processed: int = 0
+    total_frames: int = 0
+    last_frame_index: int = -1
+    converged: bool = False
+
+    @property
+    def fraction_processed(self) -> float:
+        if not self.converged or not self.total_frames:
+            return 1.0
+        return min(1.0, (self.last_frame_index + 1) / self.total_frames)
+
+
+def stream_student_embedding(video_path: str, frame_interval: int = 5, motion: MotionSampling | None = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE,
+                             tolerance: float | None = 1e-4, min_faces: int = 20, patience: int = 2,
+                             quality: QualityThresholds | None = None, detector_backend: str = 'mtcnn',
+                             detector_model_path: str | None = None, progress=None) -> RegistrationResult:
+    """
+    Builds a student's average embedding from a video without holding frames, crops or
+    embeddings in memory: each embedding batch is folded into a running mean.
+    Decoding stops once at least min_faces faces are in and the mean has moved less
+    than tolerance (cosine distance) for patience batches in a row; tolerance=None reads the whole video.
+    quality, if given, keeps poor crops out of the mean; motion, if given, replaces the
+    fixed frame_interval with motion-adaptive sampling (see app.ml.sampling).
+    progress, if given, is called as progress(step_message, percent) with percent in [25, 90].
+    """
+    result = RegistrationResult(total_frames=video_frame_count(video_path))
+    running = RunningMeanEmbedding()
+    stats = ExtractionStats()
+    steady_batches = 0
+
+    batches = iter_video_embeddings(video_path, stats, frame_interval=frame_interval, motion=motion, quality=quality,
+                                    detector_backend=detector_backend, detector_model_path=detector_model_path,
+                                    batch_size=batch_size)
+    try:
+        for _, embeddings in batches:
+            shift = running.update(embeddings)
+            steady_batches = steady_batches + 1 if tolerance is not None and shift < tolerance else 0
+
+            if progress and result.total_frames:
+                done = min(1.0, (stats.last_frame_index + 1) / result.total_frames)
+                progress(f"🧠 Embedding faces ({running.count} so far)...", 25 + int(65 * done))
+
+            if running.count >= min_faces and steady_batches >= patience:
+                result.converged = True
+                break
+    finally:
+        batches.close()
+
+    result.faces_embedded = running.count
+    result.faces_dropped = stats.faces_dropped
+    result.frames_processed = stats.frames_processed
+    result.last_frame_index = stats.last_frame_index
+    if running.count:
+        result.embedding = running.mean.astype(np.float32)
+    print(f"[INFO] Embedded {result.faces_embedded} faces from {result.frames_processed} frames "
+          f"({result.fraction_processed:.0%} of the video, converged={result.converged}).")
+    if stats.dropped_by_reason:
+        print(f"[INFO] Quality gate dropped {stats.faces_dropped} crops: {stats.dropped_by_reason}")
+    return result
+
+
+def photo_student_embedding(image_paths: list, batch_size: int = DEFAULT_BATCH_SIZE,
+                            quality: QualityThresholds | None = None, detector_backend: str = 'mtcnn',
+                            detector_model_path: str | None = None) -> RegistrationResult:
+    """
+    Builds a student's average embedding from still photos of them, using the most
+    confident face that passes the quality gate in each photo.
+    """
+    detector = get_detector(detector_backend, detector_model_path)
+    stats = ExtractionStats()
+
+    def best_crops():
+        for photo_index, path in enumerate(image_paths):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"[WARNING] Could not read photo: {path}")
+                continue
+            stats.frames_processed += 1
+            crops = filter_crops(detect_frame_crops(detector, photo_index, image), quality, stats.dropped_by_reason)
+            if crops:
+                yield max(crops, key=lambda crop: crop.confidence * crop.box[2] * crop.box[3])
+
+    running = RunningMeanEmbedding()
+    for _, embeddings in iter_embedding_batches(best_crops(), batch_size=batch_size):
+        running.update(embeddings)
+
+    result = RegistrationResult(
+        faces_embedded=running.count,
+        faces_dropped=stats.faces_dropped,
+        frames_processed=stats.frames_processed,
+        total_frames=len(image_paths),
+        last_frame_index=len(image_paths) - 1,
+    )
+    if running.count:
+        result.embedding = running.mean.astype(np.float32)
+    return result
+
+
+def register_student_from_video(student_id: int, video_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                                tolerance: float | None = 1e-4, min_faces: int = 20) -> None:
     """
     Registers a student by extracting face embeddings from a video.
+    Streams the video and stops once the average embedding has converged.
     """
     print(f"[PROCESS] Registering student ID {student_id} from video: {video_path}")
 
-    frames = extract_video_frames(video_path)
-    faces = detect_faces_from_frames(frames)
-    print(f"[INFO] Extracted {len(faces)} faces from the video.")
-
-    embeddings = [generate_face_embedding(face) for face in faces if face is not None]
-    embeddings = [e for e in embeddings if e is not None]
+    result = stream_student_embedding(video_path, batch_size=batch_size, tolerance=tolerance, min_faces=min_faces)
 
-    if not embeddings:
+    if result.embedding is None:
         print("[ERROR] No valid embeddings were extracted.")
         return
 
-    average_embedding = np.mean(embeddings, axis=0)
-    print(f"[INFO] Average embedding shape: {average_embedding.shape}")
+    print(f"[INFO] Average embedding shape: {result.embedding.shape}")
 
-    save_student_embedding(student_id, average_embedding)
+    save_student_embedding(student_id, result.embedding)
 
     registered_students = list_registered_students()
     print(f"[INFO] Registered Students: {registered_students}")
@@ -0,0 +1,150 @@
+"""
+On-disk cache of recognition outputs keyed by video content.
+
+Uploads are hashed while they are written to disk. A recognition run stores its
+per-face embeddings, boxes and matches under a key built from that hash, the
+gallery generation and the recognition options, so re-uploading the same video
+against an unchanged gallery skips the pipeline entirely. Entries are evicted
+least-recently-used first once the directory grows past its size budget; saved
+video artifacts (see app.ml.artifacts) share that budget.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+UPLOAD_CHUNK_SIZE = 1 << 20
+CACHE_DIRNAME = 'recognition_cache'
+
+_evict_lock = threading.Lock()
+
+
+def save_upload_hashed(file_storage, path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """
+    Streams an uploaded file to path and returns the SHA-256 of its contents,
+    so the upload is only read once.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as handle:
+        while True:
+            chunk = file_storage.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            handle.write(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash: str, **parts) -> str:
+    """
+    Key for one video under one gallery generation and set of recognition options.
+    """
+    payload = json.dumps({'content_hash': content_hash, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def evict_lru(directories: list, max_bytes: int) -> int:
+    """
+    Deletes the least recently used .npz files across directories until together they
+    fit in max_bytes; returns how many went.
+    """
+    with _evict_lock:
+        entries = []
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith('.npz'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+class RecognitionCache:
+    """
+    One .npz file per entry holding the per-face arrays plus a JSON summary.
+    Reads touch the file's mtime so eviction drops the least recently used entries.
+    Files in shared_directories count against the same budget and are evicted with the entries.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, shared_directories: tuple = ()):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.shared_directories = tuple(shared_directories)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str) -> tuple[dict, dict] | None:
+        """
+        Returns (arrays, summary) for key, or None on a miss or unreadable entry.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files if name != 'summary'}
+                summary = json.loads(str(data['summary']))
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return arrays, summary
+
+    def put(self, key: str, arrays: dict, summary: dict) -> None:
+        """
+        Writes the entry atomically, then evicts old entries past the size budget.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as handle:
+            np.savez(handle, summary=np.array(json.dumps(summary)), **arrays)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Deletes least recently used entries until the cache fits in max_bytes; returns how many went.
+        """
+        return evict_lru([self.directory, *self.shared_directories], self.max_bytes)
+
+
+def cache_from_config(config) -> RecognitionCache | None:
+    """
+    The cache configured for the app, or None when RECOGNITION_CACHE_MAX_MB is 0.
+    Saved video artifacts share its budget. Needs an app context to locate the default directories.
+    """
+    from app.ml.ann_index import data_directory
+    from app.ml.artifacts import artifacts_directory
+
+    if config['RECOGNITION_CACHE_MAX_MB'] <= 0:
+        return None
+    directory = config['RECOGNITION_CACHE_DIR'] or os.path.join(data_directory(), CACHE_DIRNAME)
+    shared = (artifacts_directory(),) if config['SAVE_VIDEO_ARTIFACTS'] else ()
+    return RecognitionCache(directory, int(config['RECOGNITION_CACHE_MAX_MB'] * 1024 * 1024), shared)
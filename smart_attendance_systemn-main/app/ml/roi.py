@@ -0,0 +1,67 @@
+"""
+Per-classroom regions of interest.
+
+A classroom camera usually sees more than the seats: the doorway, a corridor
+window, a poster. Each class can store an ROI polygon in normalized (0-1) frame
+coordinates, so one polygon fits every resolution the camera uploads at.
+Detection then runs only on the polygon's bounding rectangle, and faces whose
+centre falls outside the polygon itself are dropped.
+"""
+import json
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True)
+class RegionOfInterest:
+    polygon: tuple  # ((x, y), ...) as fractions of frame width and height
+
+    @classmethod
+    def from_points(cls, points) -> "RegionOfInterest":
+        """
+        Validates a list of [x, y] pairs in [0, 1]; raises ValueError otherwise.
+        """
+        try:
+            polygon = tuple((float(x), float(y)) for x, y in points)
+        except (TypeError, ValueError):
+            raise ValueError("ROI polygon must be a list of [x, y] pairs")
+        if len(polygon) < 3:
+            raise ValueError("ROI polygon needs at least 3 points")
+        if any(not (0.0 <= value <= 1.0) for point in polygon for value in point):
+            raise ValueError("ROI coordinates must be fractions of the frame size, between 0 and 1")
+        return cls(polygon)
+
+    def to_json(self) -> str:
+        return json.dumps([list(point) for point in self.polygon])
+
+    def pixel_polygon(self, width: int, height: int) -> np.ndarray:
+        return (np.asarray(self.polygon, dtype=np.float32) * np.float32([width, height])).reshape(-1, 1, 2)
+
+    def bounds(self, width: int, height: int, margin: int = 0) -> tuple[int, int, int, int]:
+        """
+        (x0, y0, x1, y1) pixel rectangle around the polygon, grown by margin pixels on
+        each side and clipped to the frame.
+        """
+        points = self.pixel_polygon(width, height).reshape(-1, 2)
+        x0, y0 = (int(value) - margin for value in np.floor(points.min(axis=0)))
+        x1, y1 = (int(value) + margin for value in np.ceil(points.max(axis=0)))
+        return max(0, x0), max(0, y0), min(width, x1), min(height, y1)
+
+    def contains(self, x: float, y: float, width: int, height: int) -> bool:
+        return cv2.pointPolygonTest(self.pixel_polygon(width, height), (float(x), float(y)), False) >= 0
+
+
+def load_class_roi(class_id: int | None) -> RegionOfInterest | None:
+    """
+    The stored ROI for a class, or None when it has none. Needs an app context.
+    """
+    from app.models import ClassROI
+
+    if class_id is None:
+        return None
+    row = ClassROI.query.get(class_id)
+    if row is None:
+        return None
+    return RegionOfInterest.from_points(json.loads(row.polygon))
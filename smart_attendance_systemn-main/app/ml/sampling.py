@@ -0,0 +1,177 @@
+"""
+Frame samplers for OpenCV video readers.
+
+Skipped frames are advanced with grab(), which demuxes without decoding or
+colour-converting; only kept frames pay for retrieve(). Keyframe mode seeks
+straight to each target frame instead of reading through the gap. Motion mode
+adapts the interval to how much the scene changed between kept frames.
+"""
+import math
+from dataclasses import dataclass
+from typing import Iterator
+
+import cv2
+import numpy as np
+
+# Past this many frames, a seek is cheaper than grabbing through the gap.
+SEEK_THRESHOLD = 120
+
+
+@dataclass(frozen=True)
+class MotionSampling:
+    min_interval: int = 2      # frames between samples while the scene is changing
+    max_interval: int = 30     # ceiling for the interval once the scene is static
+    threshold: float = 0.005   # fraction of thumbnail pixels that must change for the scene to count as moving
+    pixel_delta: int = 25      # grey-level change (0-255) for a pixel to count as changed, above compression noise
+    probe_width: int = 64      # width of the grey thumbnail the change is measured on
+
+
+def motion_sampling_from_config(config) -> MotionSampling | None:
+    """
+    The sampler configured for the app, or None when MOTION_SAMPLING is off.
+    """
+    if not config['MOTION_SAMPLING']:
+        return None
+    return MotionSampling(
+        min_interval=config['MOTION_MIN_INTERVAL'],
+        max_interval=config['MOTION_MAX_INTERVAL'],
+        threshold=config['MOTION_THRESHOLD'],
+    )
+
+
+def motion_probe(frame: np.ndarray, width: int) -> np.ndarray:
+    """
+    Small greyscale thumbnail of a frame; resized before the colour conversion so both are cheap.
+    """
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+def changed_fraction(previous: np.ndarray, current: np.ndarray, pixel_delta: int) -> float:
+    return float(np.count_nonzero(cv2.absdiff(previous, current) > pixel_delta)) / current.size
+
+
+def _video_properties(video_capture) -> tuple[int, float]:
+    frame_count = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    fps = float(video_capture.get(cv2.CAP_PROP_FPS) or 0.0)
+    return frame_count, fps if fps > 0 else 30.0
+
+
+def _seek(video_capture, frame_index: int) -> None:
+    if frame_index > 0:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+
+def _iter_by_interval(video_capture, frame_interval: int, start_frame: int,
+                      end_frame: int | None) -> Iterator[tuple[int, np.ndarray]]:
+    frame_interval = max(1, frame_interval)
+    _seek(video_capture, start_frame)
+    frame_index = start_frame
+    while (end_frame is None or frame_index < end_frame) and video_capture.grab():
+        if frame_index % frame_interval == 0:
+            success, frame = video_capture.retrieve()
+            if not success:
+                break
+            yield frame_index, frame
+        frame_index += 1
+
+
+def _iter_by_time(video_capture, frames_per_second: float, fps: float, start_frame: int,
+                  end_frame: int | None) -> Iterator[tuple[int, np.ndarray]]:
+    step = max(1.0, fps / frames_per_second) if frames_per_second > 0 else 1.0
+    # Sample n is the first frame at or after n * step, so a segment starting at
+    # start_frame lands on the same grid as a pass from frame 0.
+    sample_number = math.ceil(start_frame / step - 1e-9)
+    _seek(video_capture, start_frame)
+    frame_index = start_frame
+    while (end_frame is None or frame_index < end_frame) and video_capture.grab():
+        if frame_index >= sample_number * step - 1e-9:
+            success, frame = video_capture.retrieve()
+            if not success:
+                break
+            yield frame_index, frame
+            sample_number = math.floor(frame_index / step + 1e-9) + 1
+        frame_index += 1
+
+
+def _iter_by_motion(video_capture, motion: MotionSampling, start_frame: int,
+                    end_frame: int | None) -> Iterator[tuple[int, np.ndarray]]:
+    # After each kept frame the interval drops to min_interval if the scene changed
+    # since the previous kept frame, and doubles (up to max_interval) if it did not.
+    min_interval = max(1, motion.min_interval)
+    max_interval = max(min_interval, motion.max_interval)
+    _seek(video_capture, start_frame)
+    frame_index = next_index = start_frame
+    interval = min_interval
+    previous = None
+    while (end_frame is None or frame_index < end_frame) and video_capture.grab():
+        if frame_index >= next_index:
+            success, frame = video_capture.retrieve()
+            if not success:
+                break
+            probe = motion_probe(frame, motion.probe_width)
+            if previous is None or changed_fraction(previous, probe, motion.pixel_delta) >= motion.threshold:
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * 2)
+            previous = probe
+            yield frame_index, frame
+            next_index = frame_index + interval
+        frame_index += 1
+
+
+def _iter_keyframes(video_capture, num_keyframes: int, frame_count: int, start_frame: int,
+                    end_frame: int | None) -> Iterator[tuple[int, np.ndarray]]:
+    if frame_count <= 0 or num_keyframes <= 0:
+        return
+    targets = np.unique(np.linspace(0, frame_count - 1, num=min(num_keyframes, frame_count)).astype(int))
+    targets = targets[(targets >= start_frame) & (targets < (end_frame if end_frame is not None else frame_count))]
+
+    position = 0
+    for target in targets:
+        if target - position > SEEK_THRESHOLD:
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, int(target))
+            position = int(target)
+        while position < target:
+            if not video_capture.grab():
+                return
+            position += 1
+
+        success, frame = video_capture.read()
+        if not success:
+            return
+        position += 1
+        yield int(target), frame
+
+
+def iter_sampled_frames(video_path: str, frame_interval: int = 5, frames_per_second: float | None = None,
+                        num_keyframes: int | None = None, start_frame: int = 0,
+                        end_frame: int | None = None,
+                        motion: MotionSampling | None = None) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Yields (frame_index, frame) pairs using one of four modes, in order of precedence:
+    num_keyframes frames spread evenly over the whole video, frames_per_second
+    samples per second of video time, motion-adaptive sampling (dense while the
+    scene changes, sparse while it is static), or every frame_interval-th frame
+    (default).
+    start_frame/end_frame restrict sampling to [start_frame, end_frame); the fixed
+    modes keep the same sample grid as a pass over the whole video.
+    """
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        if not video_capture.isOpened():
+            print(f"[ERROR] Could not open video: {video_path}")
+            return
+
+        frame_count, fps = _video_properties(video_capture)
+        if num_keyframes:
+            yield from _iter_keyframes(video_capture, num_keyframes, frame_count, start_frame, end_frame)
+        elif frames_per_second:
+            yield from _iter_by_time(video_capture, frames_per_second, fps, start_frame, end_frame)
+        elif motion:
+            yield from _iter_by_motion(video_capture, motion, start_frame, end_frame)
+        else:
+            yield from _iter_by_interval(video_capture, frame_interval, start_frame, end_frame)
+    finally:
+        video_capture.release()
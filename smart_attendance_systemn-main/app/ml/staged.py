@@ -0,0 +1,298 @@
+"""
+Threaded staged pipeline: decode -> detect -> track/batch -> embed.
+
+Each stage runs on its own thread(s) and hands work to the next through a
+bounded queue, so decoding, MTCNN and Facenet overlap instead of taking
+turns. The shared MTCNN and Facenet models serialise their own calls (see
+app.ml.detectors and app.ml.embedding), so extra detect or embed threads
+overlap pre- and post-processing with inference; the OpenCV detectors keep
+one model per thread and scale with detect threads. Per-stage busy time and
+queue depth are recorded so the slowest stage is visible in the run report.
+Frame counts in the ExtractionStats advance as embedded batches are consumed,
+not as frames are decoded, so an early stop reports only frames it acted on.
+"""
+import queue
+import threading
+import time
+from typing import Iterator
+
+import numpy as np
+
+from app.ml.embedding import generate_face_embeddings, DEFAULT_BATCH_SIZE
+from app.ml.model_registry import get_detector
+from app.ml.quality import QualityThresholds, filter_crops
+from app.ml.roi import RegionOfInterest
+from app.ml.sampling import MotionSampling
+from app.ml.pipeline import ExtractionStats, iter_video_frames, detect_frame_crops, detection_scale_for
+from app.ml.tracking import IoUTracker
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str, threads: int):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.queue_samples = 0
+        self.queue_depth_total = 0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def record(self, busy_seconds: float, out_queue: queue.Queue | None = None) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += busy_seconds
+            if out_queue is not None:
+                depth = out_queue.qsize()
+                self.queue_samples += 1
+                self.queue_depth_total += depth
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def summary(self, wall_seconds: float) -> dict:
+        return {
+            'threads': self.threads,
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'utilization': round(self.busy_seconds / (wall_seconds * self.threads), 3) if wall_seconds else 0.0,
+            'mean_out_queue_depth': round(self.queue_depth_total / self.queue_samples, 2) if self.queue_samples else 0.0,
+            'max_out_queue_depth': self.max_queue_depth,
+        }
+
+
+class StagedPipeline:
+    """
+    Runs one video through the stages on background threads. Iterate run() for
+    (crops, embeddings) batches; report() gives per-stage utilisation afterwards.
+    Batches from several embed threads may arrive out of frame order.
+    """
+
+    def __init__(self, video_path: str, stats: ExtractionStats | None = None, detect_threads: int = 2,
+                 embed_threads: int = 1, queue_size: int = 8, frame_interval: int = 5,
+                 frames_per_second: float | None = None, num_keyframes: int | None = None,
+                 motion: MotionSampling | None = None, detection_scale: float | None = None, min_face_size: int | None = None,
+                 crops_per_track: int | None = None, quality: QualityThresholds | None = None,
+                 detector_backend: str = 'mtcnn', detector_model_path: str | None = None,
+                 roi: RegionOfInterest | None = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.video_path = video_path
+        self.stats = stats if stats is not None else ExtractionStats()
+        self.detect_threads = max(1, detect_threads)
+        self.embed_threads = max(1, embed_threads)
+        self.sampling = (frame_interval, frames_per_second, num_keyframes)
+        self.motion = motion
+        self.scale = detection_scale or detection_scale_for(min_face_size)
+        self.crops_per_track = crops_per_track
+        self.quality = quality
+        self.detector = (detector_backend, detector_model_path)
+        self.roi = roi
+        self.batch_size = max(1, batch_size)
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.detections = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+
+        self.stage_stats = {
+            'decode': StageStats('decode', 1),
+            'detect': StageStats('detect', self.detect_threads),
+            'batch': StageStats('batch', 1),
+            'embed': StageStats('embed', self.embed_threads),
+        }
+        self._stop = threading.Event()
+        self._final_progress = None  # (frames, last frame index) once the batch stage has seen every frame
+        self._errors = []
+        self._started = None
+        self._finished = None
+
+    # -- queue helpers that give up once the pipeline is stopping --
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _guard(self, stage):
+        def run():
+            try:
+                stage()
+            except Exception as error:
+                self._errors.append(error)
+                self._stop.set()
+        return run
+
+    # -- stages --
+
+    def _decode(self) -> None:
+        frames = iter_video_frames(self.video_path, *self.sampling, motion=self.motion)
+        try:
+            sequence = 0
+            while True:
+                started = time.perf_counter()
+                item = next(frames, None)
+                if item is None:
+                    break
+                self.stage_stats['decode'].record(time.perf_counter() - started, self.frames)
+                if not self._put(self.frames, (sequence, *item)):
+                    return
+                sequence += 1
+        finally:
+            frames.close()
+            for _ in range(self.detect_threads):
+                self._put(self.frames, _DONE)
+
+    def _detect(self) -> None:
+        detector = get_detector(*self.detector)
+        while True:
+            item = self._get(self.frames)
+            if item is _DONE:
+                self._put(self.detections, _DONE)
+                return
+            sequence, frame_index, frame = item
+            started = time.perf_counter()
+            crops = detect_frame_crops(detector, frame_index, frame, self.scale, self.roi)
+            self.stage_stats['detect'].record(time.perf_counter() - started, self.detections)
+            if not self._put(self.detections, (sequence, frame_index, crops)):
+                return
+
+    def _batch(self) -> None:
+        """
+        Restores frame order (detect threads finish out of order), runs the tracker
+        and cuts the crop stream into embedding batches. Each batch carries the
+        (frames, last frame index) fully handed on before it, for the stats.
+        """
+        tracker = IoUTracker(crops_per_track=self.crops_per_track) if self.crops_per_track else None
+        waiting, next_sequence, finished_detectors = {}, 0, 0
+        pending = []
+        progress = (0, -1)
+
+        def emit(crops):
+            pending.extend(crops)
+            while len(pending) >= self.batch_size:
+                if not self._put(self.batches, (progress, pending[:self.batch_size])):
+                    return False
+                del pending[:self.batch_size]
+            return True
+
+        try:
+            while finished_detectors < self.detect_threads:
+                item = self._get(self.detections)
+                if item is _DONE:
+                    if self._stop.is_set():
+                        return
+                    finished_detectors += 1
+                    continue
+                sequence, frame_index, crops = item
+                waiting[sequence] = (frame_index, crops)
+                while next_sequence in waiting:
+                    started = time.perf_counter()
+                    frame_index, frame_crops = waiting.pop(next_sequence)
+                    self.stats.faces_detected += len(frame_crops)
+                    frame_crops = filter_crops(frame_crops, self.quality, self.stats.dropped_by_reason)
+                    released = tracker.update(frame_crops) if tracker else frame_crops
+                    self.stage_stats['batch'].record(time.perf_counter() - started, self.batches)
+                    if not emit(released):
+                        return
+                    next_sequence += 1
+                    progress = (next_sequence, frame_index)
+
+            if tracker:
+                emit(tracker.flush())
+                self.stats.tracks = tracker.tracks_started
+            if pending:
+                self._put(self.batches, (progress, list(pending)))
+            self._final_progress = progress
+        finally:
+            for _ in range(self.embed_threads):
+                self._put(self.batches, _DONE)
+
+    def _embed(self) -> None:
+        while True:
+            item = self._get(self.batches)
+            if item is _DONE:
+                self._put(self.results, _DONE)
+                return
+            progress, crops = item
+            started = time.perf_counter()
+            embeddings = generate_face_embeddings([crop.image for crop in crops], batch_size=self.batch_size)
+            kept = [(crop, emb) for crop, emb in zip(crops, embeddings) if emb is not None]
+            self.stage_stats['embed'].record(time.perf_counter() - started, self.results)
+            if not kept:
+                batch = ([], None)
+            else:
+                batch = ([crop for crop, _ in kept], np.vstack([emb for _, emb in kept]))
+            if not self._put(self.results, (progress, batch)):
+                return
+
+    def _consumed(self, progress: tuple[int, int]) -> None:
+        """
+        Advances the frame stats to a batch's progress; batches from several embed
+        threads can arrive out of order, so counts only ever move forward.
+        """
+        frames, last_frame_index = progress
+        self.stats.frames_processed = max(self.stats.frames_processed, frames)
+        self.stats.last_frame_index = max(self.stats.last_frame_index, last_frame_index)
+
+    # -- driver --
+
+    def run(self) -> Iterator[tuple[list, np.ndarray]]:
+        self._started = time.perf_counter()
+        threads = [threading.Thread(target=self._guard(self._decode), name='stage-decode', daemon=True)]
+        threads += [threading.Thread(target=self._guard(self._detect), name=f'stage-detect-{i}', daemon=True)
+                    for i in range(self.detect_threads)]
+        threads.append(threading.Thread(target=self._guard(self._batch), name='stage-batch', daemon=True))
+        threads += [threading.Thread(target=self._guard(self._embed), name=f'stage-embed-{i}', daemon=True)
+                    for i in range(self.embed_threads)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            finished_embedders = 0
+            while finished_embedders < self.embed_threads:
+                item = self._get(self.results)
+                if item is _DONE:
+                    if self._stop.is_set():
+                        break
+                    finished_embedders += 1
+                    continue
+                progress, (crops, embeddings) = item
+                self._consumed(progress)
+                if crops:
+                    yield crops, embeddings
+            else:
+                if self._final_progress is not None:
+                    self._consumed(self._final_progress)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            self._finished = time.perf_counter()
+            print(f"[INFO] Pipeline stages: {self.report()}")
+
+        if self._errors:
+            raise self._errors[0]
+
+    def report(self) -> dict:
+        wall = ((self._finished or time.perf_counter()) - self._started) if self._started else 0.0
+        return {name: stage.summary(wall) for name, stage in self.stage_stats.items()}
+
+
+def iter_staged_embeddings(video_path: str, stats: ExtractionStats | None = None, detect_threads: int = 2,
+                           embed_threads: int = 1, **options) -> Iterator[tuple[list, np.ndarray]]:
+    """
+    Same contract as pipeline.iter_video_embeddings, backed by a StagedPipeline.
+    """
+    yield from StagedPipeline(video_path, stats, detect_threads=detect_threads, embed_threads=embed_threads,
+                              **options).run()
@@ -0,0 +1,181 @@
+"""
+IoU face tracker. Detections in consecutive sampled frames whose boxes
+overlap and whose crops look alike are chained into tracks, and only the best
+few crops of each stretch of a track are passed on to the embedder.
+"""
+import heapq
+import itertools
+from typing import Iterable, Iterator
+
+import cv2
+import numpy as np
+
+SIGNATURE_SIZE = 16
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU between (n, 4) and (m, 4) arrays of (x, y, width, height) boxes.
+    """
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax1, ay1, ax2, ay2 = a[:, 0:1], a[:, 1:2], a[:, 0:1] + a[:, 2:3], a[:, 1:2] + a[:, 3:4]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def appearance_signature(image: np.ndarray) -> np.ndarray:
+    """
+    Tiny colour thumbnail of a crop, zero-mean and unit-length, so the dot product of
+    two signatures is their normalised correlation. Empty or flat crops give a zero vector.
+    """
+    if image is None or image.size == 0:
+        return np.zeros(SIGNATURE_SIZE * SIGNATURE_SIZE * 3, dtype=np.float32)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    thumbnail = cv2.resize(image, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    vector = thumbnail.astype(np.float32).reshape(-1)
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def crop_quality(crop) -> float:
+    """
+    Detector confidence weighted by the crop's shorter side, so larger, surer faces win.
+    """
+    return crop.confidence * min(crop.box[2], crop.box[3])
+
+
+class FaceTrack:
+    def __init__(self, track_id: int, crop, crops_per_track: int):
+        self.track_id = track_id
+        self.crops_per_track = crops_per_track
+        self.hits = 0
+        self.pending_hits = 0  # hits since the track last released crops
+        self.missed = 0
+        self._best = []  # min-heap of (quality, tiebreak, crop) since the last release
+        self._tiebreak = itertools.count()
+        self.add(crop)
+
+    def add(self, crop) -> None:
+        crop.track_id = self.track_id
+        self.last_box = crop.box
+        self.signature = appearance_signature(crop.image)
+        self.hits += 1
+        self.pending_hits += 1
+        self.missed = 0
+        entry = (crop_quality(crop), next(self._tiebreak), crop)
+        if len(self._best) < self.crops_per_track:
+            heapq.heappush(self._best, entry)
+        elif entry[0] > self._best[0][0]:
+            heapq.heapreplace(self._best, entry)
+
+    def best_crops(self) -> list:
+        return [crop for _, _, crop in sorted(self._best, key=lambda entry: -entry[0])]
+
+    def take_best_crops(self) -> list:
+        """
+        The best crops since the last release; the track then starts collecting afresh.
+        """
+        crops = self.best_crops()
+        self._best = []
+        self.pending_hits = 0
+        return crops
+
+
+class IoUTracker:
+    """
+    Greedy association between the live tracks and each new frame's detections:
+    pairs must overlap by iou_threshold and their crops' appearance signatures must
+    correlate by at least min_appearance, so someone else sitting down in the same
+    spot starts a new track. Every emit_after_hits hits a track releases the best
+    crops seen since its last release, so a long track is retried with later, possibly
+    better views; the remainder is released once the track has gone max_missed sampled
+    frames without a detection.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 2, crops_per_track: int = 3,
+                 emit_after_hits: int | None = 10, min_appearance: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.crops_per_track = max(1, crops_per_track)
+        self.emit_after_hits = emit_after_hits
+        self.min_appearance = min_appearance
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.detections_seen = 0
+        self.tracks_started = 0
+
+    def _affinity(self, crops: list) -> np.ndarray:
+        ious = box_iou([track.last_box for track in self.tracks], [crop.box for crop in crops])
+        if self.min_appearance is None:
+            return ious
+        track_signatures = np.stack([track.signature for track in self.tracks])
+        crop_signatures = np.stack([appearance_signature(crop.image) for crop in crops])
+        # Flat or empty crops have no signature and are associated on IoU alone.
+        blank = (~track_signatures.any(axis=1))[:, None] | (~crop_signatures.any(axis=1))[None, :]
+        alike = blank | (track_signatures @ crop_signatures.T >= self.min_appearance)
+        return np.where(alike, ious, 0.0)
+
+    def update(self, crops: list) -> list:
+        """
+        Feeds one sampled frame's detections (possibly none) and returns crops
+        released by the tracks this frame.
+        """
+        self.detections_seen += len(crops)
+        matched_tracks, unmatched = set(), set(range(len(crops)))
+        if self.tracks and crops:
+            affinity = self._affinity(crops)
+            for flat in np.argsort(-affinity, axis=None):
+                track_index, crop_index = np.unravel_index(flat, affinity.shape)
+                if affinity[track_index, crop_index] < self.iou_threshold:
+                    break
+                if track_index in matched_tracks or crop_index not in unmatched:
+                    continue
+                self.tracks[track_index].add(crops[crop_index])
+                matched_tracks.add(track_index)
+                unmatched.discard(crop_index)
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                track.missed += 1
+        for crop_index in sorted(unmatched):
+            self.tracks.append(FaceTrack(next(self._ids), crops[crop_index], self.crops_per_track))
+            self.tracks_started += 1
+
+        released, live = [], []
+        for track in self.tracks:
+            if track.missed > self.max_missed:
+                released.extend(track.take_best_crops())
+                continue
+            if self.emit_after_hits and track.pending_hits >= self.emit_after_hits:
+                released.extend(track.take_best_crops())
+            live.append(track)
+        self.tracks = live
+        return released
+
+    def flush(self) -> list:
+        """
+        Releases what every remaining track has collected since its last release.
+        """
+        released = [crop for track in self.tracks for crop in track.take_best_crops()]
+        self.tracks = []
+        return released
+
+
+def iter_tracked_crops(frame_detections: Iterable[tuple[int, list]], tracker: IoUTracker | None = None) -> Iterator:
+    """
+    Runs the tracker over (frame_index, crops) pairs, as yielded by
+    pipeline.iter_frame_detections, and yields only the best crops of each track.
+    Frames without detections must be included so tracks age correctly.
+    """
+    tracker = tracker or IoUTracker()
+    for _, crops in frame_detections:
+        yield from tracker.update(crops)
+    yield from tracker.flush()
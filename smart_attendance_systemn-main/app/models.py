@@ -1,4 +1,5 @@
 from . import db
+from datetime import datetime
 from flask_login import UserMixin
 
 # ------------------ Class Table ------------------
@@ -93,4 +94,62 @@ class StudentEmbedding(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('student.student_id'), primary_key=True)
     embedding = db.Column(db.LargeBinary, nullable=False)
 
-    student = db.relationship('Student', back_populates='embedding')
\ No newline at end of file
+    student = db.relationship('Student', back_populates='embedding')
+
+
+# ------------------ Embedding Change Log Table ------------------
+class EmbeddingChange(db.Model):
+    __tablename__ = 'embedding_changes'
+    change_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    student_id = db.Column(db.Integer, nullable=False, index=True)  # no FK: rows outlive deleted students
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# ------------------ Embedding Pipeline Version Table ------------------
+class StudentEmbeddingVersion(db.Model):
+    __tablename__ = 'student_embedding_versions'
+    student_id = db.Column(db.Integer, primary_key=True)  # no FK, like embedding_changes
+    version = db.Column(db.Integer, nullable=False)  # app.ml.embedding.EMBEDDING_VERSION that produced the row
+
+
+# ------------------ Recognition Jobs Table ------------------
+class RecognitionJob(db.Model):
+    __tablename__ = 'recognition_jobs'
+    job_id = db.Column(db.String(32), primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.teacher_id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.class_id'), nullable=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.subject_id'), nullable=True)
+    periods = db.Column(db.String(50), nullable=True)
+    date = db.Column(db.String(10), nullable=True)  # "YYYY-MM-DD", as submitted by the upload form
+    video_path = db.Column(db.String(255), nullable=False)
+    detector_backend = db.Column(db.String(16), nullable=True)  # chosen on the upload form; None uses DETECTOR_BACKEND
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON: recognized ids and run statistics
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+# ------------------ Classroom ROI Table ------------------
+class ClassROI(db.Model):
+    __tablename__ = 'class_rois'
+    class_id = db.Column(db.Integer, db.ForeignKey('class.class_id'), primary_key=True)
+    polygon = db.Column(db.Text, nullable=False)  # JSON [[x, y], ...] as fractions of frame width/height
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ------------------ Batch Attendance Ledger Table ------------------
+class BatchAttendanceItem(db.Model):
+    __tablename__ = 'batch_attendance_items'
+    item_key = db.Column(db.String(64), primary_key=True)  # sha256 of the video content hash, class, subject, date, periods
+    video_path = db.Column(db.String(255), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.class_id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.subject_id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    periods = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(16), nullable=False)  # done, failed
+    present = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(255), nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
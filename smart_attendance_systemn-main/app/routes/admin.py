@@ -1,6 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
-from app.models import db, Teacher, Student, Class, Subject, AttendanceLog, AttendanceSummary
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from app.models import db, Teacher, Student, Class, Subject, AttendanceLog, AttendanceSummary, StudentEmbedding, ClassROI, StudentEmbeddingVersion
+from app.ml.gallery import record_embedding_change
+from app.ml.ann_index import update_persisted_index
 import csv
+import json
 from app.routes import role_required
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -20,6 +23,13 @@ def dashboard():
     subjects = Subject.query.all()
     return render_template('admin/dashboard.html', teachers=teachers, students=students, classes=classes, subjects=subjects)
 
+# ---------- ML Model Load/Warm-up Timings ----------
+@admin_bp.route('/model_metrics')
+@role_required('admin')
+def model_metrics():
+    from app.ml.model_registry import model_metrics as registry_metrics
+    return jsonify(registry_metrics())
+
 # ---------- Manual Upload via Form (/upload_csv) ----------
 @admin_bp.route('/upload_csv', methods=['GET', 'POST'])
 @role_required('admin')
@@ -52,6 +62,7 @@ def manual_csv_upload():
                         profile_pic='default.jpg'
                     )
                     db.session.merge(student)
+                    record_embedding_change(int(student_id))  # class may have changed
                     inserted += 1
 
                     #  Retrieve all subjects for the class
@@ -140,6 +151,35 @@ def view_classes():
     classes = Class.query.all()
     return render_template('admin/view_classes.html', classes=classes)
 
+# Classroom camera ROI: GET returns it, POST {"polygon": [[x, y], ...]} in 0-1 frame coordinates sets it, DELETE clears it
+@admin_bp.route('/classes/<int:class_id>/roi', methods=['GET', 'POST', 'DELETE'])
+@role_required('admin')
+def class_roi(class_id):
+    from app.ml.roi import RegionOfInterest
+
+    Class.query.get_or_404(class_id)
+    row = ClassROI.query.get(class_id)
+
+    if request.method == 'DELETE':
+        if row:
+            db.session.delete(row)
+            db.session.commit()
+        return jsonify({'class_id': class_id, 'polygon': None})
+
+    if request.method == 'POST':
+        try:
+            roi = RegionOfInterest.from_points((request.get_json(silent=True) or {}).get('polygon'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if row is None:
+            row = ClassROI(class_id=class_id, polygon=roi.to_json())
+            db.session.add(row)
+        else:
+            row.polygon = roi.to_json()
+        db.session.commit()
+
+    return jsonify({'class_id': class_id, 'polygon': json.loads(row.polygon) if row else None})
+
 # View Subjects
 @admin_bp.route('/subjects')
 @role_required('admin')
@@ -251,9 +291,15 @@ def delete_student(student_id):
     # Optionally, also delete from AttendanceSummary table
     AttendanceSummary.query.filter_by(student_id=student_id).delete()
 
+    # Drop the face embedding and bump the gallery generation so cached galleries forget it
+    if StudentEmbedding.query.filter_by(student_id=student_id).delete():
+        record_embedding_change(student_id)
+    StudentEmbeddingVersion.query.filter_by(student_id=student_id).delete()
+
     # Delete the student
     db.session.delete(student)
     db.session.commit()
+    update_persisted_index(student_id, None)
 
     flash("Student and associated attendance records deleted successfully!", "success")
     return redirect(url_for('admin.view_students'))
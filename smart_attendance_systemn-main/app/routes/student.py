@@ -1,11 +1,10 @@
 # student.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 import os
 from app import db
 from app.models import Student, AttendanceSummary, Subject
 from app.routes import role_required
-import numpy as np
 import json
 from flask import Response, stream_with_context
 import queue
@@ -102,27 +101,29 @@ def upload_video():
         send_progress(current_user.student_id, "📥 Video uploaded successfully", 5)
         try:
             import app.ml.register as reg
-
-            send_progress(current_user.student_id, "🎞️ Extracting frames from video...", 25)
-            frames = reg.extract_video_frames(filepath)
-
-            send_progress(current_user.student_id, "🔍 Detecting faces in frames...", 55)
-            faces = reg.detect_faces_from_frames(frames)
-
-            send_progress(current_user.student_id, "🧠 Generating face embeddings...", 75)
-            embeddings = [reg.generate_face_embedding(face) for face in faces if face is not None]
-            embeddings = [e for e in embeddings if e is not None]
-
-            if not embeddings:
+            from app.ml.quality import thresholds_from_config
+            from app.ml.sampling import motion_sampling_from_config
+
+            send_progress(current_user.student_id, "🎞️ Processing video...", 25)
+            result = reg.stream_student_embedding(
+                filepath,
+                batch_size=current_app.config['EMBEDDING_BATCH_SIZE'],
+                tolerance=current_app.config['REGISTRATION_CONVERGENCE_TOLERANCE'],
+                min_faces=current_app.config['REGISTRATION_MIN_FACES'],
+                quality=thresholds_from_config(current_app.config),
+                motion=motion_sampling_from_config(current_app.config),
+                detector_backend=current_app.config['DETECTOR_BACKEND'],
+                detector_model_path=current_app.config['DETECTOR_MODEL_PATH'],
+                progress=lambda step, percent: send_progress(current_user.student_id, step, percent),
+            )
+
+            if result.embedding is None:
                 send_progress(current_user.student_id, "❌ No valid face embeddings found. Please try again.", 100)
                 flash("No valid face embeddings found. Please try again.", "danger")
                 return redirect(url_for('student.dashboard'))
 
-            send_progress(current_user.student_id, "📊 Calculating average embedding...", 90)
-            average_embedding = np.mean(embeddings, axis=0)
-
             send_progress(current_user.student_id, "💾 Saving data to database...", 95)
-            reg.save_student_embedding(current_user.student_id, average_embedding)
+            reg.save_student_embedding(current_user.student_id, result.embedding)
 
             # ✅ Save upload info in IST
             ist = pytz.timezone('Asia/Kolkata')
@@ -1,10 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 import os
 from app import db
-from app.models import Teacher, Class, Subject, AttendanceLog, AttendanceSummary, Student  # <-- Import Student
+from app.models import Teacher, Class, Subject, AttendanceLog, AttendanceSummary, Student, RecognitionJob  # <-- Import Student
 from app.routes import role_required
+from app.ml.detectors import DETECTOR_LABELS, available_backends
 import queue
 import json
 
@@ -41,7 +42,10 @@ def dashboard():
         teacher=current_user,
         class_name=class_name,
         teacher_classes=teacher_classes,
-        teacher_subjects=teacher_subjects
+        teacher_subjects=teacher_subjects,
+        detector_backends=available_backends(current_app.config),
+        detector_labels=DETECTOR_LABELS,
+        job_timeout_minutes=current_app.config['RECOGNITION_JOB_TIMEOUT_MINUTES']
     )
 
 client_queues = {}
@@ -75,6 +79,39 @@ def send_progress(teacher_id, step, percent):
 
 
 
+def _render_video_review(class_id, subject_id, periods, date, recognized_students, cluster_sizes=None):
+    # 🧠 Get full list of students from selected class
+
+    all_students = Student.query.filter_by(class_id=class_id).all()
+    students_with_flags = []
+    for student in all_students:
+        is_recognized = student.student_id in recognized_students
+        students_with_flags.append((student, is_recognized))
+
+    class_obj = Class.query.get(current_user.class_in_charge)
+    class_name = class_obj.class_name if class_obj else "N/A"
+
+    teacher_classes = Class.query.all()
+    teacher_subjects = Subject.query.filter(
+        Subject.class_id.in_([cls.class_id for cls in teacher_classes])
+    ).all()
+
+    return render_template(
+        'teacher/dashboard.html',
+        teacher=current_user,
+        class_name=class_name,
+        teacher_classes=teacher_classes,
+        teacher_subjects=teacher_subjects,
+        students_with_flags=students_with_flags,
+        cluster_sizes=cluster_sizes or {},
+        recognition_method='video',
+        class_id=class_id,
+        subject_id=subject_id,
+        period_input=periods,
+        date=date
+    )
+
+
 @teacher_bp.route('/upload_video', methods=['POST'])
 @login_required
 @role_required('teacher')
@@ -90,6 +127,12 @@ def upload_video():
     periods = request.form.get('periods', '')
     date = request.form.get('date')
 
+    # Only a different, runnable backend overrides DETECTOR_BACKEND
+    detector_backend = request.form.get('detector') or None
+    if detector_backend == current_app.config['DETECTOR_BACKEND'] or \
+            detector_backend not in available_backends(current_app.config):
+        detector_backend = None
+
     if video.filename == '':
         flash("No selected file", "danger")
         return redirect(url_for('teacher.dashboard'))
@@ -97,84 +140,156 @@ def upload_video():
     
     filename = f"{class_id}_{subject_id}_{current_user.teacher_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp4"
     filepath = os.path.join(UPLOAD_FOLDER, filename)
-    if allowed_video_file(filepath):
+    if not allowed_video_file(filepath):
+        flash("Invalid file format", "danger")
+        return redirect(url_for('teacher.dashboard'))
+
+    from app.ml.result_cache import save_upload_hashed
 
-        video.save(filepath)
-        send_progress(current_user.teacher_id, "📥 Video uploaded successfully", 5)
+    content_hash = save_upload_hashed(video, filepath)
+    send_progress(current_user.teacher_id, "📥 Video uploaded successfully", 5)
 
-        try:
-            import app.ml.recognise as recog
-            
-            send_progress(current_user.teacher_id, "🎞️ Extracting faces from video...", 25)
-            detected_faces = recog.extract_faces(filepath)
-            print(f"[INFO] Extracted {len(detected_faces)} faces.")
+    # ⏱️ Background job: return at once, the page follows progress and then opens the job result
+    if current_app.config['RECOGNITION_ASYNC']:
+        from app.ml.jobs import submit_recognition_job
 
-            send_progress(current_user.teacher_id, "🧠 Generating face embeddings...", 45)
-            embeddings = [recog.generate_face_embedding(face) for face in detected_faces]
-            valid_embeddings = [emb for emb in embeddings if emb is not None]
-            print(f"[INFO] Generated {len(valid_embeddings)} valid embeddings.")
+        job_id = submit_recognition_job(
+            current_app._get_current_object(),
+            current_user.teacher_id,
+            filepath,
+            class_id=class_id,
+            subject_id=subject_id,
+            periods=periods,
+            date=date,
+            notify=send_progress,
+            content_hash=content_hash,
+            detector_backend=detector_backend
+        )
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('teacher.job_status', job_id=job_id),
+            'result_url': url_for('teacher.job_result', job_id=job_id)
+        }), 202
 
-            if not valid_embeddings:
-                send_progress(current_user.teacher_id, "❌ No valid embeddings found", 100)
-                flash("No faces detected or valid embeddings found.", "danger")
-                return redirect(url_for('teacher.dashboard'))
+    try:
+        import app.ml.recognise as recog
+        from app.ml.artifacts import artifact_path
+
+        teacher_id = current_user.teacher_id
+        send_progress(teacher_id, "🎞️ Extracting and recognising faces...", 25)
+        options = recog.recognition_options(current_app.config)
+        if detector_backend:
+            options.update(detector_backend=detector_backend, detector_model_path=None)
+        result = recog.run_recognition(
+            filepath,
+            class_id=int(class_id) if class_id else None,
+            progress=lambda step, percent: send_progress(teacher_id, step, percent),
+            content_hash=content_hash,
+            artifact_path=artifact_path(content_hash) if current_app.config['SAVE_VIDEO_ARTIFACTS'] else None,
+            **options
+        )
 
-            send_progress(current_user.teacher_id, "📚 Loading registered student data...", 65)
-            student_data = recog.load_registered_students()
+        if not result.faces_embedded:
+            send_progress(teacher_id, "❌ No valid embeddings found", 100)
+            flash("No faces detected or valid embeddings found.", "danger")
+            return redirect(url_for('teacher.dashboard'))
 
-            send_progress(current_user.teacher_id, "🔍 Matching faces to students...", 75)
-            recognized_students = recog.match_faces_to_students(valid_embeddings, student_data)
-            recognized_names = [
-                student.name for student in Student.query.filter(Student.student_id.in_(recognized_students)).all()
-            ]
-            print(f"[RESULT] Recognized Students: {recognized_names}")
+        recognized_students = result.recognized
+        recognized_names = [
+            student.name for student in Student.query.filter(Student.student_id.in_(recognized_students)).all()
+        ]
+        print(f"[RESULT] Recognized Students: {recognized_names}")
 
 
-            send_progress(current_user.teacher_id, "🎉 Done!", 100)
+        send_progress(current_user.teacher_id, f"🎉 Done! ({result.fraction_processed:.0%} of the video processed)", 100)
 
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        if os.path.exists(filepath):
+            os.remove(filepath)
 
-        except Exception as e:
-            send_progress(current_user.teacher_id, f"❌ Error: {str(e)}", 100)
-            flash(f"Video processing failed: {str(e)}", "danger")
-            return redirect(url_for('teacher.dashboard'))
-    else:
-        flash("Invalid file format", "danger")
+    except Exception as e:
+        send_progress(current_user.teacher_id, f"❌ Error: {str(e)}", 100)
+        flash(f"Video processing failed: {str(e)}", "danger")
         return redirect(url_for('teacher.dashboard'))
 
-    # 🔍 Simulated ML Recognition (replace with your model) 
-    # recognized_students = {1, 2, 3, 4, 7}
+    return _render_video_review(class_id, subject_id, periods, date, recognized_students, result.cluster_sizes)
 
-    # 🧠 Get full list of students from selected class
 
-    all_students = Student.query.filter_by(class_id=class_id).all()
-    students_with_flags = []
-    for student in all_students:
-        is_recognized = student.student_id in recognized_students
-        students_with_flags.append((student, is_recognized))
+@teacher_bp.route('/jobs/<job_id>/status')
+@login_required
+@role_required('teacher')
+def job_status(job_id):
+    job = RecognitionJob.query.filter_by(job_id=job_id, teacher_id=current_user.teacher_id).first_or_404()
+    if job.status in ('queued', 'running') and not current_app.config['RECOGNITION_RESUME_JOBS']:
+        from app.ml.jobs import fail_stale_jobs
+        if fail_stale_jobs(current_app._get_current_object(), job.job_id):
+            db.session.refresh(job)
+    return jsonify({
+        'job_id': job.job_id,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result_url': url_for('teacher.job_result', job_id=job.job_id)
+    })
+
+
+@teacher_bp.route('/jobs/<job_id>')
+@login_required
+@role_required('teacher')
+def job_result(job_id):
+    from app.ml.jobs import job_recognized_ids, job_cluster_sizes
 
-    class_obj = Class.query.get(current_user.class_in_charge)
-    class_name = class_obj.class_name if class_obj else "N/A"
+    job = RecognitionJob.query.filter_by(job_id=job_id, teacher_id=current_user.teacher_id).first_or_404()
 
-    teacher_classes = Class.query.all()
-    teacher_subjects = Subject.query.filter(
-        Subject.class_id.in_([cls.class_id for cls in teacher_classes])
-    ).all()
+    if job.status in ('queued', 'running'):
+        flash(f"Video is still being processed ({job.progress}%). Please check back shortly.", "info")
+        return redirect(url_for('teacher.dashboard'))
 
-    return render_template(
-        'teacher/dashboard.html',
-        teacher=current_user,
-        class_name=class_name,
-        teacher_classes=teacher_classes,
-        teacher_subjects=teacher_subjects,
-        students_with_flags=students_with_flags,
-        recognition_method='video',
-        class_id=class_id,
-        subject_id=subject_id,
-        period_input=periods,
-        date=date
+    if job.status == 'failed':
+        flash(f"Video processing failed: {job.message}", "danger")
+        return redirect(url_for('teacher.dashboard'))
+
+    recognized_students = job_recognized_ids(job)
+    if not job.result or not json.loads(job.result)['faces_embedded']:
+        flash("No faces detected or valid embeddings found.", "danger")
+        return redirect(url_for('teacher.dashboard'))
+
+    return _render_video_review(job.class_id, job.subject_id, job.periods, job.date, recognized_students,
+                                job_cluster_sizes(job))
+
+
+@teacher_bp.route('/jobs/<job_id>/rematch')
+@login_required
+@role_required('teacher')
+def job_rematch(job_id):
+    """
+    Re-scores a finished job's stored embeddings against the current gallery, e.g.
+    /teacher/jobs/<job_id>/rematch?threshold=0.55. No video processing is repeated.
+    """
+    from app.ml.jobs import job_content_hash
+    from app.ml.artifacts import load_artifact
+    from app.ml.recognise import rematch_artifact
+
+    job = RecognitionJob.query.filter_by(job_id=job_id, teacher_id=current_user.teacher_id).first_or_404()
+    content_hash = job_content_hash(job)
+    artifact = load_artifact(content_hash) if content_hash else None
+    if job.status != 'done' or artifact is None:
+        return jsonify({'error': 'No stored embeddings for this job'}), 404
+
+    threshold = request.args.get('threshold', 0.6, type=float)
+    result = rematch_artifact(
+        artifact,
+        class_id=job.class_id,
+        similarity_threshold=threshold,
+        fallback_to_full=current_app.config['RECOGNITION_FALLBACK_TO_FULL_GALLERY'],
+        cluster_similarity=current_app.config['RECOGNITION_CLUSTER_SIMILARITY'],
     )
+    return jsonify({
+        'job_id': job.job_id,
+        'threshold': threshold,
+        'faces': result.faces_embedded,
+        'recognized': sorted(result.recognized),
+        'cluster_sizes': {str(student_id): size for student_id, size in result.cluster_sizes.items()},
+    })
 
 
 @teacher_bp.route('/get_subjects/<int:class_id>')
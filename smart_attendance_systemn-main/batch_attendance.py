@@ -0,0 +1,366 @@
+"""
+Offline batch attendance: run recognition over a folder of class recordings and
+record attendance for all of them in bulk.
+
+Usage:
+    python batch_attendance.py <videos_dir | manifest.csv> [--workers 2] [--teacher-id 7] [--commit-every 20]
+
+A manifest is a CSV with a header row; teacher_id is optional:
+    video,class_id,subject_id,date,periods,teacher_id
+    recordings/3a_maths.mp4,3,12,2026-10-12,"1,2",7
+Relative video paths are resolved against the manifest's folder. A directory is
+scanned for videos named <class_id>_<subject_id>_<YYYY-MM-DD>_<periods>.mp4 with
+periods joined by '-', e.g. 3_12_2026-10-12_1-2.mp4.
+
+Attendance is credited to the row's teacher, else --teacher-id, else the class's
+teacher in charge. With --workers above 1, videos are recognised in that many
+spawned processes, each loading its own copy of the models; 1 runs them one at a
+time in this process. Each finished video is recorded in batch_attendance_items in
+the same transaction as its attendance rows, keyed by the video's content hash,
+so running the command again after a crash or failure - or over a copy of the
+same recordings - skips recorded videos and retries the failed ones. As with
+teacher.confirm_attendance, a video is only recorded if every student in the
+class already has an AttendanceSummary row for the subject; otherwise it fails
+and the admin has to add the missing students first.
+"""
+import argparse
+import csv
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, date
+
+from app import create_app, db
+from app.models import AttendanceLog, AttendanceSummary, BatchAttendanceItem, Student, Teacher
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+FILENAME_PATTERN = re.compile(r'^(\d+)_(\d+)_(\d{4}-\d{2}-\d{2})_([\d-]+)$')
+
+_worker_app = None
+
+
+@dataclass
+class BatchItem:
+    video_path: str
+    class_id: int
+    subject_id: int
+    date: date
+    periods: str  # "1,2,3", as the teacher upload form stores it
+    teacher_id: int | None = None
+    content_hash: str | None = None  # SHA-256 of the video, filled in by the worker
+
+    @property
+    def key(self) -> str:
+        """
+        Ledger key: what was recorded and for which lesson, independent of where the file lives.
+        """
+        identity = f"{self.content_hash}|{self.class_id}|{self.subject_id}|{self.date}|{self.periods}"
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    @property
+    def period_count(self) -> int:
+        return len([period for period in self.periods.split(',') if period.strip()])
+
+
+@dataclass
+class Outcome:
+    item: BatchItem
+    result: object = None  # RecognitionResult, or None when the video failed or was skipped
+    error: str | None = None
+    skipped: bool = False  # already recorded, possibly from another copy of the same file
+    video_seconds: float = 0.0
+    seconds: float = 0.0
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+
+
+def read_manifest(path: str) -> list[BatchItem]:
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, newline='') as handle:
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            try:
+                teacher_id = (row.get('teacher_id') or '').strip()
+                items.append(BatchItem(
+                    video_path=os.path.join(base, row['video'].strip()),
+                    class_id=int(row['class_id']),
+                    subject_id=int(row['subject_id']),
+                    date=_parse_date(row['date']),
+                    periods=','.join(period.strip() for period in row['periods'].split(',') if period.strip()),
+                    teacher_id=int(teacher_id) if teacher_id else None,
+                ))
+            except (KeyError, ValueError, AttributeError) as e:
+                print(f"[WARN] Skipping manifest line {line}: {e}")
+    return items
+
+
+def scan_directory(directory: str) -> list[BatchItem]:
+    items = []
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in VIDEO_EXTENSIONS:
+            continue
+        match = FILENAME_PATTERN.match(stem)
+        if not match:
+            print(f"[WARN] Skipping {name}: expected <class_id>_<subject_id>_<YYYY-MM-DD>_<periods>{extension}")
+            continue
+        class_id, subject_id, day, periods = match.groups()
+        try:
+            items.append(BatchItem(os.path.join(directory, name), int(class_id), int(subject_id), _parse_date(day),
+                                   ','.join(period for period in periods.split('-') if period)))
+        except ValueError as e:
+            print(f"[WARN] Skipping {name}: {e}")
+    return items
+
+
+def load_items(source: str) -> list[BatchItem]:
+    return scan_directory(source) if os.path.isdir(source) else read_manifest(source)
+
+
+def _init_worker() -> None:
+    """
+    Pool initializer: each spawned worker builds the app once and keeps its models loaded.
+    """
+    global _worker_app
+    _worker_app = create_app()
+
+
+def recognise_item(item: BatchItem, app=None) -> Outcome:
+    """
+    Runs recognition for one video inside an app context: app, or the worker's own
+    app when run in the process pool.
+    """
+    app = app or _worker_app
+    from app.ml.recognise import run_recognition, recognition_options
+    from app.ml.pipeline import video_properties
+    from app.ml.result_cache import file_sha256
+    from app.ml.artifacts import artifact_path
+
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            item.content_hash = file_sha256(item.video_path)
+            if BatchAttendanceItem.query.filter_by(item_key=item.key, status='done').first():
+                return Outcome(item, skipped=True, seconds=time.perf_counter() - started)
+            frame_count, fps = video_properties(item.video_path)
+            if frame_count <= 0:
+                raise ValueError("could not read video")
+            options = recognition_options(app.config)
+            result = run_recognition(
+                item.video_path,
+                class_id=item.class_id,
+                content_hash=item.content_hash,
+                artifact_path=artifact_path(item.content_hash) if app.config['SAVE_VIDEO_ARTIFACTS'] else None,
+                **options
+            )
+            return Outcome(item, result, video_seconds=frame_count / fps, seconds=time.perf_counter() - started)
+        except Exception as e:
+            return Outcome(item, error=str(e), seconds=time.perf_counter() - started)
+
+
+def _ledger_entry(item: BatchItem, status: str, present: int = 0, message: str | None = None) -> None:
+    db.session.merge(BatchAttendanceItem(
+        item_key=item.key, video_path=item.video_path, class_id=item.class_id, subject_id=item.subject_id,
+        date=item.date, periods=item.periods, status=status, present=present,
+        message=message[:255] if message else None, finished_at=datetime.utcnow(),
+    ))
+
+
+def _fail(outcome: Outcome, message: str) -> None:
+    outcome.result, outcome.error = None, message
+    if outcome.item.content_hash:
+        _ledger_entry(outcome.item, 'failed', message=message)
+
+
+def _write_outcomes(outcomes: list[Outcome], rosters: dict) -> int:
+    keys = [outcome.item.key for outcome in outcomes if outcome.result is not None]
+    recorded = {
+        key for (key,) in db.session.query(BatchAttendanceItem.item_key)
+        .filter(BatchAttendanceItem.item_key.in_(keys), BatchAttendanceItem.status == 'done')
+    }
+    summaries = {}  # (class_id, subject_id) -> {student_id: AttendanceSummary}
+    logs = []
+    for outcome in outcomes:
+        item = outcome.item
+        if outcome.error:
+            _fail(outcome, outcome.error)
+            continue
+        if outcome.result is None:
+            continue
+        if item.key in recorded:
+            outcome.result, outcome.skipped = None, True
+            continue
+
+        if item.class_id not in rosters:
+            rosters[item.class_id] = {
+                student_id for (student_id,) in db.session.query(Student.student_id).filter_by(class_id=item.class_id)
+            }
+        roster = rosters[item.class_id]
+        pair = (item.class_id, item.subject_id)
+        if pair not in summaries:
+            # One summary query per class/subject pair instead of one per student.
+            summaries[pair] = {
+                summary.student_id: summary
+                for summary in AttendanceSummary.query.filter_by(class_id=item.class_id, subject_id=item.subject_id)
+            }
+        missing = sorted(roster - summaries[pair].keys())
+        if missing:
+            _fail(outcome, f"AttendanceSummary missing for students {missing[:10]}; please contact admin")
+            continue
+
+        present = sorted(set(outcome.result.recognized) & roster)
+        for student_id in present:
+            logs.append({
+                'class_id': item.class_id, 'subject_id': item.subject_id, 'student_id': student_id,
+                'teacher_id': item.teacher_id, 'date': item.date, 'periods': item.periods,
+                'video_path': item.video_path,
+            })
+            summaries[pair][student_id].classes_present += item.period_count
+        for student_id in roster:
+            summaries[pair][student_id].total_classes += item.period_count
+
+        _ledger_entry(item, 'done', present=len(present))
+        recorded.add(item.key)  # a second copy of the same file later in this batch is skipped
+
+    db.session.bulk_insert_mappings(AttendanceLog, logs)
+    db.session.commit()
+    return len(logs)
+
+
+def write_outcomes(outcomes: list[Outcome], rosters: dict) -> int:
+    """
+    Writes attendance rows, summary updates and ledger entries for finished videos
+    in one transaction; returns how many attendance rows were added. If that
+    transaction fails it is rolled back and the whole batch is recorded as failed,
+    so the run carries on and a re-run retries those videos.
+    """
+    try:
+        return _write_outcomes(outcomes, rosters)
+    except Exception as e:
+        db.session.rollback()
+        print(f"[ERROR] Could not record a batch of {len(outcomes)} videos: {e}")
+        try:
+            for outcome in outcomes:
+                if outcome.result is not None or outcome.error:
+                    _fail(outcome, outcome.error or f"database write failed: {e}")
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        return 0
+
+
+def _resolve_teachers(items: list[BatchItem], default_teacher_id: int | None) -> list[Outcome]:
+    """
+    Fills in each item's teacher; returns failed outcomes for items that have none.
+    """
+    in_charge = {
+        class_id: teacher_id
+        for teacher_id, class_id in db.session.query(Teacher.teacher_id, Teacher.class_in_charge)
+        if class_id is not None
+    }
+    unresolved = []
+    for item in items:
+        item.teacher_id = item.teacher_id or default_teacher_id or in_charge.get(item.class_id)
+        if item.teacher_id is None:
+            unresolved.append(Outcome(item, error="no teacher_id given and the class has no teacher in charge"))
+    return unresolved
+
+
+def _recognise_all(app, items: list[BatchItem], workers: int):
+    """
+    Yields an Outcome per item as videos finish. Above one worker, videos go to a
+    spawned process pool (see app.ml.parallel): the models are shared, lock-guarded
+    objects, so threads would only take turns on them. Closing the generator cancels
+    videos that have not started.
+    """
+    if workers <= 1:
+        for item in items:
+            yield recognise_item(item, app)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker)
+    futures = {pool.submit(recognise_item, item): item for item in items}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:  # the worker process died, e.g. out of memory
+                yield Outcome(futures[future], error=f"worker failed: {e}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(source: str, workers: int | None, teacher_id: int | None, commit_every: int) -> None:
+    app = create_app()
+    with app.app_context():
+        items = load_items(source)
+        pending = list({
+            (os.path.abspath(item.video_path), item.class_id, item.subject_id, item.date, item.periods): item
+            for item in items
+        }.values())
+        print(f"[INFO] {len(items)} videos listed, {len(pending)} distinct")
+
+        failed = _resolve_teachers(pending, teacher_id)
+        pending = [item for item in pending if item.teacher_id is not None]
+        workers = max(1, workers or app.config['RECOGNITION_WORKERS'])
+
+        rosters = {}
+        finished = list(failed)
+        done = []
+        rows_written = 0
+        started = time.perf_counter()
+        outcomes = _recognise_all(app, pending, workers)
+        try:
+            for count, outcome in enumerate(outcomes, start=1):
+                if outcome.skipped:
+                    status = "already recorded"
+                elif outcome.result:
+                    status = f"{len(outcome.result.recognized)} recognised"
+                else:
+                    status = f"failed: {outcome.error}"
+                print(f"[INFO] {count}/{len(pending)} {os.path.basename(outcome.item.video_path)} "
+                      f"({outcome.seconds:.1f}s): {status}")
+                finished.append(outcome)
+                if len(finished) >= commit_every:
+                    rows_written += write_outcomes(finished, rosters)
+                    done.extend(finished)
+                    finished = []
+        except KeyboardInterrupt:
+            print("[WARN] Interrupted; recording finished videos and stopping. Re-run to resume.")
+        finally:
+            outcomes.close()
+            if finished:
+                rows_written += write_outcomes(finished, rosters)
+                done.extend(finished)
+        wall = time.perf_counter() - started
+
+        succeeded = [outcome for outcome in done if outcome.result is not None]
+        errors = [outcome for outcome in done if outcome.error]
+        skipped = [outcome for outcome in done if outcome.skipped]
+        video_seconds = sum(outcome.video_seconds for outcome in succeeded)
+        print(f"\nVideos: {len(succeeded)} done, {len(errors)} failed, {len(skipped)} skipped (already recorded)")
+        print(f"Video time: {video_seconds / 3600:.2f} h in {wall / 60:.1f} min wall with {workers} workers "
+              f"({video_seconds / wall if wall else 0:.1f}x realtime, {60 * len(succeeded) / wall if wall else 0:.2f} videos/min)")
+        print(f"Frames decoded: {sum(o.result.frames_processed for o in succeeded)}, "
+              f"faces embedded: {sum(o.result.faces_embedded for o in succeeded)}, "
+              f"served from cache: {sum(o.result.cached for o in succeeded)}")
+        print(f"Attendance rows written: {rows_written}")
+        for outcome in errors:
+            print(f"  [FAILED] {outcome.item.video_path}: {outcome.error}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='directory of videos or a manifest CSV')
+    parser.add_argument('--workers', type=int, default=None, help='videos recognised at once, one process each (defaults to RECOGNITION_WORKERS)')
+    parser.add_argument('--teacher-id', type=int, default=None, help='teacher credited when the manifest has none')
+    parser.add_argument('--commit-every', type=int, default=20, help='finished videos written per transaction')
+    args = parser.parse_args()
+    run(args.source, args.workers, args.teacher_id, max(1, args.commit_every))
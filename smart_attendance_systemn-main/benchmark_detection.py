@@ -0,0 +1,83 @@
+"""
+Detection-resolution benchmark: speed and recall of downscaled detection at 1080p and 4K.
+
+Usage:
+    python benchmark_detection.py path/to/lecture.mp4 [--frames 20] [--scales 1 0.5 0.33 0.25] [--min-face-size 60] [--backend haar]
+
+Sampled frames are resized to each target resolution; detections at full
+resolution are the reference, and recall is the share of reference faces
+found again (IoU >= 0.5) at each scale. Speedups are against that timed
+full-resolution pass, whichever scales are listed.
+"""
+import argparse
+import time
+
+import cv2
+
+from app.ml.detectors import DETECTOR_BACKENDS
+from app.ml.model_registry import get_detector
+from app.ml.pipeline import detect_faces_scaled, detection_scale_for
+from app.ml.sampling import iter_sampled_frames
+from app.ml.tracking import box_iou
+
+RESOLUTIONS = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+
+def _recall(reference: list, found: list, iou_threshold: float = 0.5) -> tuple[int, int]:
+    if not reference:
+        return 0, 0
+    if not found:
+        return 0, len(reference)
+    ious = box_iou([face['box'] for face in reference], [face['box'] for face in found])
+    return int((ious.max(axis=1) >= iou_threshold).sum()), len(reference)
+
+
+def run(video_path: str, num_frames: int, scales: list, min_face_size: int | None, backend: str = 'mtcnn',
+        model_path: str | None = None) -> None:
+    detector = get_detector(backend, model_path)
+    frames = [frame for _, frame in iter_sampled_frames(video_path, num_keyframes=num_frames)]
+    if not frames:
+        print(f"[ERROR] No frames read from {video_path}")
+        return
+
+    if min_face_size:
+        scales = sorted(set(scales) | {round(detection_scale_for(min_face_size), 2)}, reverse=True)
+
+    detector.detect_faces(frames[0])  # warm-up, not timed
+    for label, size in RESOLUTIONS.items():
+        resized = [cv2.resize(frame, size) for frame in frames]
+        started = time.perf_counter()
+        reference = [detector.detect_faces(frame) for frame in resized]
+        baseline = 1000 * (time.perf_counter() - started) / len(resized)
+
+        print(f"\n{label} ({size[0]}x{size[1]}), {len(resized)} frames")
+        print(f"{'scale':>8} {'ms/frame':>10} {'speedup':>8} {'recall':>8}")
+        print(f"{1.0:>8.2f} {baseline:>10.1f} {1.0:>7.1f}x {1.0:>8.3f}")
+        for scale in scales:
+            if scale >= 1.0:
+                continue
+            started = time.perf_counter()
+            detections = [detect_faces_scaled(detector, frame, scale) for frame in resized]
+            ms_per_frame = 1000 * (time.perf_counter() - started) / len(resized)
+
+            hits = total = 0
+            for ref, found in zip(reference, detections):
+                frame_hits, frame_total = _recall(ref, found)
+                hits += frame_hits
+                total += frame_total
+            recall = hits / total if total else float('nan')
+            print(f"{scale:>8.2f} {ms_per_frame:>10.1f} {baseline / ms_per_frame:>7.1f}x {recall:>8.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path')
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.5, 0.33, 0.25])
+    parser.add_argument('--min-face-size', type=int, default=None,
+                        help='smallest expected face at full resolution; adds the adaptive scale to the table')
+    parser.add_argument('--backend', choices=DETECTOR_BACKENDS, default='mtcnn')
+    parser.add_argument('--model-path', default=None, help='model file for the yunet backend')
+    args = parser.parse_args()
+    run(args.video_path, args.frames, sorted(set(args.scales), reverse=True), args.min_face_size,
+        args.backend, args.model_path)
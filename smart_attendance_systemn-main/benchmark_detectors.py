@@ -0,0 +1,104 @@
+"""
+Detector backend comparison: throughput and recall on a local labeled clip set.
+
+Usage:
+    python benchmark_detectors.py path/to/clips [--backends mtcnn haar yunet] [--model-path yunet.onnx]
+
+The clip directory holds videos (.mp4/.avi/.mov) and, next to each, a JSON file
+with the same stem mapping frame indices to ground-truth face boxes:
+    {"120": [[x, y, w, h], ...], "240": [...]}
+Only labeled frames are decoded and detected. A detection counts as a hit when
+it overlaps an unmatched labeled box with IoU >= 0.5.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.ml.detectors import DETECTOR_BACKENDS
+from app.ml.model_registry import get_detector
+from app.ml.tracking import box_iou
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+
+
+def load_clip_set(directory: str) -> list[tuple[np.ndarray, list]]:
+    """
+    Returns (frame, labeled_boxes) pairs for every labeled frame in the directory.
+    """
+    samples = []
+    for video_path in sorted(glob.glob(os.path.join(directory, '*'))):
+        stem, extension = os.path.splitext(video_path)
+        if extension.lower() not in VIDEO_EXTENSIONS or not os.path.exists(stem + '.json'):
+            continue
+        with open(stem + '.json') as handle:
+            labels = {int(frame_index): boxes for frame_index, boxes in json.load(handle).items()}
+
+        video_capture = cv2.VideoCapture(video_path)
+        for frame_index in sorted(labels):
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            success, frame = video_capture.read()
+            if success:
+                samples.append((frame, labels[frame_index]))
+        video_capture.release()
+    return samples
+
+
+def _hits(labeled: list, found: list, iou_threshold: float = 0.5) -> int:
+    if not labeled or not found:
+        return 0
+    ious = box_iou(labeled, [face['box'] for face in found])
+    hits = 0
+    for flat in np.argsort(-ious, axis=None):
+        row, column = np.unravel_index(flat, ious.shape)
+        if ious[row, column] < iou_threshold:
+            break
+        if np.isfinite(ious[row, column]):
+            hits += 1
+            ious[row, :] = -np.inf
+            ious[:, column] = -np.inf
+    return hits
+
+
+def run(directory: str, backends: list, model_path: str | None) -> None:
+    samples = load_clip_set(directory)
+    labeled_faces = sum(len(boxes) for _, boxes in samples)
+    if not samples:
+        print(f"[ERROR] No labeled frames found in {directory}")
+        return
+    print(f"{len(samples)} labeled frames, {labeled_faces} faces\n")
+    print(f"{'backend':>8} {'frames/s':>9} {'faces/s':>9} {'recall':>8} {'precision':>10}")
+
+    for backend in backends:
+        try:
+            detector = get_detector(backend, model_path if backend == 'yunet' else None)
+            detector.detect_faces(samples[0][0])  # warm-up, not timed
+        except Exception as error:
+            print(f"{backend:>8} skipped: {error}")
+            continue
+
+        hits = found_total = 0
+        started = time.perf_counter()
+        detections = [detector.detect_faces(frame) for frame, _ in samples]
+        elapsed = time.perf_counter() - started
+        for (_, labeled), found in zip(samples, detections):
+            hits += _hits(labeled, found)
+            found_total += len(found)
+
+        recall = hits / labeled_faces if labeled_faces else float('nan')
+        precision = hits / found_total if found_total else float('nan')
+        print(f"{backend:>8} {len(samples) / elapsed:>9.1f} {found_total / elapsed:>9.1f} {recall:>8.3f} {precision:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('clip_dir')
+    parser.add_argument('--backends', nargs='+', choices=DETECTOR_BACKENDS, default=list(DETECTOR_BACKENDS))
+    parser.add_argument('--model-path', default=os.environ.get('DETECTOR_MODEL_PATH'),
+                        help='YuNet .onnx model file (defaults to DETECTOR_MODEL_PATH)')
+    args = parser.parse_args()
+    run(args.clip_dir, args.backends, args.model_path)
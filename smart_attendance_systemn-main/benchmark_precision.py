@@ -0,0 +1,74 @@
+"""
+Gallery precision benchmark: memory, speed and accuracy drift of float16/int8 matching against float32.
+
+Usage:
+    python benchmark_precision.py [--artifacts 20] [--threshold 0.6] [--repeat 3]
+
+The gallery is read from the database. Queries are the face embeddings stored
+in processed-video artifacts (see app/ml/artifacts.py); without any, lightly
+perturbed gallery rows are used instead. Drift is reported as top-1 agreement
+with float32, score error, and how many faces flip across the match threshold.
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from app import create_app
+from app.ml.artifacts import VideoArtifact, artifacts_directory
+from app.ml.gallery import load_gallery_rows
+from app.ml.matcher import GalleryMatcher, CompactGalleryMatcher, PRECISIONS, normalize_rows
+
+
+def _load_queries(max_artifacts: int, gallery: np.ndarray) -> tuple[np.ndarray, str]:
+    paths = sorted(glob.glob(os.path.join(artifacts_directory(), '*.npz')), key=os.path.getmtime, reverse=True)
+    embeddings = [VideoArtifact.load(path).embeddings for path in paths[:max_artifacts]]
+    embeddings = [batch for batch in embeddings if len(batch)]
+    if embeddings:
+        return np.vstack(embeddings), f"{len(embeddings)} video artifacts"
+
+    rng = np.random.default_rng(0)
+    sample = gallery[rng.choice(len(gallery), min(len(gallery), 2000), replace=False)]
+    return normalize_rows(sample) + rng.normal(scale=0.05, size=sample.shape).astype(np.float32), "perturbed gallery rows"
+
+
+def run(max_artifacts: int, threshold: float, repeat: int) -> None:
+    student_ids, _, rows = load_gallery_rows()
+    if not rows:
+        print("[ERROR] No student embeddings in the database.")
+        return
+    gallery = np.vstack(rows)
+    queries, source = _load_queries(max_artifacts, gallery)
+    print(f"Gallery: {len(gallery)} students. Queries: {len(queries)} faces from {source}.\n")
+
+    reference = GalleryMatcher(student_ids, gallery)
+    ref_ids, ref_scores = reference.search(queries)
+    ref_accept = ref_scores[:, 0] >= threshold
+
+    print(f"{'precision':>9} {'KiB':>9} {'ms':>8} {'top1 agree':>11} {'max |dS|':>9} {'mean |dS|':>10} {'flips@' + str(threshold):>11}")
+    for precision in PRECISIONS:
+        matcher = reference if precision == 'float32' else CompactGalleryMatcher.from_embeddings(student_ids, gallery, precision)
+        timings = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            ids, scores = matcher.search(queries)
+            timings.append(time.perf_counter() - started)
+
+        agree = float(np.mean(ids[:, 0] == ref_ids[:, 0]))
+        error = np.abs(scores[:, 0] - ref_scores[:, 0])
+        flips = int(np.sum((scores[:, 0] >= threshold) != ref_accept))
+        print(f"{precision:>9} {matcher.nbytes / 1024:>9.1f} {1000 * min(timings):>8.2f} {agree:>11.4f} "
+              f"{error.max():>9.5f} {error.mean():>10.6f} {flips:>11}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artifacts', type=int, default=20, help='most recent video artifacts to use as queries')
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        run(args.artifacts, args.threshold, args.repeat)
@@ -0,0 +1,262 @@
+"""
+Bulk student enrollment from a folder of registration videos or photos.
+
+Usage:
+    python bulk_enroll.py <folder> [--workers 2] [--commit-every 100] [--skip-enrolled | --outdated-only]
+                          [--report enrollment.csv]
+
+The folder holds one entry per student, named by student id:
+    1042.mp4        a registration video (.mp4/.avi/.mov)
+    1043/           a directory of photos (.jpg/.jpeg/.png)
+With --workers above 1, students are processed in that many spawned processes,
+each loading its own copy of the models; 1 processes them one at a time in this
+process. Embeddings are upserted in one transaction per --commit-every students.
+A per-student CSV report lists each student's status, face counts and errors. With --skip-enrolled, students who
+already have an embedding are left alone, so an interrupted run can be resumed.
+
+With --outdated-only, only students whose stored embedding came from an older
+embedding pipeline (see app.ml.embedding.EMBEDDING_VERSION) are re-enrolled.
+Uploaded registration videos are not kept, so this needs their videos or photos
+again; until then those students may go unrecognised.
+"""
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+
+from app import create_app, db
+from app.models import Student, StudentEmbedding
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+REPORT_FIELDS = ['student_id', 'source', 'status', 'faces_embedded', 'faces_dropped', 'frames_processed',
+                 'converged', 'seconds', 'message']
+
+_worker_app = None
+
+
+@dataclass
+class Enrollment:
+    student_id: int
+    source: str
+    status: str = 'pending'  # enrolled, failed, skipped
+    faces_embedded: int = 0
+    faces_dropped: int = 0
+    frames_processed: int = 0
+    converged: bool = False
+    seconds: float = 0.0
+    message: str = ''
+    embedding: object = None  # np.ndarray until written
+
+    def row(self) -> dict:
+        row = {field: getattr(self, field) for field in REPORT_FIELDS}
+        row['seconds'] = round(self.seconds, 2)
+        return row
+
+
+def scan_folder(folder: str) -> list[Enrollment]:
+    enrollments = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        stem, extension = os.path.splitext(name)
+        is_photos = os.path.isdir(path)
+        if not is_photos and extension.lower() not in VIDEO_EXTENSIONS:
+            continue
+        if not (name if is_photos else stem).isdigit():
+            print(f"[WARN] Skipping {name}: expected <student_id>{'/' if is_photos else extension}")
+            continue
+        enrollments.append(Enrollment(int(name if is_photos else stem), path))
+    return enrollments
+
+
+def _photo_paths(directory: str) -> list:
+    return sorted(path for path in glob.glob(os.path.join(directory, '*'))
+                  if os.path.splitext(path)[1].lower() in PHOTO_EXTENSIONS)
+
+
+def _init_worker() -> None:
+    """
+    Pool initializer: each spawned worker builds the app once and keeps its models loaded.
+    """
+    global _worker_app
+    _worker_app = create_app()
+
+
+def embed_student(enrollment: Enrollment, app=None) -> Enrollment:
+    """
+    Computes one student's embedding inside an app context: app, or the worker's
+    own app when run in the process pool.
+    """
+    import app.ml.register as reg
+    from app.ml.quality import thresholds_from_config
+    from app.ml.sampling import motion_sampling_from_config
+
+    app = app or _worker_app
+    started = time.perf_counter()
+    with app.app_context():
+        config = app.config
+        options = dict(
+            batch_size=config['EMBEDDING_BATCH_SIZE'],
+            quality=thresholds_from_config(config),
+            detector_backend=config['DETECTOR_BACKEND'],
+            detector_model_path=config['DETECTOR_MODEL_PATH'],
+        )
+        try:
+            if os.path.isdir(enrollment.source):
+                photos = _photo_paths(enrollment.source)
+                if not photos:
+                    raise ValueError("no photos found")
+                result = reg.photo_student_embedding(photos, **options)
+            else:
+                result = reg.stream_student_embedding(
+                    enrollment.source,
+                    tolerance=config['REGISTRATION_CONVERGENCE_TOLERANCE'],
+                    min_faces=config['REGISTRATION_MIN_FACES'],
+                    motion=motion_sampling_from_config(config),
+                    **options
+                )
+            enrollment.faces_embedded = result.faces_embedded
+            enrollment.faces_dropped = result.faces_dropped
+            enrollment.frames_processed = result.frames_processed
+            enrollment.converged = result.converged
+            enrollment.embedding = result.embedding
+            if result.embedding is None:
+                enrollment.status, enrollment.message = 'failed', "no valid face embeddings found"
+        except Exception as e:
+            enrollment.status, enrollment.message = 'failed', str(e)
+    enrollment.seconds = time.perf_counter() - started
+    return enrollment
+
+
+def write_enrollments(enrollments: list[Enrollment]) -> None:
+    """
+    Upserts the embedded students in one transaction and marks each enrolled or failed.
+    The upload time is stamped in IST, as student.upload_video does, for the dashboard.
+    A failed transaction marks the whole batch failed instead of raising, so the run carries on.
+    """
+    from app.ml.register import save_student_embeddings
+
+    ready = [enrollment for enrollment in enrollments if enrollment.status == 'pending']
+    if not ready:
+        return
+    try:
+        errors = save_student_embeddings({enrollment.student_id: enrollment.embedding for enrollment in ready},
+                                         uploaded_at=datetime.now(pytz.timezone('Asia/Kolkata')))
+    except Exception as e:
+        print(f"[ERROR] Could not save a batch of {len(ready)} students: {e}")
+        errors = {enrollment.student_id: f"database write failed: {e}" for enrollment in ready}
+    for enrollment in ready:
+        enrollment.embedding = None
+        if enrollment.student_id in errors:
+            enrollment.status, enrollment.message = 'failed', errors[enrollment.student_id]
+        else:
+            enrollment.status = 'enrolled'
+
+
+def _embed_all(app, enrollments: list[Enrollment], positions: list[int], workers: int):
+    """
+    Yields (position, enrollment) as the students at those positions finish. Above one
+    worker, students go to a spawned process pool (see app.ml.parallel): the models are
+    shared, lock-guarded objects, so threads would only take turns on them. Closing the
+    generator cancels students that have not started.
+    """
+    if workers <= 1:
+        for position in positions:
+            yield position, embed_student(enrollments[position], app)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker)
+    futures = {pool.submit(embed_student, enrollments[position]): position for position in positions}
+    try:
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                yield position, future.result()
+            except Exception as e:  # the worker process died, e.g. out of memory
+                enrollment = enrollments[position]
+                enrollment.status, enrollment.message = 'failed', f"worker failed: {e}"
+                yield position, enrollment
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(folder: str, workers: int | None, commit_every: int, skip_enrolled: bool, report_path: str,
+        outdated_only: bool = False) -> None:
+    from app.ml.gallery import outdated_student_ids
+
+    app = create_app()
+    with app.app_context():
+        enrollments = scan_folder(folder)
+        known = {student_id for (student_id,) in db.session.query(Student.student_id)}
+        enrolled = {student_id for (student_id,) in db.session.query(StudentEmbedding.student_id)} if skip_enrolled else set()
+        outdated = set(outdated_student_ids()) if outdated_only else None
+
+        todo = []  # positions in enrollments
+        for position, enrollment in enumerate(enrollments):
+            if enrollment.student_id not in known:
+                enrollment.status, enrollment.message = 'failed', "no such student"
+            elif enrollment.student_id in enrolled:
+                enrollment.status, enrollment.message = 'skipped', "already enrolled"
+            elif outdated is not None and enrollment.student_id not in outdated:
+                enrollment.status, enrollment.message = 'skipped', "embedding is up to date or missing"
+            else:
+                todo.append(position)
+        workers = max(1, workers or app.config['RECOGNITION_WORKERS'])
+        print(f"[INFO] {len(enrollments)} students found, {len(todo)} to enroll with {workers} workers")
+
+        finished = []
+        started = time.perf_counter()
+        results = _embed_all(app, enrollments, todo, workers)
+        try:
+            for count, (position, enrollment) in enumerate(results, start=1):
+                enrollments[position] = enrollment  # a copy when it came back from a worker process
+                status = f"{enrollment.faces_embedded} faces" if enrollment.status == 'pending' else enrollment.message
+                print(f"[INFO] {count}/{len(todo)} student {enrollment.student_id} ({enrollment.seconds:.1f}s): {status}")
+                finished.append(enrollment)
+                if len(finished) >= commit_every:
+                    batch, finished = finished, []
+                    write_enrollments(batch)
+        except KeyboardInterrupt:
+            print("[WARN] Interrupted; saving finished students. Re-run with --skip-enrolled to resume.")
+        finally:
+            try:
+                results.close()
+                write_enrollments(finished)
+            finally:
+                write_report(enrollments, report_path, time.perf_counter() - started)
+
+
+def write_report(enrollments: list[Enrollment], report_path: str, wall: float) -> None:
+    with open(report_path, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(enrollment.row() for enrollment in enrollments)
+
+    counts = {}
+    for enrollment in enrollments:
+        counts[enrollment.status] = counts.get(enrollment.status, 0) + 1
+    done = counts.get('enrolled', 0)
+    print(f"\nEnrolled {done}, failed {counts.get('failed', 0)}, skipped {counts.get('skipped', 0)}"
+          + (f", not processed {counts['pending']}" if counts.get('pending') else ''))
+    print(f"{wall:.1f}s wall, {60 * done / wall if wall else 0:.1f} students/min. Report: {report_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder')
+    parser.add_argument('--workers', type=int, default=None, help='students processed at once, one process each (defaults to RECOGNITION_WORKERS)')
+    parser.add_argument('--commit-every', type=int, default=100, help='students upserted per transaction')
+    parser.add_argument('--skip-enrolled', action='store_true', help='leave students who already have an embedding alone')
+    parser.add_argument('--outdated-only', action='store_true',
+                        help='only re-enroll students whose embedding came from an older embedding pipeline')
+    parser.add_argument('--report', default='enrollment_report.csv', help='per-student CSV report path')
+    args = parser.parse_args()
+    run(args.folder, args.workers, max(1, args.commit_every), args.skip_enrolled, args.report, args.outdated_only)
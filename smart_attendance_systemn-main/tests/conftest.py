@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def clustered_embeddings(rng):
+    """
+    Factory for synthetic embeddings: per_person noisy copies of n_people random unit
+    centres, noise being the expected length of the added noise vector.
+    Returns (centres, embeddings, labels).
+    """
+    def make(n_people: int, per_person: int, noise: float = 0.1, dim: int = 128):
+        centres = rng.normal(size=(n_people, dim))
+        centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+        labels = np.repeat(np.arange(n_people), per_person)
+        embeddings = centres[labels] + noise * rng.normal(size=(len(labels), dim)) / np.sqrt(dim)
+        return centres, embeddings, labels
+    return make
+
+
+@pytest.fixture
+def flask_app():
+    """
+    Bare Flask app with the app's tables on an in-memory database. create_app also
+    registers every blueprint, which needs the PDF and face-detection packages.
+    """
+    from flask import Flask
+    from app import db, models  # noqa: F401 -- models registers the tables
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
@@ -0,0 +1,62 @@
+import numpy as np
+
+from app.ml.ann_index import IVFIndex, recall_against_exact
+from app.ml.matcher import GalleryMatcher
+
+
+def test_recall_against_exact_search(rng, clustered_embeddings):
+    _, embeddings, _ = clustered_embeddings(n_people=400, per_person=5, noise=0.3)
+    student_ids = np.arange(len(embeddings))
+    index = IVFIndex.train(student_ids, embeddings, nprobe=8)
+    queries = embeddings[rng.choice(len(embeddings), 300, replace=False)] + 0.05 * rng.normal(size=(300, 128))
+
+    assert recall_against_exact(index, GalleryMatcher(student_ids, embeddings), queries) >= 0.95
+
+
+def test_probing_every_list_is_exact(rng):
+    embeddings = rng.normal(size=(500, 128))
+    student_ids = np.arange(1000, 1500)
+    index = IVFIndex.train(student_ids, embeddings, n_lists=10)
+    index.nprobe = 10
+    queries = rng.normal(size=(50, 128))
+
+    ids, scores = index.search(queries, top_k=3)
+    exact_ids, exact_scores = GalleryMatcher(student_ids, embeddings).search(queries, top_k=3)
+    assert ids.tolist() == exact_ids.tolist()
+    np.testing.assert_allclose(scores, exact_scores, atol=1e-5)
+
+
+def test_add_replaces_and_remove_deletes(rng):
+    embeddings = rng.normal(size=(100, 128))
+    index = IVFIndex.train(np.arange(100), embeddings, n_lists=5)
+    index.nprobe = 5
+
+    replacement = rng.normal(size=(1, 128))
+    index.add([3], replacement)
+    index.add([500], embeddings[:1])
+    assert len(index) == 101
+    assert index.search(replacement)[0][0, 0] == 3
+
+    index.remove([3, 500])
+    assert len(index) == 99
+    assert not np.isin([3, 500], index.search(np.vstack([replacement, embeddings[:1]]), top_k=99)[0]).any()
+
+
+def test_save_load_round_trip(rng, tmp_path):
+    embeddings = rng.normal(size=(200, 128))
+    index = IVFIndex.train(np.arange(200), embeddings, nprobe=3)
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+
+    loaded = IVFIndex.load(path)
+    for name in ('centroids', 'student_ids', 'vectors', 'assignments'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+    assert loaded.nprobe == 3
+
+    queries = rng.normal(size=(20, 128))
+    assert loaded.search(queries, top_k=5)[0].tolist() == index.search(queries, top_k=5)[0].tolist()
+
+
+def test_empty_index_matches_nobody(rng):
+    index = IVFIndex.train(np.empty(0, dtype=np.int64), np.empty((0, 128)))
+    assert index.match(rng.normal(size=(2, 128))).best_ids.tolist() == [-1, -1]
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import db
+from app.ml import gallery
+from app.ml.artifacts import VideoArtifact, artifact_path, load_artifact
+from app.ml.embedding import EMBEDDING_VERSION
+from app.ml.recognise import rematch_artifact
+from app.models import Class, EmbeddingChange, Student, StudentEmbedding, StudentEmbeddingVersion
+
+
+def at_similarity(target, cosine, rng):
+    """A vector at the given cosine similarity to target."""
+    unit = target / np.linalg.norm(target)
+    other = rng.normal(size=unit.shape)
+    other -= (other @ unit) * unit
+    return cosine * unit + np.sqrt(1 - cosine ** 2) * other / np.linalg.norm(other)
+
+
+def test_save_load_round_trip(tmp_path, rng):
+    artifact = VideoArtifact.from_faces([rng.normal(size=(2, 128)), rng.normal(size=(1, 128))], [0, 5, 5],
+                                        [(1, 2, 3, 4), (5, 6, 7, 8), (9, 10, 11, 12)], [0.9, 0.95, 0.99],
+                                        {'frames_processed': 2})
+    path = str(tmp_path / 'nested' / 'video.npz')
+    artifact.save(path)
+
+    loaded = VideoArtifact.load(path)
+    assert len(loaded) == 3 and loaded.embeddings.dtype == np.float32
+    for name in ('embeddings', 'frame_indices', 'boxes', 'confidences'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(artifact, name))
+    assert loaded.meta == {'frames_processed': 2}
+    assert VideoArtifact.from_faces([], [], [], []).embeddings.shape == (0, 128)
+
+
+@pytest.fixture
+def enrolled(flask_app, tmp_path, rng, monkeypatch):
+    """Two enrolled students in class 1, a fresh gallery cache and an artifact directory."""
+    monkeypatch.setattr(gallery, '_gallery', gallery.EmbeddingGallery())
+    flask_app.config['VIDEO_ARTIFACTS_DIR'] = str(tmp_path)
+    embeddings = rng.normal(size=(2, 128)).astype(np.float32)
+    with flask_app.app_context():
+        db.session.add(Class(class_id=1, class_name='A'))
+        for student_id, embedding in zip((1, 2), embeddings):
+            db.session.add(Student(student_id=student_id, name=f's{student_id}', password='p', class_id=1))
+            db.session.add(StudentEmbedding(student_id=student_id, embedding=embedding.tobytes()))
+            db.session.add(EmbeddingChange(student_id=student_id))
+            db.session.add(StudentEmbeddingVersion(student_id=student_id, version=EMBEDDING_VERSION))
+        db.session.commit()
+    return flask_app, embeddings
+
+
+def test_rematch_applies_each_threshold(enrolled, rng):
+    flask_app, embeddings = enrolled
+    close, far = at_similarity(embeddings[0], 0.7, rng), at_similarity(embeddings[1], 0.55, rng)
+    artifact = VideoArtifact.from_faces([np.vstack([close, close, far])], [0, 5, 10], [(0, 0, 40, 40)] * 3,
+                                        [0.99] * 3, {'frames_processed': 3})
+
+    with flask_app.app_context():
+        strict = rematch_artifact(artifact, class_id=1, similarity_threshold=0.9)
+        loose = rematch_artifact(artifact, class_id=1, similarity_threshold=0.6)
+        lax = rematch_artifact(artifact, class_id=1, similarity_threshold=0.5)
+
+    assert strict.recognized == set() and strict.frames_processed == 3
+    assert loose.recognized == {1} and loose.cluster_sizes == {1: 2}
+    assert lax.recognized == {1, 2}
+
+
+def test_load_artifact_by_hash_touches_it(enrolled):
+    flask_app, _ = enrolled
+    with flask_app.app_context():
+        assert load_artifact('missing') is None
+        path = artifact_path('abc')
+        VideoArtifact.from_faces([], [], [], []).save(path)
+        os.utime(path, (0, 0))
+
+        assert len(load_artifact('abc')) == 0
+        assert os.path.getmtime(path) > 0
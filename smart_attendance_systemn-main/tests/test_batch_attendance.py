@@ -0,0 +1,83 @@
+from datetime import date
+
+import pytest
+
+import batch_attendance
+from app import db
+from app.ml.recognise import RecognitionResult
+from app.models import AttendanceLog, AttendanceSummary, BatchAttendanceItem, Class, Student, Subject, Teacher
+from batch_attendance import BatchItem, Outcome
+
+
+def test_scan_directory_parses_names_and_skips_others(tmp_path):
+    for name in ('3_12_2026-10-12_1-2.mp4', 'notes.txt', 'lecture.mp4'):
+        (tmp_path / name).write_bytes(b'')
+
+    items = batch_attendance.scan_directory(str(tmp_path))
+
+    assert [(item.class_id, item.subject_id, item.date, item.periods) for item in items] == \
+        [(3, 12, date(2026, 10, 12), '1,2')]
+
+
+def test_read_manifest_resolves_paths_against_its_folder(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('video,class_id,subject_id,date,periods,teacher_id\n'
+                        'a.mp4,3,12,2026-10-12," 1, 2",7\n'
+                        'b.mp4,3,12,not-a-date,1,\n')
+
+    items = batch_attendance.read_manifest(str(manifest))
+
+    assert len(items) == 1
+    assert items[0].video_path == str(tmp_path / 'a.mp4')
+    assert (items[0].periods, items[0].period_count, items[0].teacher_id) == ('1,2', 2, 7)
+
+
+def test_key_follows_content_not_location():
+    first = BatchItem('/a/x.mp4', 3, 12, date(2026, 10, 12), '1', content_hash='abc')
+    moved = BatchItem('/b/y.mp4', 3, 12, date(2026, 10, 12), '1', content_hash='abc')
+    other_day = BatchItem('/a/x.mp4', 3, 12, date(2026, 10, 13), '1', content_hash='abc')
+    assert first.key == moved.key != other_day.key
+
+
+@pytest.fixture
+def school(flask_app):
+    with flask_app.app_context():
+        db.session.add(Class(class_id=1, class_name='A'))
+        db.session.add(Subject(subject_id=5, class_id=1, subject_name='Maths'))
+        db.session.add(Teacher(teacher_id=7, name='t', password='p', class_in_charge=1))
+        for student_id in (1, 2, 3):
+            db.session.add(Student(student_id=student_id, name=f's{student_id}', password='p', class_id=1))
+            db.session.add(AttendanceSummary(class_id=1, subject_id=5, student_id=student_id,
+                                             classes_present=0, total_classes=0))
+        db.session.commit()
+    return flask_app
+
+
+def outcome(content_hash, recognized, day=12):
+    item = BatchItem(f'/videos/{content_hash}.mp4', 1, 5, date(2026, 10, day), '1,2', teacher_id=7,
+                     content_hash=content_hash)
+    return Outcome(item, RecognitionResult(recognized=set(recognized)))
+
+
+def test_write_outcomes_records_each_video_once(school):
+    with school.app_context():
+        rows = batch_attendance.write_outcomes(
+            [outcome('a', {1, 2, 99}), outcome('a', {1, 2, 99}), outcome('b', {3}, day=13)], {})
+        assert rows == 3
+        assert batch_attendance.write_outcomes([outcome('a', {1})], {}) == 0
+
+        summaries = {s.student_id: (s.classes_present, s.total_classes) for s in AttendanceSummary.query}
+        assert summaries == {1: (2, 4), 2: (2, 4), 3: (2, 4)}
+        assert AttendanceLog.query.count() == 3
+        assert {item.status for item in BatchAttendanceItem.query} == {'done'}
+
+
+def test_missing_summary_fails_the_video(school):
+    with school.app_context():
+        db.session.add(Student(student_id=4, name='new', password='p', class_id=1))
+        db.session.commit()
+        failed = outcome('a', {1})
+
+        assert batch_attendance.write_outcomes([failed], {}) == 0
+        assert failed.result is None and 'missing' in failed.error
+        assert BatchAttendanceItem.query.one().status == 'failed'
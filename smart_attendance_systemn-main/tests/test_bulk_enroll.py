@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import bulk_enroll
+from bulk_enroll import Enrollment
+
+
+def test_scan_folder_finds_videos_and_photo_folders(tmp_path):
+    (tmp_path / '1042.mp4').write_bytes(b'')
+    (tmp_path / '1043').mkdir()
+    (tmp_path / 'alice.mp4').write_bytes(b'')
+    (tmp_path / 'notes.txt').write_bytes(b'')
+
+    enrollments = bulk_enroll.scan_folder(str(tmp_path))
+
+    assert [(e.student_id, e.source) for e in enrollments] == \
+        [(1042, str(tmp_path / '1042.mp4')), (1043, str(tmp_path / '1043'))]
+
+
+def test_serial_run_embeds_only_the_listed_positions(monkeypatch):
+    enrollments = [Enrollment(1, 'a.mp4'), Enrollment(2, 'b.mp4'), Enrollment(3, 'c.mp4')]
+    monkeypatch.setattr(bulk_enroll, 'embed_student', lambda enrollment, app: enrollment)
+
+    assert [position for position, _ in bulk_enroll._embed_all(None, enrollments, [0, 2], workers=1)] == [0, 2]
+
+
+def test_write_enrollments_marks_saved_and_rejected(flask_app, rng):
+    pytest.importorskip('deepface')  # app.ml.register imports DeepFace at module level
+    from app import db
+    from app.models import Class, Student, StudentEmbedding
+
+    with flask_app.app_context():
+        db.session.add(Class(class_id=1, class_name='A'))
+        db.session.add(Student(student_id=1, name='s', password='p', class_id=1))
+        db.session.commit()
+        saved = Enrollment(1, '1.mp4', embedding=rng.normal(size=128))
+        unknown = Enrollment(2, '2.mp4', embedding=rng.normal(size=128))
+        bad_shape = Enrollment(1, '1', embedding=np.zeros(64))
+        skipped = Enrollment(3, '3.mp4', status='skipped')
+
+        bulk_enroll.write_enrollments([saved, unknown, skipped])
+        bulk_enroll.write_enrollments([bad_shape])
+
+        assert [e.status for e in (saved, unknown, bad_shape, skipped)] == ['enrolled', 'failed', 'failed', 'skipped']
+        assert unknown.message == "no such student"
+        assert saved.embedding is None
+        assert [row.student_id for row in StudentEmbedding.query] == [1]
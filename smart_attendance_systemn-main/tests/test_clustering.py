@@ -0,0 +1,35 @@
+import numpy as np
+
+from app.ml.clustering import LeaderClusters
+
+
+def test_one_cluster_per_person(rng, clustered_embeddings):
+    _, embeddings, labels = clustered_embeddings(n_people=40, per_person=25, noise=0.3)
+    order = rng.permutation(len(embeddings))
+    clusters = LeaderClusters(0.75)
+
+    assignments = clusters.add(embeddings[order])
+
+    assert len(clusters) == 40
+    assert sorted(clusters.sizes.tolist()) == [25] * 40
+    for person in range(40):
+        assert len(set(assignments[labels[order] == person].tolist())) == 1
+
+
+def test_pop_changed_reports_touched_clusters(rng):
+    clusters = LeaderClusters(0.9)
+    vectors = np.eye(128)[:3]
+    clusters.add(vectors)
+    assert clusters.pop_changed().tolist() == [0, 1, 2]
+    assert clusters.pop_changed().tolist() == []
+
+    clusters.add(vectors[1:2])
+    assert clusters.pop_changed().tolist() == [1]
+    assert clusters.sizes.tolist() == [1, 2, 1]
+
+
+def test_grows_past_initial_capacity(rng):
+    clusters = LeaderClusters(0.99)
+    clusters.add(np.eye(128)[:40])
+    assert len(clusters) == 40
+    np.testing.assert_allclose(clusters.centroids, np.eye(128)[:40])
@@ -0,0 +1,18 @@
+import importlib.util
+
+import cv2
+
+from app.ml.detectors import available_backends
+
+
+def test_yunet_is_offered_only_with_its_configured_model():
+    assert 'yunet' not in available_backends({'DETECTOR_BACKEND': 'mtcnn', 'DETECTOR_MODEL_PATH': 'yunet.onnx'})
+    assert 'yunet' not in available_backends({'DETECTOR_BACKEND': 'yunet', 'DETECTOR_MODEL_PATH': None})
+    assert ('yunet' in available_backends({'DETECTOR_BACKEND': 'yunet', 'DETECTOR_MODEL_PATH': 'yunet.onnx'})) == \
+        hasattr(cv2, 'FaceDetectorYN')
+
+
+def test_installed_backends_follow_the_environment():
+    backends = available_backends({'DETECTOR_BACKEND': 'mtcnn', 'DETECTOR_MODEL_PATH': None})
+    assert ('mtcnn' in backends) == (importlib.util.find_spec('mtcnn') is not None)
+    assert ('haar' in backends) == hasattr(cv2, 'CascadeClassifier')
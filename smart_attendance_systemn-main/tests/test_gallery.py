@@ -0,0 +1,25 @@
+import numpy as np
+
+from app import db
+from app.ml.gallery import load_gallery_rows
+from app.models import Class, Student, StudentEmbedding
+
+
+def test_load_gallery_rows_skips_malformed_rows_and_filters_by_student(flask_app, rng):
+    embeddings = rng.normal(size=(3, 128)).astype(np.float32)
+    with flask_app.app_context():
+        db.session.add_all([Class(class_id=1, class_name='A'), Class(class_id=2, class_name='B')])
+        for student_id, class_id in ((1, 1), (2, 2), (3, 2), (4, 1)):
+            db.session.add(Student(student_id=student_id, name=f's{student_id}', password='p', class_id=class_id))
+        for student_id, embedding in zip((1, 2, 3), embeddings):
+            db.session.add(StudentEmbedding(student_id=student_id, embedding=embedding.tobytes()))
+        db.session.add(StudentEmbedding(student_id=4, embedding=np.zeros(64, dtype=np.float32).tobytes()))
+        db.session.commit()
+
+        student_ids, class_ids, rows = load_gallery_rows()
+        order = np.argsort(student_ids)
+        assert np.asarray(student_ids)[order].tolist() == [1, 2, 3]
+        assert np.asarray(class_ids)[order].tolist() == [1, 2, 2]
+        np.testing.assert_array_equal(np.vstack(rows)[order], embeddings)
+
+        assert load_gallery_rows([2, 4])[0] == [2]
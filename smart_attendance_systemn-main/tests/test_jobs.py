@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.ml import jobs
+from app.ml.recognise import RecognitionResult
+from app.models import RecognitionJob, Teacher
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class DroppingExecutor:
+    """Stands in for a process that stops before its pool runs the job."""
+    def submit(self, fn, *args):
+        pass
+
+
+@pytest.fixture
+def job_app(flask_app, monkeypatch):
+    flask_app.config.update(RECOGNITION_JOB_TIMEOUT_MINUTES=60, RECOGNITION_WORKERS=1,
+                            SAVE_VIDEO_ARTIFACTS=False)
+    monkeypatch.setattr(jobs, '_get_executor', lambda max_workers: InlineExecutor())
+    with flask_app.app_context():
+        db.session.add(Teacher(teacher_id=1, name='t', password='p'))
+        db.session.commit()
+    return flask_app
+
+
+def add_job(job_id, status, age_minutes, video_path):
+    started = datetime.utcnow() - timedelta(minutes=age_minutes)
+    db.session.add(RecognitionJob(job_id=job_id, teacher_id=1, video_path=str(video_path), status=status,
+                                  created_at=started, started_at=started if status == 'running' else None))
+    db.session.commit()
+
+
+def test_fail_stale_jobs_fails_only_jobs_past_the_timeout(job_app, tmp_path):
+    videos = {name: tmp_path / f'{name}.mp4' for name in ('old_queued', 'old_running', 'new_queued')}
+    for path in videos.values():
+        path.write_bytes(b'video')
+    with job_app.app_context():
+        add_job('old_queued', 'queued', 120, videos['old_queued'])
+        add_job('old_running', 'running', 120, videos['old_running'])
+        add_job('new_queued', 'queued', 1, videos['new_queued'])
+
+    assert jobs.fail_stale_jobs(job_app, 'new_queued') == 0
+    assert jobs.fail_stale_jobs(job_app) == 2
+
+    with job_app.app_context():
+        statuses = {job.job_id: job.status for job in RecognitionJob.query.all()}
+    assert statuses == {'old_queued': 'failed', 'old_running': 'failed', 'new_queued': 'queued'}
+    assert [path.exists() for path in videos.values()] == [False, False, True]
+
+
+def test_resumed_job_keeps_its_detector_backend(job_app, monkeypatch, tmp_path):
+    backends = []
+
+    def fake_run_recognition(video_path, **options):
+        backends.append(options['detector_backend'])
+        return RecognitionResult(recognized={7}, faces_embedded=1)
+
+    monkeypatch.setattr('app.ml.recognise.recognition_options',
+                        lambda config: {'cache': None, 'detector_backend': config['DETECTOR_BACKEND']})
+    monkeypatch.setattr('app.ml.recognise.run_recognition', fake_run_recognition)
+    job_app.config['DETECTOR_BACKEND'] = 'mtcnn'
+
+    monkeypatch.setattr(jobs, '_get_executor', lambda max_workers: DroppingExecutor())
+    with job_app.app_context():
+        job_id = jobs.submit_recognition_job(job_app, 1, str(tmp_path / 'v.mp4'), detector_backend='yunet')
+
+    monkeypatch.setattr(jobs, '_get_executor', lambda max_workers: InlineExecutor())
+    assert jobs.resume_queued_jobs(job_app) == 1
+    assert backends == ['yunet']
+    with job_app.app_context():
+        job = RecognitionJob.query.get(job_id)
+        assert job.status == 'done'
+        assert jobs.job_recognized_ids(job) == {7}
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import cosine
+
+from app.ml.matcher import GalleryMatcher, CompactGalleryMatcher, encode_rows
+
+
+def scipy_best_matches(queries, gallery: dict):
+    """
+    The per-pair scipy loop match_faces_to_students used before GalleryMatcher.
+    """
+    best = []
+    for embedding in queries:
+        best_match_id, best_similarity = None, -1
+        for student_id, student_embedding in gallery.items():
+            similarity = 1 - cosine(student_embedding, embedding)
+            if similarity > best_similarity:
+                best_similarity, best_match_id = similarity, student_id
+        best.append((best_match_id, best_similarity))
+    return best
+
+
+def test_gallery_matcher_agrees_with_scipy_loop(rng):
+    gallery = {student_id: rng.normal(size=128) for student_id in range(100, 160)}
+    queries = rng.normal(size=(40, 128))
+    queries[:20] = np.vstack([gallery[100 + i] for i in range(20)]) + 0.3 * rng.normal(size=(20, 128))
+
+    result = GalleryMatcher.from_dict(gallery, chunk_size=7).match(queries)
+
+    expected = scipy_best_matches(queries, gallery)
+    assert result.best_ids.tolist() == [student_id for student_id, _ in expected]
+    np.testing.assert_allclose(result.best_scores, [score for _, score in expected], atol=1e-5)
+
+
+def test_top_k_is_sorted_by_descending_similarity(rng):
+    embeddings = rng.normal(size=(50, 128))
+    matcher = GalleryMatcher(np.arange(50), embeddings)
+    queries = rng.normal(size=(5, 128))
+
+    ids, scores = matcher.search(queries, top_k=5)
+
+    normalised = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    exact = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalised.T
+    assert ids.tolist() == np.argsort(-exact, axis=1)[:, :5].tolist()
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+
+def test_recognized_applies_threshold(rng):
+    embeddings = rng.normal(size=(3, 128))
+    matcher = GalleryMatcher([7, 8, 9], embeddings)
+    queries = np.vstack([embeddings[0], rng.normal(size=128)])
+
+    assert matcher.match(queries).recognized(0.99) == {7}
+
+
+def test_empty_gallery_matches_nobody(rng):
+    matcher = GalleryMatcher.from_dict({})
+    result = matcher.match(rng.normal(size=(3, 128)), top_k=2)
+    assert result.top_k_ids.tolist() == [[-1, -1]] * 3
+    assert result.recognized(0.0) == set()
+
+
+def test_from_dict_skips_malformed_embeddings(rng):
+    matcher = GalleryMatcher.from_dict({1: rng.normal(size=128), 2: rng.normal(size=64)})
+    assert matcher.student_ids.tolist() == [1]
+
+
+@pytest.mark.parametrize('precision, tolerance', [('float16', 1e-3), ('int8', 2e-2)])
+def test_compact_matcher_scores_stay_close_to_float32(rng, precision, tolerance):
+    embeddings = rng.normal(size=(300, 128))
+    queries = embeddings[:50] + 0.5 * rng.normal(size=(50, 128))
+    exact = GalleryMatcher(np.arange(300), embeddings)
+    compact = CompactGalleryMatcher.from_embeddings(np.arange(300), embeddings, precision, chunk_size=16)
+    compact.block_size = 64
+
+    exact_ids, exact_scores = exact.search(queries, top_k=3)
+    compact_ids, compact_scores = compact.search(queries, top_k=3)
+
+    np.testing.assert_allclose(compact_scores, exact_scores, atol=tolerance)
+    assert (compact_ids[:, 0] == exact_ids[:, 0]).all()
+    assert compact.nbytes < exact.nbytes
+
+
+def test_encode_rows_rejects_unknown_precision(rng):
+    with pytest.raises(ValueError):
+        encode_rows(rng.normal(size=(2, 128)), 'bfloat16')
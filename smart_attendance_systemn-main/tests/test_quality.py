@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+from app.ml.pipeline import FaceCrop
+from app.ml.quality import QualityThresholds, filter_crops, rejection_reason, sharpness, yaw_ratio
+
+FRONTAL = {'left_eye': (10, 10), 'right_eye': (30, 10), 'nose': (20, 20)}
+
+
+def textured(size, rng):
+    return rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+
+
+def crop(image, confidence=0.99, keypoints=FRONTAL):
+    return FaceCrop(frame_index=0, box=(0, 0, image.shape[1], image.shape[0]), confidence=confidence,
+                    image=image, keypoints=keypoints)
+
+
+def test_small_sharp_faces_pass_and_blurred_ones_do_not(rng):
+    thresholds = QualityThresholds()
+    small = textured(32, rng)
+    assert sharpness(small) > 10 * thresholds.min_sharpness
+    assert rejection_reason(crop(small), thresholds) is None
+    assert rejection_reason(crop(cv2.GaussianBlur(small, (0, 0), 4)), thresholds) == 'blur'
+
+
+def test_large_crops_are_measured_at_the_embedder_resolution(rng):
+    large = cv2.resize(textured(160, rng), (640, 640), interpolation=cv2.INTER_NEAREST)
+    assert sharpness(large) == sharpness(cv2.resize(large, (160, 160), interpolation=cv2.INTER_AREA))
+
+
+def test_yaw_ratio():
+    assert yaw_ratio(FRONTAL) == 0.0
+    assert yaw_ratio({**FRONTAL, 'nose': (30, 20)}) == 0.5
+    assert yaw_ratio({}) is None
+
+
+def test_filter_crops_counts_rejections_by_reason(rng):
+    image = textured(40, rng)
+    crops = [crop(image), crop(image, confidence=0.5), crop(image[:10, :10]),
+             crop(image, keypoints={**FRONTAL, 'nose': (35, 20)})]
+    dropped = {}
+
+    kept = filter_crops(crops, QualityThresholds(), dropped)
+
+    assert kept == crops[:1]
+    assert dropped == {'confidence': 1, 'size': 1, 'pose': 1}
+    assert filter_crops(crops, None, dropped) is crops
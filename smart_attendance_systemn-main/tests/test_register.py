@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('deepface')  # app.ml.register imports DeepFace at module level
+
+from app.ml.register import RunningMeanEmbedding  # noqa: E402
+
+
+def test_running_mean_matches_batch_mean(rng):
+    embeddings = rng.normal(size=(103, 128))
+    running = RunningMeanEmbedding()
+    for start in range(0, len(embeddings), 10):
+        running.update(embeddings[start:start + 10])
+
+    assert running.count == 103
+    np.testing.assert_allclose(running.mean, embeddings.mean(axis=0), atol=1e-9)
+
+
+def test_update_reports_how_far_the_mean_moved(rng):
+    running = RunningMeanEmbedding()
+    batch = rng.normal(size=(20, 128))
+    assert running.update(batch) == 1.0
+    assert running.update(batch) == pytest.approx(0.0, abs=1e-9)
+    assert running.update(np.empty((0, 128))) == 0.0
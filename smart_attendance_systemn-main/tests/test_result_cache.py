@@ -0,0 +1,61 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from app.ml.recognise import run_recognition
+from app.ml.result_cache import RecognitionCache, cache_key
+
+
+def test_cache_key_ignores_argument_order():
+    assert cache_key('abc', b=1, a=None) == cache_key('abc', a=None, b=1) != cache_key('abc', a=None, b=2)
+
+
+def test_round_trip_and_lru_eviction(tmp_path):
+    arrays = {'embeddings': np.ones((100, 128), dtype=np.float32)}
+    cache = RecognitionCache(str(tmp_path), max_bytes=10**9)
+    for key in ('old', 'used', 'new'):
+        cache.put(key, arrays, {'recognized': [1]})
+    os.utime(tmp_path / 'old.npz', (time.time() - 30,) * 2)
+    os.utime(tmp_path / 'used.npz', (time.time() - 20,) * 2)
+    os.utime(tmp_path / 'new.npz', (time.time() - 10,) * 2)
+
+    stored, summary = cache.get('used')  # touching it makes it the most recently used
+    np.testing.assert_array_equal(stored['embeddings'], arrays['embeddings'])
+    assert summary == {'recognized': [1]}
+
+    cache.max_bytes = 2 * os.path.getsize(tmp_path / 'used.npz')
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ['new.npz', 'used.npz']
+    assert cache.get('old') is None
+
+
+class _KeySeen(Exception):
+    pass
+
+
+class KeyRecorder:
+    def __init__(self):
+        self.keys = []
+
+    def get(self, key):
+        self.keys.append(key)
+        raise _KeySeen
+
+
+@pytest.mark.parametrize('option', [
+    {'detector_model_path': '/models/other.onnx'},
+    {'workers': 4},
+    {'segment_frames': 900},
+    {'detect_threads': 2},
+    {'embed_threads': 2},
+    {'batch_size': 8},
+])
+def test_every_result_affecting_option_changes_the_key(flask_app, option):
+    cache = KeyRecorder()
+    with flask_app.app_context():
+        for options in ({}, option):
+            with pytest.raises(_KeySeen):
+                run_recognition('video.mp4', content_hash='abc', cache=cache, **options)
+    assert cache.keys[0] != cache.keys[1]
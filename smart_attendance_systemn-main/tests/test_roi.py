@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app import db
+from app.ml.pipeline import detect_frame_crops
+from app.ml.roi import RegionOfInterest, load_class_roi
+from app.models import Class, ClassROI
+
+LEFT_HALF = RegionOfInterest.from_points([[0, 0], [0.5, 0], [0.5, 1], [0, 1]])
+
+
+@pytest.mark.parametrize('points', [[[0, 0], [1, 1]], [[0, 0], [1, 0], [1, 1.5]], [[0, 0], 'x', [1, 1]]])
+def test_invalid_polygons_are_rejected(points):
+    with pytest.raises(ValueError):
+        RegionOfInterest.from_points(points)
+
+
+def test_bounds_and_containment_scale_with_the_frame():
+    assert LEFT_HALF.bounds(640, 480) == (0, 0, 320, 480)
+    assert LEFT_HALF.bounds(640, 480, margin=40) == (0, 0, 360, 480)
+    assert LEFT_HALF.contains(100, 100, 640, 480)
+    assert not LEFT_HALF.contains(400, 100, 640, 480)
+    assert LEFT_HALF.contains(400, 100, 1280, 960)
+
+
+class CornerDetector:
+    """Finds a face 10 pixels in from each side of whatever it is given, recording the region sizes."""
+    def __init__(self):
+        self.shapes = []
+
+    def detect_faces(self, region):
+        self.shapes.append(region.shape[:2])
+        height, width = region.shape[:2]
+        return [{'box': [10, 10, 40, 40], 'confidence': 0.99},
+                {'box': [width - 50, 10, 40, 40], 'confidence': 0.99}]
+
+
+def test_detection_runs_on_the_padded_roi_and_drops_faces_outside_it():
+    detector = CornerDetector()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    crops = detect_frame_crops(detector, 0, frame, roi=LEFT_HALF)
+
+    assert detector.shapes[0][1] < 640
+    assert [crop.box for crop in crops] == [(10, 10, 40, 40)]
+
+
+def test_load_class_roi(flask_app):
+    with flask_app.app_context():
+        db.session.add(Class(class_id=1, class_name='A'))
+        db.session.add(ClassROI(class_id=1, polygon=LEFT_HALF.to_json()))
+        db.session.commit()
+        assert load_class_roi(1) == LEFT_HALF
+        assert load_class_roi(2) is None
+        assert load_class_roi(None) is None
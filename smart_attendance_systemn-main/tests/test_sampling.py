@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.ml.sampling import MotionSampling, iter_sampled_frames
+
+
+def write_video(path, frame_count, moving=lambda index: False):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+    for index in range(frame_count):
+        frame = np.full((120, 160, 3), 60, dtype=np.uint8)
+        if moving(index):
+            x = (index * 7) % 120
+            frame[40:80, x:x + 40] = 255
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def static_video(tmp_path):
+    return write_video(tmp_path / 'static.avi', 100)
+
+
+def indices(*args, **kwargs):
+    return [frame_index for frame_index, _ in iter_sampled_frames(*args, **kwargs)]
+
+
+def test_interval_and_time_sampling(static_video):
+    assert indices(static_video, frame_interval=25) == [0, 25, 50, 75]
+    assert indices(static_video, frames_per_second=3) == list(range(0, 100, 10))
+
+
+@pytest.mark.parametrize('options', [{'frame_interval': 7}, {'frames_per_second': 4}])
+def test_segments_land_on_the_whole_video_grid(static_video, options):
+    whole = indices(static_video, **options)
+    segments = [indices(static_video, start_frame=start, end_frame=start + 33, **options) for start in (0, 33, 66)]
+    assert [index for segment in segments for index in segment] == whole
+
+
+def test_keyframes_are_spread_over_the_video(static_video):
+    assert indices(static_video, num_keyframes=5) == [0, 24, 49, 74, 99]
+    assert indices(static_video, num_keyframes=5, frames_per_second=3) == [0, 24, 49, 74, 99]
+
+
+def test_motion_sampling_backs_off_while_static_and_tightens_on_movement(tmp_path, static_video):
+    motion = MotionSampling(min_interval=2, max_interval=30)
+    assert indices(static_video, motion=motion) == [0, 2, 6, 14, 30, 60, 90]
+
+    moving = write_video(tmp_path / 'moving.avi', 100, moving=lambda index: index >= 50)
+    sampled = indices(moving, motion=motion)
+    assert sampled[:6] == [0, 2, 6, 14, 30, 60]
+    assert all(b - a == 2 for a, b in zip(sampled[6:], sampled[7:]))
+
+
+def test_unreadable_video_yields_nothing(tmp_path):
+    path = tmp_path / 'broken.mp4'
+    path.write_bytes(b'not a video')
+    assert indices(str(path)) == []
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.ml import staged
+from app.ml.pipeline import ExtractionStats
+
+
+class OneFaceDetector:
+    def detect_faces(self, frame):
+        return [{'box': [10, 10, 40, 40], 'confidence': 0.99}]
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+    for _ in range(50):
+        writer.write(np.full((120, 160, 3), 128, dtype=np.uint8))
+    writer.release()
+
+    monkeypatch.setattr(staged, 'get_detector', lambda *args: OneFaceDetector())
+    monkeypatch.setattr(staged, 'generate_face_embeddings',
+                        lambda images, batch_size: [np.ones(128, dtype=np.float32) for _ in images])
+    return path
+
+
+def test_stats_count_every_sampled_frame_after_a_full_run(video):
+    stats = ExtractionStats()
+    batches = list(staged.iter_staged_embeddings(video, stats, detect_threads=2, frame_interval=5, batch_size=3))
+
+    assert sum(len(crops) for crops, _ in batches) == 10
+    assert (stats.frames_processed, stats.last_frame_index) == (10, 45)
+
+
+def test_stats_stop_at_the_frames_consumed_before_an_early_stop(video):
+    stats = ExtractionStats()
+    batches = staged.iter_staged_embeddings(video, stats, detect_threads=2, queue_size=1, frame_interval=5,
+                                            batch_size=3)
+    crops, _ = next(batches)
+    batches.close()
+
+    # The batch was cut while handing on the third sampled frame, so only two count.
+    assert [crop.frame_index for crop in crops] == [0, 5, 10]
+    assert (stats.frames_processed, stats.last_frame_index) == (2, 5)
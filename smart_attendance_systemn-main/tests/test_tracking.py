@@ -0,0 +1,60 @@
+import numpy as np
+
+from app.ml.pipeline import FaceCrop
+from app.ml.tracking import IoUTracker, box_iou
+
+
+def crop(frame_index, box, confidence=0.99):
+    return FaceCrop(frame_index=frame_index, box=box, confidence=confidence,
+                    image=np.zeros((box[3], box[2], 3), dtype=np.uint8))
+
+
+def test_box_iou():
+    ious = box_iou([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    np.testing.assert_allclose(ious, [[1.0, 50 / 150, 0.0]])
+
+
+def test_moving_face_becomes_one_track_releasing_its_best_crops():
+    tracker = IoUTracker(crops_per_track=2, emit_after_hits=None)
+    confidences = [0.80, 0.95, 0.90, 0.85]
+    for frame_index, confidence in enumerate(confidences):
+        assert tracker.update([crop(frame_index, (100 + 2 * frame_index, 100, 40, 40), confidence)]) == []
+
+    released = tracker.flush()
+    assert tracker.tracks_started == 1
+    assert [c.confidence for c in released] == [0.95, 0.90]
+    assert {c.track_id for c in released} == {1}
+
+
+def test_track_is_released_after_max_missed_frames():
+    tracker = IoUTracker(max_missed=2, crops_per_track=1, emit_after_hits=None)
+    tracker.update([crop(0, (0, 0, 40, 40))])
+    assert tracker.update([]) == []
+    assert tracker.update([]) == []
+    assert len(tracker.update([])) == 1
+    assert tracker.flush() == []
+
+
+def test_long_track_is_released_every_emit_after_hits():
+    tracker = IoUTracker(crops_per_track=1, emit_after_hits=3)
+    released = [tracker.update([crop(i, (0, 0, 40, 40))]) for i in range(7)]
+    assert [len(batch) for batch in released] == [0, 0, 1, 0, 0, 1, 0]
+    assert [c.frame_index for c in tracker.flush()] == [6]
+
+
+def test_different_looking_face_in_same_box_starts_new_track(rng):
+    tracker = IoUTracker(crops_per_track=1, emit_after_hits=None)
+    first, second = crop(0, (0, 0, 40, 40)), crop(1, (0, 0, 40, 40))
+    first.image = rng.integers(0, 256, size=(40, 40, 3), dtype=np.uint8)
+    second.image = 255 - first.image
+    tracker.update([first])
+    tracker.update([second])
+    assert tracker.tracks_started == 2
+
+
+def test_separate_faces_get_separate_tracks():
+    tracker = IoUTracker(crops_per_track=1, emit_after_hits=None)
+    for frame_index in range(3):
+        tracker.update([crop(frame_index, (0, 0, 40, 40)), crop(frame_index, (200, 0, 40, 40))])
+    assert tracker.tracks_started == 2
+    assert len(tracker.flush()) == 2